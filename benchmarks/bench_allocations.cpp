@@ -0,0 +1,111 @@
+// Measures the memory used by the PatternAutomaton instances and counts the
+// heap allocations performed by pattern_distance.
+//
+// The pattern automata are built using a rough tokenizer (digits, letters,
+// spaces, other characters) so that this benchmark only depends on the C++
+// sources. Build and run it from the repository root:
+//
+//   g++ -O2 -std=c++11 -Iboost benchmarks/bench_allocations.cpp \
+//       boost/lcs_cache.cpp boost/lcs_distance.cpp \
+//       boost/pattern_automaton.cpp boost/pattern_distance.cpp \
+//       -o /tmp/bench_allocations
+//   /tmp/bench_allocations notebooks/experiments_icpr/logs/Linux/Linux_2k.log
+
+#include <chrono>
+#include <cctype>
+#include <cstdlib>
+#include <fstream>
+#include <iostream>
+#include <new>
+#include <string>
+#include <vector>
+
+#include "pattern_automaton.hpp"
+#include "pattern_distance.hpp"
+
+static std::size_t num_allocations = 0;
+static std::size_t num_bytes = 0;
+
+void * operator new(std::size_t size) {
+    num_allocations++;
+    num_bytes += size;
+    if (void * p = std::malloc(size ? size : 1)) return p;
+    throw std::bad_alloc();
+}
+
+void operator delete(void * p) noexcept {
+    std::free(p);
+}
+
+void operator delete(void * p, std::size_t) noexcept {
+    std::free(p);
+}
+
+// Like the default pattern collection, the PatternAutomata involve 8 labels.
+enum Label {DIGITS, LETTERS, SPACES, OTHER};
+#define ALPHABET_SIZE 8
+
+static Label make_label(char c) {
+    return std::isdigit(c) ? DIGITS : std::isalpha(c) ? LETTERS : std::isspace(c) ? SPACES : OTHER;
+}
+
+static PatternAutomaton make_pattern_automaton(const std::string & w) {
+    PatternAutomaton g(w.size() + 1, ALPHABET_SIZE, w);
+    std::size_t j = 0;
+    while (j < w.size()) {
+        Label a = make_label(w[j]);
+        std::size_t k = j + 1;
+        if (a != OTHER) {
+            while (k < w.size() && make_label(w[k]) == a) k++;
+        }
+        g.add_edge(j, k, a);
+        j = k;
+    }
+    return g;
+}
+
+int main(int argc, char ** argv) {
+    if (argc < 2) {
+        std::cerr << "usage: " << argv[0] << " LOG_FILE [NUM_LINES]" << std::endl;
+        return 1;
+    }
+    std::size_t num_lines = argc > 2 ? std::atoi(argv[2]) : 200;
+    std::ifstream ifs(argv[1]);
+    std::vector<std::string> lines;
+    std::string line;
+    while (lines.size() < num_lines && std::getline(ifs, line)) {
+        lines.push_back(line);
+    }
+    std::size_t num_chars = 0;
+    for (const std::string & line : lines) num_chars += line.size();
+    std::vector<PatternAutomaton> pas;
+    pas.reserve(lines.size());
+    num_bytes = 0;
+    for (const std::string & line : lines) {
+        pas.push_back(make_pattern_automaton(line));
+    }
+    std::size_t pas_bytes = num_bytes + pas.size() * sizeof(PatternAutomaton);
+    std::vector<Density> densities = {0.1, 0.5, 0.01, 1.0, 1.0, 1.0, 1.0, 1.0};
+
+    std::size_t num_calls = 0;
+    double total = 0;
+    num_allocations = 0;
+    auto start = std::chrono::steady_clock::now();
+    for (const auto & pa1 : pas) {
+        for (const auto & pa2 : pas) {
+            total += pattern_distance_normalized(pa1, pa2, densities, 1.0);
+            num_calls++;
+        }
+    }
+    auto stop = std::chrono::steady_clock::now();
+    double seconds = std::chrono::duration<double>(stop - start).count();
+    std::cout << "lines: " << pas.size() << std::endl
+        << "bytes per PatternAutomaton: " << double(pas_bytes) / pas.size()
+        << " (" << double(pas_bytes) / num_chars << " per character)" << std::endl
+        << "pattern_distance calls: " << num_calls << std::endl
+        << "allocations per call: " << double(num_allocations) / num_calls << std::endl
+        << "time per call (us): " << seconds / num_calls * 1e6 << std::endl
+        << "calls per second: " << num_calls / seconds << std::endl
+        << "checksum: " << total << std::endl;
+    return 0;
+}
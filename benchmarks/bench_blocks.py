@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of the pattern-clustering project.
+# https://github.com/nokia/pattern-clustering
+
+"""
+Benchmark comparing the sequential ``pattern_clustering`` to its block mode
+(see the ``block_size`` parameter) on the Loghub 2k logs.
+
+Usage: python3 benchmarks/bench_blocks.py [NUM_LINES [MAX_DIST [BLOCK_SIZE [NUM_THREADS]]]]
+"""
+
+import glob, os, sys, time
+from pattern_clustering import (
+    PatternClusteringEnv, PatternDistanceStats, RepresentativeOrder, make_pattern_automata
+)
+from pattern_clustering.pattern_clustering import pattern_clustering
+
+LOGS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..", "notebooks", "experiments_icpr", "logs"
+)
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    max_dist = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    block_size = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    num_threads = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    map_name_dfa = PatternClusteringEnv.map_name_dfa
+    densities = PatternClusteringEnv.densities()
+    order = RepresentativeOrder.MOVE_TO_FRONT
+    print(f"{'log':<12} {'clusters':>8} {'calls (seq)':>12} {'calls (block)':>14} {'time (seq)':>11} {'time (block)':>13}")
+    for filename in sorted(glob.glob(os.path.join(LOGS_DIR, "*", "*_2k.log"))):
+        with open(filename) as f:
+            lines = [line.strip() for line in f][:num_lines]
+        pas = make_pattern_automata(lines, map_name_dfa)
+        results = list()
+        for (use_async, block_size_) in [(False, 0), (True, block_size)]:
+            stats = PatternDistanceStats()
+            start = time.perf_counter()
+            clusters = pattern_clustering(
+                pas, densities, max_dist, use_async, None, True, stats, True,
+                num_threads, order, block_size_
+            )
+            results.append((clusters, stats, time.perf_counter() - start))
+        ((clusters0, stats0, time0), (clusters1, stats1, time1)) = results
+        assert clusters0 == clusters1, filename
+        print(
+            f"{os.path.basename(filename).split('_')[0]:<12} {len(set(clusters0)):>8} "
+            f"{stats0.calls():>12} {stats1.calls():>14} {time0:>10.2f}s {time1:>12.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of the pattern-clustering project.
+# https://github.com/nokia/pattern-clustering
+
+"""
+Benchmark counting the heap pops performed by ``pattern_clustering``
+with and without the A* heuristic on the Loghub 2k logs.
+
+Usage: python3 benchmarks/bench_heuristic.py [NUM_LINES [MAX_DIST]]
+"""
+
+import glob, os, sys, time
+from pattern_clustering import PatternClusteringEnv, PatternDistanceStats, make_pattern_automata
+from pattern_clustering.pattern_clustering import pattern_clustering
+
+LOGS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..", "notebooks", "experiments_icpr", "logs"
+)
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    max_dist = float(sys.argv[2]) if len(sys.argv) > 2 else 0.6
+    map_name_dfa = PatternClusteringEnv.map_name_dfa
+    densities = PatternClusteringEnv.densities()
+    print(f"{'log':<12} {'calls':>8} {'pops (dijkstra)':>16} {'pops (A*)':>10} {'saved':>6} {'time':>14}")
+    for filename in sorted(glob.glob(os.path.join(LOGS_DIR, "*", "*_2k.log"))):
+        with open(filename) as f:
+            lines = [line.strip() for line in f][:num_lines]
+        pas = make_pattern_automata(lines, map_name_dfa)
+        results = list()
+        for use_heuristic in (False, True):
+            stats = PatternDistanceStats()
+            start = time.perf_counter()
+            clusters = pattern_clustering(pas, densities, max_dist, False, None, use_heuristic, stats)
+            results.append((clusters, stats, time.perf_counter() - start))
+        ((clusters0, stats0, time0), (clusters1, stats1, time1)) = results
+        assert clusters0 == clusters1, filename
+        print(
+            f"{os.path.basename(filename).split('_')[0]:<12} "
+            f"{stats1.calls():>8} {stats0.heap_pops():>16} {stats1.heap_pops():>10} "
+            f"{1 - stats1.heap_pops() / max(stats0.heap_pops(), 1):>6.1%} "
+            f"{time0:>6.2f}s {time1:>6.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
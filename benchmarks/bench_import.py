@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of the pattern-clustering project.
+# https://github.com/nokia/pattern-clustering
+
+"""
+Benchmark measuring the time needed to import ``pattern_clustering``
+in a fresh interpreter, and then to build the default pattern collection
+on first use of ``PatternClusteringEnv``.
+
+Usage: python3 benchmarks/bench_import.py [NUM_RUNS]
+"""
+
+import subprocess, sys
+
+SCRIPT = "\n".join([
+    "import time",
+    "start = time.perf_counter()",
+    "import pattern_clustering",
+    "imported = time.perf_counter()",
+    "pattern_clustering.PatternClusteringEnv.map_name_dfa",
+    "print(imported - start, time.perf_counter() - imported)",
+])
+
+
+def main():
+    num_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'run':<4} {'import':>8} {'first use':>10}")
+    for run in range(num_runs):
+        output = subprocess.run(
+            [sys.executable, "-c", SCRIPT],
+            check=True, capture_output=True, text=True
+        ).stdout
+        (import_time, first_use_time) = (float(x) for x in output.split())
+        print(f"{run:<4} {import_time:>7.3f}s {first_use_time:>9.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of the pattern-clustering project.
+# https://github.com/nokia/pattern-clustering
+
+"""
+Micro-benchmark comparing the bit-parallel ``lcs_length`` with the
+dynamic programming implementation (``lcs_length_dp``).
+
+Usage: python3 benchmarks/bench_lcs.py
+"""
+
+import random, string, timeit
+from pattern_clustering.pattern_clustering import lcs_length, lcs_length_dp
+
+
+def make_pairs(length: int, num_pairs: int = 1000) -> list:
+    alphabet = string.ascii_lowercase + string.digits
+    return [
+        tuple(
+            "".join(random.choice(alphabet) for _ in range(length))
+            for _ in range(2)
+        )
+        for _ in range(num_pairs)
+    ]
+
+
+def main():
+    random.seed(0)
+    print(f"{'length':>8} {'dp (us)':>10} {'bit-parallel (us)':>18} {'speed-up':>9}")
+    for length in [4, 8, 16, 32, 64, 128, 256]:
+        pairs = make_pairs(length)
+        times = [
+            min(timeit.repeat(
+                lambda: [f(w1, w2) for (w1, w2) in pairs],
+                number=1, repeat=5
+            )) / len(pairs) * 1e6
+            for f in (lcs_length_dp, lcs_length)
+        ]
+        print(f"{length:>8} {times[0]:>10.2f} {times[1]:>18.2f} {times[0] / times[1]:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
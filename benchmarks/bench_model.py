@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of the pattern-clustering project.
+# https://github.com/nokia/pattern-clustering
+
+"""
+Benchmark measuring the time needed to load a model saved using
+``PatternClusterer.save``, compared to rebuilding its representatives
+from scratch. The representatives are the Loghub 2k lines, repeated
+until NUM_REPRESENTATIVES lines are gathered.
+
+Usage: python3 benchmarks/bench_model.py [NUM_REPRESENTATIVES]
+"""
+
+import glob, itertools, os, sys, tempfile, time
+from pattern_clustering import PatternClusterer, PatternClusteringEnv, make_pattern_automata
+
+LOGS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..", "notebooks", "experiments_icpr", "logs"
+)
+
+
+def main():
+    num_representatives = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    lines = list()
+    for filename in sorted(glob.glob(os.path.join(LOGS_DIR, "*", "*_2k.log"))):
+        with open(filename) as f:
+            lines += [line.strip() for line in f]
+    lines = list(itertools.islice(itertools.cycle(lines), num_representatives))
+
+    start = time.perf_counter()
+    make_pattern_automata(lines, PatternClusteringEnv.map_name_dfa)
+    print(f"build pattern automata: {time.perf_counter() - start:.2f}s")
+
+    clusterer = PatternClusterer(max_dist=0.2)
+    clusterer.add_representatives(lines)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "model.bin")
+        start = time.perf_counter()
+        clusterer.save(filename)
+        print(f"save: {time.perf_counter() - start:.2f}s ({os.path.getsize(filename) / 2**20:.1f} MiB)")
+        start = time.perf_counter()
+        loaded = PatternClusterer.load(filename)
+        print(f"load: {time.perf_counter() - start:.2f}s")
+    assert loaded.representatives == clusterer.representatives
+    print(f"representatives: {len(loaded.representatives)}")
+
+
+if __name__ == "__main__":
+    main()
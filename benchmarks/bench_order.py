@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of the pattern-clustering project.
+# https://github.com/nokia/pattern-clustering
+
+"""
+Benchmark comparing the ``RepresentativeOrder`` policies of
+``pattern_clustering`` on the Loghub 2k logs.
+
+Usage: python3 benchmarks/bench_order.py [NUM_LINES [MAX_DIST]]
+"""
+
+import glob, os, sys, time
+from pattern_clustering import (
+    PatternClusteringEnv, PatternDistanceStats, RepresentativeOrder, make_pattern_automata
+)
+from pattern_clustering.pattern_clustering import pattern_clustering
+
+LOGS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..", "notebooks", "experiments_icpr", "logs"
+)
+
+ORDERS = [
+    RepresentativeOrder.CREATION,
+    RepresentativeOrder.MOVE_TO_FRONT,
+    RepresentativeOrder.FREQUENCY,
+]
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    max_dist = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    map_name_dfa = PatternClusteringEnv.map_name_dfa
+    densities = PatternClusteringEnv.densities()
+    print(
+        f"{'log':<12} {'clusters':>8} "
+        + " ".join(f"{str(order):>30}" for order in ORDERS)
+        + "  (calls, heap pops, time, lines assigned differently)"
+    )
+    for filename in sorted(glob.glob(os.path.join(LOGS_DIR, "*", "*_2k.log"))):
+        with open(filename) as f:
+            lines = [line.strip() for line in f][:num_lines]
+        pas = make_pattern_automata(lines, map_name_dfa)
+        results = list()
+        for order in ORDERS:
+            stats = PatternDistanceStats()
+            start = time.perf_counter()
+            clusters = pattern_clustering(
+                pas, densities, max_dist, False, None, True, stats, True, 0, order
+            )
+            results.append((clusters, stats, time.perf_counter() - start))
+        clusters0 = results[0][0]
+        print(
+            f"{os.path.basename(filename).split('_')[0]:<12} {len(set(clusters0)):>8} "
+            + " ".join(
+                f"{stats.calls():>7} {stats.heap_pops():>9} {duration:>6.2f}s "
+                f"{sum(c != c0 for (c, c0) in zip(clusters, clusters0)):>4}"
+                for (clusters, stats, duration) in results
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,12 @@ See https://www.boost.org/doc/libs/1_68_0/libs/python/doc/html/tutorial/tutorial
 See in setup.py how to turn on bindings_auto.cpp generation.
 */
 
+#include <cstdint>    // std::int8_t, ..., std::uint64_t
+#include <cstring>    // std::memcpy, std::strchr
+#include <limits>     // std::numeric_limits
+#include <memory>     // std::unique_ptr
 #include <boost/python.hpp>
+#include <boost/python/stl_iterator.hpp>
 
 namespace boost {
     namespace python {
@@ -27,7 +32,9 @@ namespace boost {
 
 #include "bindings_stl.hpp"
 #include "density.hpp"
+#include "lcs_cache.hpp"
 #include "lcs_distance.hpp"
+#include "multi_grep.hpp"
 #include "pattern_automaton.hpp"
 #include "pattern_clustering.hpp"
 #include "pattern_distance.hpp"
@@ -37,6 +44,263 @@ namespace boost {
 static list_to_vector<std::vector<PatternAutomaton> > reg1;
 static list_to_vector<std::vector<Density> > reg2;
 static vector_to_list<Clusters> reg3;
+static list_to_vector<std::vector<std::size_t> > reg4;
+static list_to_vector<std::vector<int> > reg5;
+static list_to_vector<std::vector<std::vector<int> > > reg6;
+static list_to_vector<std::vector<bool> > reg7;
+static list_to_vector<std::vector<std::vector<bool> > > reg8;
+static list_to_vector<std::vector<std::string> > reg9;
+static vector_to_list<std::vector<PatternAutomaton> > reg10;
+static vector_to_list<std::vector<Density> > reg11;
+static vector_to_list<std::vector<std::string> > reg12;
+
+// Releases the GIL until the end of the current scope. The wrapped C++ code
+// must not manipulate any python object meanwhile.
+class ScopedGILRelease {
+    private:
+        PyThreadState * state;
+    public:
+        ScopedGILRelease(): state(PyEval_SaveThread()) {}
+        ~ScopedGILRelease() { PyEval_RestoreThread(this->state); }
+};
+
+static std::vector<PatternAutomaton> make_pattern_automata_nogil(
+    const MultiGrep & multi_grep,
+    const std::vector<std::string> & lines,
+    MultiGrepStrategy strategy
+) {
+    ScopedGILRelease release_gil;
+    return ::make_pattern_automata(multi_grep, lines, strategy);
+}
+
+// Returns a list of (representative index, distance) pairs, or None for
+// the unassigned lines.
+static boost::python::list assign_to_clusters_nogil(
+    const PatternAutomata & pas,
+    const PatternAutomata & representative_pas,
+    const Densities & densities,
+    double max_dist,
+    bool use_async,
+    LcsCache * lcs_cache,
+    bool use_heuristic,
+    PatternDistanceStats * stats,
+    bool use_prefilter,
+    std::size_t num_threads
+) {
+    Assignments assignments;
+    {
+        ScopedGILRelease release_gil;
+        assignments = ::assign_to_clusters(
+            pas, representative_pas, densities, max_dist, use_async,
+            lcs_cache, use_heuristic, stats, use_prefilter, num_threads
+        );
+    }
+    boost::python::list result;
+    for (const auto & assignment : assignments) {
+        if (assignment.first == UNASSIGNED) {
+            result.append(boost::python::object());
+        } else {
+            result.append(boost::python::make_tuple(assignment.first, assignment.second));
+        }
+    }
+    return result;
+}
+
+static Clusters pattern_clusterer_add_nogil(
+    PatternClusterer & clusterer,
+    const PatternAutomata & pas,
+    bool use_async,
+    LcsCache * lcs_cache,
+    bool use_heuristic,
+    PatternDistanceStats * stats,
+    bool use_prefilter,
+    std::size_t num_threads,
+    std::size_t block_size
+) {
+    ScopedGILRelease release_gil;
+    return clusterer.add(
+        pas, use_async, lcs_cache, use_heuristic, stats, use_prefilter,
+        num_threads, block_size
+    );
+}
+
+template <typename T, typename Integer>
+static void append_integers(const Py_buffer & view, std::vector<T> & v) {
+    v.reserve(view.shape[0]);
+    const char * p = static_cast<const char *>(view.buf);
+    for (Py_ssize_t i = 0; i < view.shape[0]; i++, p += sizeof(Integer)) {
+        Integer x;
+        std::memcpy(&x, p, sizeof(Integer));
+        if (
+            (x < 0 && static_cast<long long>(x) < static_cast<long long>(std::numeric_limits<T>::min()))
+            || (x > 0 && static_cast<unsigned long long>(x) > static_cast<unsigned long long>(std::numeric_limits<T>::max()))
+        ) {
+            PyErr_SetString(PyExc_OverflowError, "integer out of range");
+            boost::python::throw_error_already_set();
+        }
+        v.push_back(static_cast<T>(x));
+    }
+}
+
+// Copies a sequence of integers to a std::vector. The sequence is preferably
+// a one-dimensional object supporting the buffer protocol (e.g., array.array
+// or numpy.ndarray), which is read at once, or any python iterable.
+template <typename T>
+static std::vector<T> integers_to_vector(boost::python::object o) {
+    std::vector<T> v;
+    if (!PyObject_CheckBuffer(o.ptr())) {
+        boost::python::stl_input_iterator<T> begin(o), end;
+        v.assign(begin, end);
+        return v;
+    }
+    Py_buffer view;
+    if (PyObject_GetBuffer(o.ptr(), &view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) != 0) {
+        boost::python::throw_error_already_set();
+    }
+    std::unique_ptr<Py_buffer, void (*)(Py_buffer *)> release_view(&view, PyBuffer_Release);
+    const char * format = view.format ? view.format : "B";
+    if (*format == '@' || *format == '=' || (PY_LITTLE_ENDIAN && *format == '<')) {
+        format++;
+    }
+    char c = format[0];
+    bool is_signed = (c != '\0' && std::strchr("bhilqn", c));
+    bool is_unsigned = (c != '\0' && std::strchr("BHILQN", c));
+    if (view.ndim != 1 || !(is_signed || is_unsigned) || format[1] != '\0') {
+        PyErr_SetString(PyExc_TypeError, "expected a one-dimensional array of integers");
+        boost::python::throw_error_already_set();
+    }
+    switch (view.itemsize) {
+        case 1: if (is_signed) append_integers<T, std::int8_t>(view, v); else append_integers<T, std::uint8_t>(view, v); break;
+        case 2: if (is_signed) append_integers<T, std::int16_t>(view, v); else append_integers<T, std::uint16_t>(view, v); break;
+        case 4: if (is_signed) append_integers<T, std::int32_t>(view, v); else append_integers<T, std::uint32_t>(view, v); break;
+        case 8: if (is_signed) append_integers<T, std::int64_t>(view, v); else append_integers<T, std::uint64_t>(view, v); break;
+        default:
+            PyErr_SetString(PyExc_TypeError, "unsupported integer size");
+            boost::python::throw_error_already_set();
+    }
+    return v;
+}
+
+static void pattern_automaton_add_edges(
+    PatternAutomaton & g,
+    boost::python::object sources,
+    boost::python::object targets,
+    boost::python::object labels
+) {
+    g.add_edges(
+        integers_to_vector<PatternAutomaton::State>(sources),
+        integers_to_vector<PatternAutomaton::State>(targets),
+        integers_to_vector<PatternAutomaton::Label>(labels)
+    );
+}
+
+// Pickles a PatternAutomaton using its binary representation (bytes).
+struct PatternAutomatonPickleSuite : boost::python::pickle_suite {
+    static boost::python::tuple getinitargs(const PatternAutomaton &) {
+        return boost::python::tuple();
+    }
+
+    static boost::python::object getstate(const PatternAutomaton & g) {
+        std::string out;
+        g.save(out);
+        return boost::python::object(boost::python::handle<>(
+            PyBytes_FromStringAndSize(out.data(), out.size())
+        ));
+    }
+
+    static void setstate(PatternAutomaton & g, boost::python::object state) {
+        char * data;
+        Py_ssize_t size;
+        if (PyBytes_AsStringAndSize(state.ptr(), &data, &size) != 0) {
+            boost::python::throw_error_already_set();
+        }
+        const char * p = data;
+        g = PatternAutomaton::load(p, data + size);
+        if (p != data + size) {
+            throw std::runtime_error("PatternAutomaton.__setstate__: trailing data");
+        }
+    }
+};
+
+// The PatternClusterer methods below wait until the pending add (run by
+// another python thread) is over: the GIL is released meanwhile.
+static Clusters pattern_clusterer_add_representatives_nogil(
+    PatternClusterer & clusterer,
+    const PatternAutomata & pas
+) {
+    ScopedGILRelease release_gil;
+    return clusterer.add_representatives(pas);
+}
+
+static std::size_t pattern_clusterer_num_lines_nogil(const PatternClusterer & clusterer) {
+    ScopedGILRelease release_gil;
+    return clusterer.get_num_lines();
+}
+
+static PatternAutomata pattern_clusterer_representatives_nogil(const PatternClusterer & clusterer) {
+    ScopedGILRelease release_gil;
+    return clusterer.get_representatives();
+}
+
+static std::vector<std::size_t> pattern_clusterer_representative_ids_nogil(const PatternClusterer & clusterer) {
+    ScopedGILRelease release_gil;
+    return clusterer.get_representative_ids();
+}
+
+static std::vector<std::string> pattern_clusterer_representative_words(
+    const PatternClusterer & clusterer
+) {
+    std::vector<std::string> words;
+    {
+        ScopedGILRelease release_gil;
+        PatternAutomata representatives = clusterer.get_representatives();
+        words.reserve(representatives.size());
+        for (const PatternAutomaton & pa : representatives) {
+            words.push_back(pa.get_word());
+        }
+    }
+    return words;
+}
+
+// Returns the binary representation of a PatternClusterer (bytes).
+static boost::python::object pattern_clusterer_save(const PatternClusterer & clusterer) {
+    std::string out;
+    {
+        ScopedGILRelease release_gil;
+        clusterer.save(out);
+    }
+    return boost::python::object(boost::python::handle<>(
+        PyBytes_FromStringAndSize(out.data(), out.size())
+    ));
+}
+
+// Rebuilds a PatternClusterer from its binary representation, passed as any
+// object supporting the buffer protocol (e.g., bytes, memoryview, mmap).
+static PatternClusterer pattern_clusterer_load(boost::python::object data) {
+    Py_buffer view;
+    if (PyObject_GetBuffer(data.ptr(), &view, PyBUF_SIMPLE) != 0) {
+        boost::python::throw_error_already_set();
+    }
+    std::unique_ptr<Py_buffer, void (*)(Py_buffer *)> release_view(&view, PyBuffer_Release);
+    ScopedGILRelease release_gil;
+    const char * p = static_cast<const char *>(view.buf);
+    const char * end = p + view.len;
+    PatternClusterer clusterer = PatternClusterer::load(p, end);
+    if (p != end) {
+        throw std::runtime_error("PatternClusterer.load: trailing data");
+    }
+    return clusterer;
+}
+
+static std::size_t lcs_cache_lcs_length(
+    LcsCache & lcs_cache,
+    const std::string & s1,
+    const std::string & s2
+) {
+    return lcs_cache.lcs_length(s1, s2);
+}
+
+static std::size_t (* lcs_length_string)(const std::string &, const std::string &) = &::lcs_length;
 
 BOOST_PYTHON_MODULE(pattern_clustering) // Pass the python module name (as defined in setup.py)
 {
@@ -57,43 +321,195 @@ BOOST_PYTHON_MODULE(pattern_clustering) // Pass the python module name (as defin
     )
         .def("add_vertex",      &PatternAutomaton::add_vertex)
         .def("add_edge",        &PatternAutomaton::add_edge)
+        .def(
+            "add_edges",
+            &pattern_automaton_add_edges,
+            (
+                arg("sources"),
+                arg("targets"),
+                arg("labels")
+            )
+        )
         .def("delta",           &PatternAutomaton::delta)
         .def("num_vertices",    &PatternAutomaton::num_vertices)
         .def("num_edges",       &PatternAutomaton::num_edges)
         .def("__str__",         &PatternAutomaton::to_string)
         .def("alphabet_size",   &PatternAutomaton::get_alphabet_size)
-        .def("get_word",        &PatternAutomaton::get_word)
+        .def("get_word",        &PatternAutomaton::get_word, return_value_policy<copy_const_reference>())
+        .def_pickle(PatternAutomatonPickleSuite())
+    ;
+
+    // lcs_cache.hpp
+    class_<LcsCache, boost::noncopyable>(
+        "LcsCache",
+        init<optional<std::size_t> > ((
+            arg("capacity") = 100000
+        ))
+    )
+        .def("lcs_length",  &lcs_cache_lcs_length)
+        .def("size",        &LcsCache::size)
+        .def("capacity",    &LcsCache::get_capacity)
+        .def("hits",        &LcsCache::hits)
+        .def("misses",      &LcsCache::misses)
+        .def("clear",       &LcsCache::clear)
     ;
 
     // lcs_distance.hpp
     def("lcs_distance", &::lcs_distance);
+    def("lcs_length", lcs_length_string);
+    def("lcs_length_dp", &::lcs_length_dp);
+
+    // multi_grep.hpp
+    enum_<MultiGrepStrategy>("MultiGrepStrategy")
+        .value("ALL",       MULTI_GREP_ALL)
+        .value("GREEDY",    MULTI_GREP_GREEDY)
+        .value("LARGEST",   MULTI_GREP_LARGEST)
+    ;
+    class_<MultiGrep>(
+        "MultiGrep",
+        init<
+            std::size_t,
+            const std::vector<std::size_t> &,
+            const std::vector<std::vector<int> > &,
+            const std::vector<std::vector<bool> > &,
+            const std::vector<int> &,
+            const std::vector<std::size_t> &,
+            std::size_t,
+            std::size_t
+        > ((
+            arg("num_cols"),
+            arg("byte_cols"),
+            arg("deltas"),
+            arg("finals"),
+            arg("initials"),
+            arg("labels"),
+            arg("alphabet_size"),
+            arg("any_label")
+        ))
+    )
+        .def("num_patterns", &MultiGrep::num_patterns)
+        .def(
+            "make_pattern_automaton",
+            &MultiGrep::make_pattern_automaton,
+            (arg("word"), arg("strategy") = MULTI_GREP_LARGEST)
+        )
+    ;
+    def(
+        "make_pattern_automata",
+        &make_pattern_automata_nogil,
+        (
+            arg("multi_grep"),
+            arg("lines"),
+            arg("strategy") = MULTI_GREP_LARGEST
+        )
+    );
 
     // pattern_distance.hpp
+    class_<PatternDistanceStats, boost::noncopyable>("PatternDistanceStats")
+        .def("calls",       &PatternDistanceStats::calls)
+        .def("heap_pops",   &PatternDistanceStats::heap_pops)
+        .def("skips",       &PatternDistanceStats::skips)
+        .def("clear",       &PatternDistanceStats::clear)
+    ;
     def(
         "pattern_distance",
         &::pattern_distance,
-        arg("pa1"),
-        arg("pa2"),
-        arg("densities"),
-        arg("max_dist") = std::numeric_limits<double>::max()
+        (
+            arg("pa1"),
+            arg("pa2"),
+            arg("densities"),
+            arg("max_dist") = std::numeric_limits<double>::max(),
+            arg("lcs_cache") = object(),
+            arg("use_heuristic") = false,
+            arg("stats") = object()
+        )
     );
     def(
         "pattern_distance_normalized",
         &::pattern_distance_normalized,
-        arg("pa1"),
-        arg("pa2"),
-        arg("densities"),
-        arg("max_dist") = std::numeric_limits<double>::max()
+        (
+            arg("pa1"),
+            arg("pa2"),
+            arg("densities"),
+            arg("max_dist") = std::numeric_limits<double>::max(),
+            arg("lcs_cache") = object(),
+            arg("use_heuristic") = false,
+            arg("stats") = object()
+        )
     );
 
     // pattern_clustering.hpp
+    enum_<RepresentativeOrder>("RepresentativeOrder")
+        .value("CREATION",      REPRESENTATIVE_ORDER_CREATION)
+        .value("MOVE_TO_FRONT", REPRESENTATIVE_ORDER_MOVE_TO_FRONT)
+        .value("FREQUENCY",     REPRESENTATIVE_ORDER_FREQUENCY)
+    ;
     def(
         "pattern_clustering",
         &::pattern_clustering,
-        arg("pattern_automata"),
-        arg("densities"),
-        arg("max_dist") = 0.5,
-        arg("use_async") = true
+        (
+            arg("pattern_automata"),
+            arg("densities"),
+            arg("max_dist") = 0.5,
+            arg("use_async") = true,
+            arg("lcs_cache") = object(),
+            arg("use_heuristic") = true,
+            arg("stats") = object(),
+            arg("use_prefilter") = true,
+            arg("num_threads") = 0,
+            arg("order") = REPRESENTATIVE_ORDER_CREATION,
+            arg("block_size") = 0
+        )
+    );
+    class_<PatternClusterer>(
+        "PatternClusterer",
+        init<const Densities &, optional<double, RepresentativeOrder> > ((
+            arg("densities"),
+            arg("max_dist") = 0.5,
+            arg("order") = REPRESENTATIVE_ORDER_CREATION
+        ))
+    )
+        .def(
+            "add",
+            &pattern_clusterer_add_nogil,
+            (
+                arg("pattern_automata"),
+                arg("use_async") = true,
+                arg("lcs_cache") = object(),
+                arg("use_heuristic") = true,
+                arg("stats") = object(),
+                arg("use_prefilter") = true,
+                arg("num_threads") = 0,
+                arg("block_size") = 0
+            )
+        )
+        .def("add_representatives", &pattern_clusterer_add_representatives_nogil)
+        .def("save",                &pattern_clusterer_save)
+        .def("load",                &pattern_clusterer_load)
+        .staticmethod("load")
+        .def("num_lines",           &pattern_clusterer_num_lines_nogil)
+        .def("representatives",     &pattern_clusterer_representatives_nogil)
+        .def("representative_words", &pattern_clusterer_representative_words)
+        .def("representative_ids",  &pattern_clusterer_representative_ids_nogil)
+        .def("densities",           &PatternClusterer::get_densities, return_value_policy<copy_const_reference>())
+        .def("max_dist",            &PatternClusterer::get_max_dist)
+        .def("order",               &PatternClusterer::get_order)
+    ;
+    def(
+        "assign_to_clusters",
+        &assign_to_clusters_nogil,
+        (
+            arg("pattern_automata"),
+            arg("representative_pattern_automata"),
+            arg("densities"),
+            arg("max_dist") = 0.5,
+            arg("use_async") = true,
+            arg("lcs_cache") = object(),
+            arg("use_heuristic") = true,
+            arg("stats") = object(),
+            arg("use_prefilter") = true,
+            arg("num_threads") = 0
+        )
     );
 
 }
@@ -0,0 +1,78 @@
+#include "lcs_cache.hpp"
+
+#include <boost/functional/hash.hpp>  // boost::hash_range
+#include "lcs_distance.hpp"
+
+std::size_t LcsCache::KeyHash::operator () (const Key & key) const {
+    std::size_t h = boost::hash_range(key.first.begin(), key.first.end());
+    boost::hash_combine(h, boost::hash_range(key.second.begin(), key.second.end()));
+    return h;
+}
+
+LcsCache::LcsCache(std::size_t capacity):
+    capacity(capacity),
+    num_hits(0),
+    num_misses(0)
+{}
+
+std::size_t LcsCache::lcs_length(
+    StringView s1,
+    StringView s2
+) {
+    // lcs_length is symmetric, hence the key is sorted.
+    Key key = s1 < s2 ? Key(s1, s2) : Key(s2, s1);
+    {
+        std::lock_guard<std::mutex> lock(this->mutex);
+        auto it = this->map_key_entry.find(key);
+        if (it != this->map_key_entry.end()) {
+            this->num_hits++;
+            this->entries.splice(this->entries.begin(), this->entries, it->second);
+            return it->second->length;
+        }
+        this->num_misses++;
+    }
+
+    // The LCS is computed without holding the lock.
+    std::size_t length = ::lcs_length(key.first, key.second);
+    if (this->capacity == 0) return length;
+
+    std::lock_guard<std::mutex> lock(this->mutex);
+    if (this->map_key_entry.find(key) == this->map_key_entry.end()) {
+        this->entries.push_front(Entry {key.first.to_string(), key.second.to_string(), length});
+        const Entry & entry = this->entries.front();
+        this->map_key_entry.emplace(Key(entry.s1, entry.s2), this->entries.begin());
+        if (this->entries.size() > this->capacity) {
+            const Entry & last = this->entries.back();
+            this->map_key_entry.erase(Key(last.s1, last.s2));
+            this->entries.pop_back();
+        }
+    }
+    return length;
+}
+
+std::size_t LcsCache::size() const {
+    std::lock_guard<std::mutex> lock(this->mutex);
+    return this->entries.size();
+}
+
+std::size_t LcsCache::get_capacity() const {
+    return this->capacity;
+}
+
+std::size_t LcsCache::hits() const {
+    std::lock_guard<std::mutex> lock(this->mutex);
+    return this->num_hits;
+}
+
+std::size_t LcsCache::misses() const {
+    std::lock_guard<std::mutex> lock(this->mutex);
+    return this->num_misses;
+}
+
+void LcsCache::clear() {
+    std::lock_guard<std::mutex> lock(this->mutex);
+    this->entries.clear();
+    this->map_key_entry.clear();
+    this->num_hits = 0;
+    this->num_misses = 0;
+}
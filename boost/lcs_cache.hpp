@@ -0,0 +1,50 @@
+#ifndef LCS_CACHE_HPP
+#define LCS_CACHE_HPP
+
+#include <list>           // std::list
+#include <mutex>          // std::mutex
+#include <string>         // std::string
+#include <unordered_map>  // std::unordered_map
+#include <utility>        // std::pair
+#include "string_view.hpp"
+
+// Bounded, thread-safe LRU cache of lcs_length results. It is meant to be
+// shared by the pattern_distance calls of a pattern_clustering run, as log
+// lines often involve the same infixes (hostnames, keywords, units, ...).
+class LcsCache
+{
+    public:
+        // The keys refer to the strings stored in the entries, so that
+        // looking up a pair of infixes does not allocate anything.
+        typedef std::pair<StringView, StringView> Key;
+    private:
+        struct KeyHash {
+            std::size_t operator () (const Key & key) const;
+        };
+        struct Entry {
+            std::string s1;
+            std::string s2;
+            std::size_t length;
+        };
+        typedef std::list<Entry> Entries;  // Most recently used first
+
+        std::size_t capacity;
+        Entries entries;
+        std::unordered_map<Key, Entries::iterator, KeyHash> map_key_entry;
+        std::size_t num_hits;
+        std::size_t num_misses;
+        mutable std::mutex mutex;
+    public:
+        LcsCache(std::size_t capacity = 100000);
+
+        // Returns lcs_length(s1, s2), computing it only if needed.
+        std::size_t lcs_length(StringView s1, StringView s2);
+
+        std::size_t size() const;
+        std::size_t get_capacity() const;
+        std::size_t hits() const;
+        std::size_t misses() const;
+        void clear();
+};
+
+#endif
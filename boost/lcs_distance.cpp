@@ -1,9 +1,97 @@
 #include "lcs_distance.hpp"
 #include <boost/numeric/ublas/matrix.hpp>   // boost::numeric::ublas::matrix
 
-#include <iostream>
+#include <cstdint>      // std::uint64_t
+#include <vector>       // std::vector
+
+typedef std::uint64_t Word;
+#define WORD_SIZE 64
+
+// Counts the bits of x which are not set.
+static inline std::size_t count_zeros(Word x) {
+    return WORD_SIZE - __builtin_popcountll(x);
+}
+
+// Bit-parallel LCS, where w1 fits in a single machine word.
+// The i-th bit of match[a] is set iff w1[i] == a. Each character of w2
+// updates the bit-vector v, whose zeros count the LCS length.
+static std::size_t lcs_length_single_word(
+    StringView w1,
+    StringView w2
+) {
+    // Only the entries read below are initialized.
+    Word match[256];
+    for (char a : w1) match[static_cast<unsigned char>(a)] = 0;
+    for (char a : w2) match[static_cast<unsigned char>(a)] = 0;
+    for (std::size_t i = 0; i < w1.size(); i++) {
+        match[static_cast<unsigned char>(w1[i])] |= Word(1) << i;
+    }
+    Word v = ~Word(0);
+    for (char a : w2) {
+        Word u = v & match[static_cast<unsigned char>(a)];
+        v = (v + u) | (v - u);
+    }
+    if (w1.size() < WORD_SIZE) {
+        v |= ~Word(0) << w1.size();
+    }
+    return count_zeros(v);
+}
+
+// Bit-parallel LCS, where w1 spans several machine words. The carry of
+// the addition is propagated from a word to the next one.
+static std::size_t lcs_length_multi_word(
+    StringView w1,
+    StringView w2
+) {
+    std::size_t num_words = (w1.size() + WORD_SIZE - 1) / WORD_SIZE;
+    std::vector<Word> match(256 * num_words, 0);
+    for (std::size_t i = 0; i < w1.size(); i++) {
+        match[static_cast<unsigned char>(w1[i]) * num_words + i / WORD_SIZE]
+            |= Word(1) << (i % WORD_SIZE);
+    }
+    std::vector<Word> v(num_words, ~Word(0));
+    for (char a : w2) {
+        const Word * m = &match[static_cast<unsigned char>(a) * num_words];
+        Word carry = 0;
+        for (std::size_t k = 0; k < num_words; k++) {
+            Word u = v[k] & m[k];
+            Word sum = v[k] + u;
+            Word sum_carry = sum + carry;
+            Word next_carry = (sum < v[k]) || (sum_carry < sum);
+            v[k] = sum_carry | (v[k] - u);
+            carry = next_carry;
+        }
+    }
+    std::size_t r = w1.size() % WORD_SIZE;
+    if (r) {
+        v.back() |= ~Word(0) << r;
+    }
+    std::size_t result = 0;
+    for (Word x : v) result += count_zeros(x);
+    return result;
+}
 
 std::size_t lcs_length(
+    StringView w1,
+    StringView w2
+) {
+    if (w1 == w2) return w1.size();
+    // The shortest string is encoded in the bit-vectors.
+    if (w1.size() > w2.size()) return lcs_length(w2, w1);
+    if (w1.empty()) return 0;
+    return w1.size() <= WORD_SIZE ?
+        lcs_length_single_word(w1, w2) :
+        lcs_length_multi_word(w1, w2);
+}
+
+std::size_t lcs_length(
+    const std::string & w1,
+    const std::string & w2
+) {
+    return lcs_length(StringView(w1), StringView(w2));
+}
+
+std::size_t lcs_length_dp(
     const std::string & w1,
     const std::string & w2
 ) {
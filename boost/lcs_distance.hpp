@@ -2,8 +2,14 @@
 #define LCS_DISTANCE_HPP
 
 #include <string>
+#include "string_view.hpp"
 
+// Bit-parallel LCS (Hyyro, 2004), see lcs_distance.cpp.
+std::size_t lcs_length(StringView w1, StringView w2);
 std::size_t lcs_length(const std::string & w1, const std::string & w2);
 std::size_t lcs_distance(const std::string & w1, const std::string & w2);
 
+// Reference O(|w1|.|w2|) dynamic programming implementation.
+std::size_t lcs_length_dp(const std::string & w1, const std::string & w2);
+
 #endif
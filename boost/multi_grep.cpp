@@ -0,0 +1,240 @@
+#include "multi_grep.hpp"
+
+#include <algorithm>  // std::inplace_merge
+#include <limits>     // std::numeric_limits
+
+#define NONE std::numeric_limits<std::size_t>::max()
+
+MultiGrep::MultiGrep(
+    std::size_t num_cols,
+    const std::vector<std::size_t> & byte_cols,
+    const std::vector<std::vector<State>> & deltas,
+    const std::vector<std::vector<bool>> & finals,
+    const std::vector<State> & initials,
+    const std::vector<Label> & labels,
+    std::size_t alphabet_size,
+    Label any_label
+):
+    num_cols(num_cols),
+    byte_cols(byte_cols),
+    deltas(deltas),
+    finals(finals),
+    initials(initials),
+    labels(labels),
+    alphabet_size(alphabet_size),
+    any_label(any_label)
+{
+    std::size_t n = this->initials.size();
+    if (this->byte_cols.size() != 256) {
+        throw std::runtime_error("MultiGrep: byte_cols must map each of the 256 bytes");
+    }
+    if (this->deltas.size() != n || this->finals.size() != n || this->labels.size() != n) {
+        throw std::runtime_error("MultiGrep: deltas, finals, initials and labels must have the same size");
+    }
+    for (std::size_t b = 0; b < 256; b++) {
+        if (this->byte_cols[b] >= num_cols) {
+            throw std::runtime_error("MultiGrep: invalid byte column");
+        }
+    }
+    if (any_label > alphabet_size) {
+        throw std::runtime_error("MultiGrep: invalid any label");
+    }
+    for (std::size_t i = 0; i < n; i++) {
+        std::size_t num_states = this->finals[i].size();
+        if (this->deltas[i].size() != num_states * num_cols) {
+            throw std::runtime_error("MultiGrep: invalid transition table size");
+        }
+        if (std::size_t(this->initials[i]) >= num_states) {
+            throw std::runtime_error("MultiGrep: invalid initial state");
+        }
+        for (State r : this->deltas[i]) {
+            if (r != BOTTOM && std::size_t(r) >= num_states) {
+                throw std::runtime_error("MultiGrep: invalid transition target");
+            }
+        }
+        if (this->labels[i] >= alphabet_size) {
+            throw std::runtime_error("MultiGrep: invalid label");
+        }
+    }
+}
+
+std::size_t MultiGrep::num_patterns() const {
+    return this->initials.size();
+}
+
+void MultiGrep::grep(
+    std::size_t i,
+    const std::vector<std::size_t> & cols,
+    MultiGrepStrategy strategy,
+    Slices & slices
+) const {
+    // This is the C++ counterpart of MultiGrepMatcher.__call__ (see multi_grep.py)
+    // for a single pattern. For each reached state q, we maintain the (sorted)
+    // indices j such that w[j:k] leads to q.
+    const std::vector<State> & delta = this->deltas[i];
+    const std::vector<bool> & finals = this->finals[i];
+    State q0 = this->initials[i];
+    std::size_t m = cols.size();
+
+    std::vector<std::size_t> last_k(m + 1, NONE);   // Largest, Greedy: j -> k
+    std::vector<std::size_t> first_j(m + 1, NONE);  // Greedy: k -> j
+    auto on_match = [&] (std::size_t j, std::size_t k) {
+        switch (strategy) {
+            case MULTI_GREP_ALL:
+                slices.emplace_back(j, k);
+                break;
+            case MULTI_GREP_GREEDY:
+                if (first_j[k] != NONE && first_j[k] <= j) break;
+                first_j[k] = j;
+                last_k[j] = k;
+                break;
+            case MULTI_GREP_LARGEST:
+                last_k[j] = k;
+                break;
+        }
+    };
+
+    // The buffers are reused from one character to the next one.
+    std::vector<State> qs(1, q0), qs_next;
+    std::vector<std::vector<std::size_t>> jss(1, std::vector<std::size_t>(1, 0)), jss_next;
+    std::size_t num_groups = 1, num_groups_next;
+    std::vector<int> slots(finals.size(), -1);
+
+    for (std::size_t k = 0; k < m; k++) {
+        std::size_t c = cols[k];
+        qs_next.clear();
+        num_groups_next = 0;
+        auto push_group = [&] (State q) -> std::vector<std::size_t> & {
+            slots[q] = num_groups_next;
+            qs_next.push_back(q);
+            if (num_groups_next == jss_next.size()) jss_next.emplace_back();
+            std::vector<std::size_t> & js = jss_next[num_groups_next++];
+            js.clear();
+            return js;
+        };
+        for (std::size_t g = 0; g < num_groups; g++) {
+            State q = qs[g];
+            const std::vector<std::size_t> & js = jss[g];
+            if (js.empty()) continue;
+            State r = delta[q * this->num_cols + c];
+            if (r == BOTTOM) {
+                // Keep the historical behavior of multi_grep (q is reset).
+                if (slots[q] < 0) push_group(q);
+                else jss_next[slots[q]].clear();
+            } else {
+                if (slots[r] < 0) {
+                    std::vector<std::size_t> & js_next = push_group(r);
+                    js_next.assign(js.begin(), js.end());
+                } else {
+                    std::vector<std::size_t> & js_next = jss_next[slots[r]];
+                    std::size_t mid = js_next.size();
+                    js_next.insert(js_next.end(), js.begin(), js.end());
+                    std::inplace_merge(js_next.begin(), js_next.begin() + mid, js_next.end());
+                }
+                if (finals[r]) {
+                    for (std::size_t j : js) on_match(j, k + 1);
+                }
+            }
+        }
+        if (slots[q0] < 0) push_group(q0).push_back(k + 1);
+        else jss_next[slots[q0]].push_back(k + 1);
+        for (State q : qs_next) slots[q] = -1;
+        std::swap(qs, qs_next);
+        std::swap(jss, jss_next);
+        num_groups = num_groups_next;
+    }
+
+    if (strategy != MULTI_GREP_ALL) {
+        // For each k, keep the smallest j such that last_k[j] == k.
+        std::vector<bool> seen(m + 1, false);
+        for (std::size_t j = 0; j <= m; j++) {
+            std::size_t k = last_k[j];
+            if (k != NONE && !seen[k]) {
+                seen[k] = true;
+                slices.emplace_back(j, k);
+            }
+        }
+    }
+}
+
+std::vector<MultiGrep::Slices> MultiGrep::indices(
+    const std::string & w,
+    MultiGrepStrategy strategy
+) const {
+    std::vector<std::size_t> cols(w.size());
+    for (std::size_t k = 0; k < w.size(); k++) {
+        cols[k] = this->byte_cols[static_cast<unsigned char>(w[k])];
+    }
+    std::vector<Slices> result(this->num_patterns());
+    for (std::size_t i = 0; i < this->num_patterns(); i++) {
+        this->grep(i, cols, strategy, result[i]);
+    }
+    return result;
+}
+
+PatternAutomaton MultiGrep::make_pattern_automaton(
+    const std::string & w,
+    MultiGrepStrategy strategy
+) const {
+    // This is the C++ counterpart of PatternAutomaton.__init__ (see pattern_automaton.py).
+    std::size_t n = w.size();
+    PatternAutomaton g(n + 1, this->alphabet_size, w);
+    std::vector<bool>
+        has_successors(n + 1, false),
+        has_predecessors(n + 1, false);
+    bool found = false;
+
+    // Like pybgl.Automaton, an edge is only inserted if its (source, label)
+    // pair is not yet used.
+    auto add_edge = [&g] (std::size_t q, std::size_t r, Label a) {
+        if (g.delta(q, a) == BOTTOM) g.add_edge(q, r, a);
+    };
+
+    // Add edges
+    std::vector<Slices> slices = this->indices(w, strategy);
+    for (std::size_t i = 0; i < this->num_patterns(); i++) {
+        for (const auto & jk : slices[i]) {
+            add_edge(jk.first, jk.second, this->labels[i]);
+            has_successors[jk.first] = true;
+            has_predecessors[jk.second] = true;
+            found = true;
+        }
+    }
+
+    if (found) {
+        std::vector<std::size_t> to_keep;
+        for (std::size_t u = 0; u <= n; u++) {
+            if (u == 0 || u == n || has_successors[u] || has_predecessors[u]) {
+                to_keep.push_back(u);
+            }
+        }
+
+        // Add missing "any" edges
+        for (std::size_t i = 0; i < to_keep.size(); i++) {
+            std::size_t u = to_keep[i];
+            if (u != 0 && !has_predecessors[u]) {
+                add_edge(to_keep[i - 1], u, this->any_label);
+            }
+            if (u != n && !has_successors[u]) {
+                add_edge(u, to_keep[i + 1], this->any_label);
+            }
+        }
+    } else if (n) {
+        // The PatternAutomaton involves a single "any" arc
+        add_edge(0, n, this->any_label);
+    }
+    return g;
+}
+
+std::vector<PatternAutomaton> make_pattern_automata(
+    const MultiGrep & multi_grep,
+    const std::vector<std::string> & lines,
+    MultiGrepStrategy strategy
+) {
+    std::vector<PatternAutomaton> pas;
+    pas.reserve(lines.size());
+    for (const std::string & line : lines) {
+        pas.push_back(multi_grep.make_pattern_automaton(line, strategy));
+    }
+    return pas;
+}
@@ -0,0 +1,60 @@
+#ifndef MULTI_GREP_HPP
+#define MULTI_GREP_HPP
+
+#include <string>     // std::string
+#include <vector>     // std::vector
+#include "pattern_automaton.hpp"
+
+// Strategies used to select the (j, k) matches kept in a PatternAutomaton.
+// See MultiGrepFunctorAll, MultiGrepFunctorGreedy and MultiGrepFunctorLargest
+// in multi_grep.py. Matches ending at the same index are processed by
+// increasing start index.
+enum MultiGrepStrategy {
+    MULTI_GREP_ALL,
+    MULTI_GREP_GREEDY,
+    MULTI_GREP_LARGEST
+};
+
+// Compiled pattern collection. It is the C++ counterpart of the
+// MultiGrepMatcher python class: each DFA is a flat (state x column) table.
+class MultiGrep
+{
+    public:
+        typedef int State;
+        typedef PatternAutomaton::Label Label;
+        typedef std::vector<std::pair<std::size_t, std::size_t>> Slices;
+    private:
+        std::size_t num_cols;
+        std::vector<std::size_t> byte_cols;       // Maps each byte to its column
+        std::vector<std::vector<State>> deltas;   // One table per pattern
+        std::vector<std::vector<bool>> finals;    // One vector per pattern
+        std::vector<State> initials;              // One initial state per pattern
+        std::vector<Label> labels;                // Maps each pattern to its PatternAutomaton label
+        std::size_t alphabet_size;                // Number of PatternAutomaton labels
+        Label any_label;                          // The label of the "any" pattern
+
+        void grep(std::size_t i, const std::vector<std::size_t> & cols, MultiGrepStrategy strategy, Slices & slices) const;
+    public:
+        MultiGrep(
+            std::size_t num_cols,
+            const std::vector<std::size_t> & byte_cols,
+            const std::vector<std::vector<State>> & deltas,
+            const std::vector<std::vector<bool>> & finals,
+            const std::vector<State> & initials,
+            const std::vector<Label> & labels,
+            std::size_t alphabet_size,
+            Label any_label
+        );
+
+        std::size_t num_patterns() const;
+        std::vector<Slices> indices(const std::string & w, MultiGrepStrategy strategy = MULTI_GREP_LARGEST) const;
+        PatternAutomaton make_pattern_automaton(const std::string & w, MultiGrepStrategy strategy = MULTI_GREP_LARGEST) const;
+};
+
+std::vector<PatternAutomaton> make_pattern_automata(
+    const MultiGrep & multi_grep,
+    const std::vector<std::string> & lines,
+    MultiGrepStrategy strategy = MULTI_GREP_LARGEST
+);
+
+#endif
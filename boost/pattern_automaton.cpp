@@ -1,33 +1,46 @@
 #include "pattern_automaton.hpp"
-#include <algorithm>  // std::fill
+#include <algorithm>  // std::lower_bound, std::stable_sort
+#include <numeric>    // std::iota
 #include <sstream>    // std::ostringstream
+#include "serialization.hpp"
 
 PatternAutomaton::PatternAutomaton(
     std::size_t num_vertices,
     std::size_t alphabet_size,
     const std::string & word
 ):
-    adjacencies(num_vertices),
+    offsets(num_vertices + 1, 0),
     alphabet_size(alphabet_size),
-    word(word)
-{
-    std::fill(
-        this->adjacencies.begin(),
-        this->adjacencies.end(),
-        std::vector<State>(alphabet_size, BOTTOM)
-    );
-}
+    word(std::make_shared<const std::string>(word))
+{}
 
 void PatternAutomaton::add_vertex() {
-    this->adjacencies.push_back(
-        std::vector<State>(this->num_vertices(), BOTTOM)
-    );
+    this->offsets.push_back(this->edges.size());
+}
+
+bool PatternAutomaton::is_valid_edge(State q, State r, Label a) const {
+    std::size_t n = this->num_vertices();
+    return std::size_t(q) < n && std::size_t(r) < n && a < this->get_alphabet_size();
 }
 
 void PatternAutomaton::add_edge(State q, State r, Label a) {
     std::size_t n = this->num_vertices();
-    if (std::size_t(q) < n && std::size_t(r) < n && a < this->get_alphabet_size()) {
-        this->adjacencies[q][a] = r;
+    if (this->is_valid_edge(q, r, a)) {
+        // Find where (a, r) must be inserted among the out-edges of q.
+        auto first = this->edges.begin() + this->offsets[q];
+        auto last = this->edges.begin() + this->offsets[q + 1];
+        auto it = std::lower_bound(
+            first, last, a,
+            [] (const Edge & e, Label a) { return e.label < a; }
+        );
+        if (it != last && it->label == a) {
+            it->target = r;
+        } else {
+            this->edges.insert(it, Edge {static_cast<std::uint32_t>(a), r});
+            for (std::size_t u = q + 1; u <= n; u++) {
+                this->offsets[u]++;
+            }
+        }
     } else {
         std::ostringstream message;
         message << "add_edge(q = " << q << ", r = " << r << ", a = " + a << "):" << std::endl
@@ -37,44 +50,103 @@ void PatternAutomaton::add_edge(State q, State r, Label a) {
     }
 }
 
+void PatternAutomaton::add_edges(
+    const std::vector<State> & sources,
+    const std::vector<State> & targets,
+    const std::vector<Label> & labels
+) {
+    std::size_t n = this->num_vertices();
+    std::size_t m = sources.size();
+    if (targets.size() != m || labels.size() != m) {
+        throw std::runtime_error("add_edges: sources, targets and labels must have the same size");
+    }
+    for (std::size_t i = 0; i < m; i++) {
+        if (!this->is_valid_edge(sources[i], targets[i], labels[i])) {
+            std::ostringstream message;
+            message << "add_edges: invalid edge #" << i << " (q = " << sources[i]
+                << ", r = " << targets[i] << ", a = " << labels[i] << "):" << std::endl
+                << "   0 <= q, r < this->num_vertices() = " << n << std::endl
+                << "   a < alphabet_size = " << this->get_alphabet_size() << std::endl;
+            throw std::runtime_error(message.str());
+        }
+    }
+
+    // Sort the new edges by (source, label). As the sort is stable, the last
+    // edge of a run sharing the same (source, label) is the one to keep.
+    std::vector<std::size_t> order(m);
+    std::iota(order.begin(), order.end(), 0);
+    std::stable_sort(
+        order.begin(), order.end(),
+        [&] (std::size_t i, std::size_t j) {
+            return sources[i] < sources[j] || (sources[i] == sources[j] && labels[i] < labels[j]);
+        }
+    );
+
+    // Merge the current out-edges of each vertex with the new ones.
+    std::vector<std::uint32_t> offsets(n + 1, 0);
+    std::vector<Edge> edges;
+    edges.reserve(this->edges.size() + m);
+    auto it = order.begin();
+    for (std::size_t q = 0; q < n; q++) {
+        const Edge * e = this->out_edges_begin(q);
+        const Edge * e_end = this->out_edges_end(q);
+        for (; it != order.end() && std::size_t(sources[*it]) == q; it++) {
+            if (it + 1 != order.end() && sources[*(it + 1)] == sources[*it] && labels[*(it + 1)] == labels[*it]) {
+                continue;
+            }
+            Label a = labels[*it];
+            for (; e != e_end && e->label < a; e++) {
+                edges.push_back(*e);
+            }
+            if (e != e_end && e->label == a) e++;
+            edges.push_back(Edge {static_cast<std::uint32_t>(a), targets[*it]});
+        }
+        edges.insert(edges.end(), e, e_end);
+        offsets[q + 1] = edges.size();
+    }
+    this->offsets.swap(offsets);
+    this->edges.swap(edges);
+}
+
 PatternAutomaton::State PatternAutomaton::delta(State q, Label a) const {
     if (!(q < (int) this->num_vertices())) throw std::runtime_error("delta: !q < n");
     if (!(a < this->get_alphabet_size())) throw std::runtime_error("delta: !a < |Sigma|");
-    return q == BOTTOM ? BOTTOM : this->adjacencies[q][a];
+    if (q == BOTTOM) return BOTTOM;
+    for (const Edge * e = this->out_edges_begin(q); e != this->out_edges_end(q); e++) {
+        if (e->label == a) return e->target;
+    }
+    return BOTTOM;
 }
 
 std::size_t PatternAutomaton::num_vertices() const {
-    return this->adjacencies.size();
+    return this->offsets.size() - 1;
 }
 
 std::size_t PatternAutomaton::num_edges() const {
-    std::size_t n = 0;
-    for (std::size_t q = 0; q < this->num_vertices(); q++) {
-        for (std::size_t a = 0; a < this->get_alphabet_size(); a++) {
-            State r = this->delta(q, a);
-            if (r != BOTTOM) {
-                n++;
-            }
-        }
-    }
-    return n;
+    return this->edges.size();
 }
 
 std::string PatternAutomaton::to_string() const {
     std::ostringstream oss;
     for (std::size_t q = 0; q < this->num_vertices(); q++) {
-        for (std::size_t a = 0; a < this->get_alphabet_size(); a++) {
-            State r = this->delta(q, a);
-            if (r != BOTTOM) {
-                oss << q << "--[" << a << "]-->" << r << std::endl;
-            }
+        for (const Edge * e = this->out_edges_begin(q); e != this->out_edges_end(q); e++) {
+            oss << q << "--[" << e->label << "]-->" << e->target << std::endl;
         }
     }
     return oss.str();
 }
 
-std::string PatternAutomaton::get_word() const {
-    return this->word;
+const std::string & PatternAutomaton::get_word() const {
+    return *this->word;
+}
+
+StringView PatternAutomaton::get_infix(std::size_t i, std::size_t j) const {
+    // The vertices of a PatternAutomaton built by hand (or read by load)
+    // may go beyond the end of its word, and its edges may go backward.
+    std::size_t n = this->word->size();
+    i = std::min(i, n);
+    j = std::min(std::max(i, j), n);
+    return StringView(*this->word).substr(i, j - i);
 }
 
 std::size_t PatternAutomaton::get_alphabet_size() const {
@@ -86,3 +158,36 @@ std::ostream & operator << (std::ostream & out, const PatternAutomaton & g) {
     return out;
 }
 
+void PatternAutomaton::save(std::string & out) const {
+    write_string(out, *this->word);
+    write_value<std::uint64_t>(out, this->alphabet_size);
+    write_vector(out, this->offsets);
+    write_vector(out, this->edges);
+}
+
+PatternAutomaton PatternAutomaton::load(const char * & p, const char * end) {
+    PatternAutomaton g;
+    g.word = std::make_shared<const std::string>(read_string(p, end));
+    g.alphabet_size = read_value<std::uint64_t>(p, end);
+    g.offsets = read_vector<std::uint32_t>(p, end);
+    g.edges = read_vector<Edge>(p, end);
+
+    // Check the consistency of the CSR layout, as the search relies on it:
+    // the out-edges of each vertex are valid and sorted by increasing label.
+    std::size_t n = g.offsets.size();
+    bool valid = (n > 0 && g.offsets[0] == 0 && g.offsets[n - 1] == g.edges.size());
+    for (std::size_t q = 0; valid && q + 1 < n; q++) {
+        valid = (g.offsets[q] <= g.offsets[q + 1] && g.offsets[q + 1] <= g.edges.size());
+        for (std::size_t i = g.offsets[q]; valid && i < g.offsets[q + 1]; i++) {
+            const Edge & e = g.edges[i];
+            valid = (
+                g.is_valid_edge(PatternAutomaton::State(q), e.target, e.label)
+                && (i == g.offsets[q] || g.edges[i - 1].label < e.label)
+            );
+        }
+    }
+    if (!valid) {
+        throw std::runtime_error("PatternAutomaton::load: invalid pattern automaton");
+    }
+    return g;
+}
@@ -1,26 +1,38 @@
 #ifndef PATTERN_AUTOMATON_HPP
 #define PATTERN_AUTOMATON_HPP
 
+#include <cstdint>    // std::uint32_t
+#include <memory>     // std::shared_ptr
 #include <ostream>    // std::ostream
 #include <string>     // std::string
 #include <vector>     // std::vector
+#include "string_view.hpp"
 
 const static int BOTTOM = -1;
 
+// The transitions are stored in a CSR (compressed sparse row) layout: the
+// out-edges of q are edges[offsets[q]], ..., edges[offsets[q + 1] - 1],
+// sorted by increasing label. Most of the vertices of a PatternAutomaton
+// have no or very few out-edges, hence this layout is much more compact
+// than a dense (num_vertices x alphabet_size) transition table.
 class PatternAutomaton
 {
     public:
         typedef int State;
         typedef std::size_t Label;
-        typedef std::vector<    // q
-            std::vector<        // a
-                State           // r
-            >
-        > Adjacencies;
+        struct Edge {
+            std::uint32_t label;
+            State target;
+        };
     private:
-        Adjacencies adjacencies;
+        std::vector<std::uint32_t> offsets;       // Size: num_vertices + 1
+        std::vector<Edge> edges;
         std::size_t alphabet_size;
-        std::string word;
+        std::shared_ptr<const std::string> word;  // Shared by the copies of this PatternAutomaton
+
+        // Checks whether q -[a]-> r may be an edge of this PatternAutomaton.
+        // The edges added by add_edge(s) and read by load must satisfy it.
+        bool is_valid_edge(State q, State r, Label a) const;
     public:
         PatternAutomaton(
             std::size_t num_vertices = 0,
@@ -30,12 +42,38 @@ class PatternAutomaton
 
         void add_vertex();
         void add_edge(State q, State r, Label a);
+
+        // Equivalent to calling add_edge(sources[i], targets[i], labels[i])
+        // for each i, but builds the transitions in a single pass. Nothing is
+        // added if any of these edges is invalid.
+        void add_edges(
+            const std::vector<State> & sources,
+            const std::vector<State> & targets,
+            const std::vector<Label> & labels
+        );
         State delta(State q, Label a) const;
         std::size_t num_vertices() const;
         std::size_t num_edges() const;
         std::string to_string() const;
-        std::string get_word() const;
+        const std::string & get_word() const;
+        // Returns w[i:j], where i and j are clamped to the word.
+        StringView get_infix(std::size_t i, std::size_t j) const;
         std::size_t get_alphabet_size() const;
+
+        // Appends the binary representation of this PatternAutomaton to out.
+        void save(std::string & out) const;
+
+        // Rebuilds a PatternAutomaton from a binary representation written by
+        // save, starting at p. Moves p after it.
+        static PatternAutomaton load(const char * & p, const char * end);
+
+        // Out-edges of q, sorted by increasing label.
+        const Edge * out_edges_begin(State q) const {
+            return this->edges.data() + this->offsets[q];
+        }
+        const Edge * out_edges_end(State q) const {
+            return this->edges.data() + this->offsets[q + 1];
+        }
 };
 
 std::ostream & operator << (std::ostream & out, const PatternAutomaton & g);
@@ -1,79 +1,119 @@
 #include "pattern_clustering.hpp"
 
 #include <algorithm>
-#include <future>
+#include <atomic>
+#include <cmath>
 #include <iostream>
 #include <limits>
-#include <thread>
+#include <memory>
+#include <mutex>
 #include <vector>
 #include "pattern_distance.hpp"
+#include "serialization.hpp"
 #include "stl_util.hpp"
+#include "thread_pool.hpp"
 
 #define NONE std::numeric_limits<std::size_t>::max()
 #define INVALID_DISTANCE std::numeric_limits<double>::max()
 
-template <typename T>
-inline bool is_ready(const std::future<T> & future) {
-    return future.valid() && future.wait_for(std::chrono::seconds(0)) == std::future_status::ready;
+// Relative tolerance of the prefilter, which absorbs the rounding errors
+// made when summing the edge weights of a path.
+#define PREFILTER_TOLERANCE 1e-9
+
+// Increase this number whenever the binary format of PatternClusterer changes.
+#define PATTERN_CLUSTERER_FORMAT_VERSION 1
+
+// Checks whether the (normalized) distance between two PAs, whose features
+// are f1 and f2, is provably greater or equal to max_dist, i.e., whether
+// pattern_distance_normalized would return -1.
+static bool is_pruned(
+    const PatternAutomatonFeatures & f1,
+    const PatternAutomatonFeatures & f2,
+    double max_dist,
+    PatternDistanceStats * stats
+) {
+    double bound = max_dist * (f1.length + f2.length) * (1 + PREFILTER_TOLERANCE);
+    if (pattern_distance_lower_bound(f1, f2) > bound) {
+        if (stats) stats->skip();
+        return true;
+    }
+    return false;
 }
 
+// Finds the representative reprs[js[k]] closest to pa, if closer than
+// max_dist. Ties are broken in favor of the representative coming first
+// in js. If reprs_features is not null, the prefilter is enabled and
+// features must point to the features of pa.
 static std::pair<std::size_t, double> find_closest_neighbor(
-    const PatternAutomata & pas,
+    const PatternAutomata & reprs,
     const std::vector<std::size_t> & js,
-    std::size_t i,
+    const PatternAutomaton & pa,
     const Densities & densities,
     double max_dist,
-    bool use_async = true
+    ThreadPool * pool = nullptr,
+    LcsCache * lcs_cache = nullptr,
+    bool use_heuristic = true,
+    PatternDistanceStats * stats = nullptr,
+    const std::vector<PatternAutomatonFeatures> * reprs_features = nullptr,
+    const PatternAutomatonFeatures * features = nullptr
 ) {
     if (js.empty()) {
         return std::make_pair(NONE, 0);
     }
-    const PatternAutomaton & pa = pas[i];
     double dist = max_dist;
     std::size_t j = NONE;
 
-    // Async way
-    if (use_async) {
-        // 1) Queue jobs
-        std::vector<std::future<double>> futures;
-        std::size_t num_futures = js.size();
-        for (std::size_t k = 0; k < num_futures; k++) {
-            std::size_t j = js[k];
-            const PatternAutomaton & pa_repr = pas[j];
-            futures.push_back(
-                std::async(
-                    std::launch::async,
-                    [&]() {
-                        return pattern_distance_normalized(pa_repr, pa, densities, max_dist);
-                    }
-                )
-            );
-        }
+    auto is_pruned = [&] (std::size_t j, double max_dist) -> bool {
+        return reprs_features && ::is_pruned((*reprs_features)[j], *features, max_dist, stats);
+    };
 
-        // 2) Wait until jobs are ready
-        std::size_t num_futures_ready = 0;
-        do {
-            for (std::size_t k = 0; k < num_futures; k++) {
-                auto & future = futures[k];
-                if (is_ready(future)) {
-                    double d = future.get();
-                    if (d >= 0 && d < dist) {
-                        dist = d;
-                        j = js[k];
-                    }
-                    num_futures_ready++;
+    // Multi thread way
+    if (pool) {
+        // Each worker processes a chunk of candidates. The best distance
+        // found so far is shared, so that the searches are tightened and
+        // the pending searches that can no longer win are aborted. To get
+        // the same result as the mono thread way, the ties are broken in
+        // favor of the candidate coming first in js, hence the searches also
+        // accept the distances equal to the best one. Once a distance 0 is
+        // found, only the candidates coming before may still win.
+        std::mutex mutex;
+        std::atomic<double> shared_dist(max_dist);
+        std::atomic<std::size_t> k_best(NONE);
+        std::size_t chunk_size = std::max<std::size_t>(1, js.size() / (4 * pool->size()));
+        pool->parallel_for(js.size(), chunk_size, [&] (std::size_t begin, std::size_t end) {
+            for (std::size_t k = begin; k < end; k++) {
+                double d_best = shared_dist;
+                if (d_best == 0 && k > k_best) return;
+                double bound = (d_best < max_dist) ? std::nextafter(d_best, INVALID_DISTANCE) : max_dist;
+                if (is_pruned(js[k], bound)) continue;
+                double d = pattern_distance_normalized_bounded(
+                    reprs[js[k]], pa, densities, bound, shared_dist,
+                    lcs_cache, use_heuristic, stats
+                );
+                if (d < 0 || d >= max_dist) continue;
+                std::lock_guard<std::mutex> lock(mutex);
+                if (d < shared_dist || (d == shared_dist && k < k_best)) {
+                    // k_best is set first, so that a worker reading a distance 0
+                    // also reads the corresponding k_best.
+                    k_best = k;
+                    shared_dist = d;
                 }
             }
-        } while (num_futures_ready < num_futures);
+        });
+        if (k_best != NONE) {
+            dist = shared_dist;
+            j = js[k_best];
+        }
     } else {
         // Mono thread way
         for (std::size_t k = 0; k < js.size(); k++) {
             std::size_t j_cur = js[k];
-            const PatternAutomaton pa_repr = pas[j_cur];
-            double d = pattern_distance_normalized(pa_repr, pa, densities, dist);
+            if (is_pruned(j_cur, dist)) continue;
+            double d = pattern_distance_normalized(reprs[j_cur], pa, densities, dist, lcs_cache, use_heuristic, stats);
             if (d >= 0 && d < dist) {
                 dist = d;
                 j = j_cur;
+                if (d == 0) break; // No candidate may be closer
             }
         }
     }
@@ -81,26 +121,376 @@ static std::pair<std::size_t, double> find_closest_neighbor(
     return std::make_pair(j, dist);
 }
 
-Clusters pattern_clustering(
-    const PatternAutomata & pas,
+// Finds the representatives reprs[js[k]] minimizing the distance to pa, if
+// less than max_dist. dist and ties are updated accordingly: ties gathers, in
+// the order of js, the candidates at distance dist (the candidates found by
+// previous calls are kept if not farther). Unlike find_closest_neighbor,
+// every tied candidate is kept, so that the caller may break the ties
+// afterwards.
+static void find_closest_neighbors(
+    const PatternAutomata & reprs,
+    const std::vector<std::size_t> & js,
+    const PatternAutomaton & pa,
     const Densities & densities,
     double max_dist,
-    bool use_async
+    double & dist,
+    std::vector<std::size_t> & ties,
+    LcsCache * lcs_cache,
+    bool use_heuristic,
+    PatternDistanceStats * stats,
+    const std::vector<PatternAutomatonFeatures> * reprs_features,
+    const PatternAutomatonFeatures * features
 ) {
+    for (std::size_t j : js) {
+        double bound = ties.empty() ? max_dist : std::nextafter(dist, INVALID_DISTANCE);
+        if (reprs_features && is_pruned((*reprs_features)[j], *features, bound, stats)) continue;
+        double d = pattern_distance_normalized(reprs[j], pa, densities, bound, lcs_cache, use_heuristic, stats);
+        if (d < 0 || d >= max_dist) continue;
+        if (ties.empty() || d < dist) {
+            dist = d;
+            ties.clear();
+        }
+        if (d == dist) ties.push_back(j);
+    }
+}
+
+PatternClusterer::PatternClusterer(
+    const Densities & densities,
+    double max_dist,
+    RepresentativeOrder order
+):
+    densities(densities),
+    max_dist(max_dist),
+    order(order),
+    num_lines(0)
+{}
+
+PatternClusterer::PatternClusterer(const PatternClusterer & clusterer) {
+    *this = clusterer;
+}
+
+PatternClusterer & PatternClusterer::operator = (const PatternClusterer & clusterer) {
+    if (this == &clusterer) return *this;
+    std::lock(this->mutex, clusterer.mutex);
+    std::lock_guard<std::mutex> lock(this->mutex, std::adopt_lock);
+    std::lock_guard<std::mutex> lock_other(clusterer.mutex, std::adopt_lock);
+    this->densities = clusterer.densities;
+    this->max_dist = clusterer.max_dist;
+    this->order = clusterer.order;
+    this->num_lines = clusterer.num_lines;
+    this->representatives = clusterer.representatives;
+    this->representative_ids = clusterer.representative_ids;
+    this->representative_features = clusterer.representative_features;
+    this->representative_order = clusterer.representative_order;
+    this->num_matches = clusterer.num_matches;
+    return *this;
+}
+
+void PatternClusterer::assign(
+    const PatternAutomata & pas,
+    std::size_t i,
+    std::size_t k,
+    Clusters & clusters,
+    const std::vector<PatternAutomatonFeatures> * features
+) {
+    if (k == NONE) {
+        k = this->representatives.size();
+        this->representatives.push_back(pas[i]);
+        this->representative_ids.push_back(this->num_lines + i);
+        this->representative_features.push_back(
+            features ? (*features)[i] :
+            make_pattern_automaton_features(pas[i], this->densities)
+        );
+        this->num_matches.push_back(0);
+        this->representative_order.push_back(k);
+    }
+    clusters[i] = this->representative_ids[k];
+    this->num_matches[k]++;
+
+    // Update the order of the representatives.
+    std::vector<std::size_t> & ks = this->representative_order;
+    if (this->order != REPRESENTATIVE_ORDER_CREATION) {
+        auto it = std::find(ks.begin(), ks.end(), k);
+        if (this->order == REPRESENTATIVE_ORDER_MOVE_TO_FRONT) {
+            std::rotate(ks.begin(), it, it + 1);
+        } else {
+            // Stable: k only overtakes the less matched representatives.
+            for (; it != ks.begin() && this->num_matches[*(it - 1)] < this->num_matches[k]; it--) {
+                std::iter_swap(it, it - 1);
+            }
+        }
+    }
+}
+
+Clusters PatternClusterer::add(
+    const PatternAutomata & pas,
+    bool use_async,
+    LcsCache * lcs_cache,
+    bool use_heuristic,
+    PatternDistanceStats * stats,
+    bool use_prefilter,
+    std::size_t num_threads,
+    std::size_t block_size
+) {
+    std::lock_guard<std::mutex> lock(this->mutex);
     std::size_t n = pas.size();
     Clusters clusters(n, NONE);
-    std::vector<std::size_t> pas_repr;
-    for (std::size_t i = 0; i < n; i++) {
-        std::size_t j;
-        double dist;
-        std::tie(j, dist) = find_closest_neighbor(pas, pas_repr, i, densities, max_dist, use_async);
-        if (j == NONE || dist > max_dist) {
-            pas_repr.push_back(i);
-            clusters[i] = i;
-        } else {
-            clusters[i] = j;
+    std::unique_ptr<ThreadPool> pool;
+    if (use_async) {
+        pool.reset(new ThreadPool(num_threads));
+    }
+    std::vector<PatternAutomatonFeatures> features;
+    if (use_prefilter) {
+        features.reserve(n);
+        for (const PatternAutomaton & pa : pas) {
+            features.push_back(make_pattern_automaton_features(pa, this->densities));
+        }
+    }
+    const std::vector<PatternAutomatonFeatures>
+        * reprs_features = use_prefilter ? &this->representative_features : nullptr,
+        * pas_features = use_prefilter ? &features : nullptr;
+    const PatternAutomata & reprs = this->representatives;
+    const std::vector<std::size_t> & ks = this->representative_order;
+    double max_dist = this->max_dist;
+
+    if (block_size == 0) {
+        for (std::size_t i = 0; i < n; i++) {
+            std::size_t k;
+            double dist;
+            std::tie(k, dist) = find_closest_neighbor(
+                reprs, ks, pas[i], this->densities, max_dist, pool.get(),
+                lcs_cache, use_heuristic, stats,
+                reprs_features, use_prefilter ? &features[i] : nullptr
+            );
+            this->assign(pas, i, (k == NONE || dist > max_dist) ? NONE : k, clusters, pas_features);
+        }
+        this->num_lines += n;
+        return clusters;
+    }
+
+    // Block mode: the lines of a block are first compared (in parallel) to
+    // the representatives known at the beginning of the block. Then, in index
+    // order, each line is compared to the representatives created by the
+    // previous lines of the block, and the ties are broken according to the
+    // current order of the representatives, as the sequential algorithm does.
+    std::vector<double> block_dists(block_size);
+    std::vector<std::vector<std::size_t>> block_ties(block_size);
+    std::vector<std::size_t> new_ks;
+    for (std::size_t i0 = 0; i0 < n; i0 += block_size) {
+        std::size_t m = std::min(block_size, n - i0);
+        ThreadPool::Job job = [&] (std::size_t begin, std::size_t end) {
+            for (std::size_t b = begin; b < end; b++) {
+                std::size_t i = i0 + b;
+                block_dists[b] = max_dist;
+                block_ties[b].clear();
+                find_closest_neighbors(
+                    reprs, ks, pas[i], this->densities, max_dist,
+                    block_dists[b], block_ties[b],
+                    lcs_cache, use_heuristic, stats,
+                    reprs_features, use_prefilter ? &features[i] : nullptr
+                );
+            }
+        };
+        if (pool) pool->parallel_for(m, 1, job); else job(0, m);
+
+        new_ks.clear();
+        for (std::size_t b = 0; b < m; b++) {
+            std::size_t i = i0 + b;
+            std::vector<std::size_t> & ties = block_ties[b];
+            find_closest_neighbors(
+                reprs, new_ks, pas[i], this->densities, max_dist,
+                block_dists[b], ties,
+                lcs_cache, use_heuristic, stats,
+                reprs_features, use_prefilter ? &features[i] : nullptr
+            );
+            std::size_t k = NONE;
+            if (ties.size() == 1) {
+                k = ties[0];
+            } else if (ties.size() > 1) {
+                k = *std::find_first_of(ks.begin(), ks.end(), ties.begin(), ties.end());
+            }
+            if (k == NONE) new_ks.push_back(reprs.size());
+            this->assign(pas, i, k, clusters, pas_features);
         }
     }
+    this->num_lines += n;
     return clusters;
 }
 
+Clusters PatternClusterer::add_representatives(const PatternAutomata & pas) {
+    std::lock_guard<std::mutex> lock(this->mutex);
+    std::size_t n = pas.size();
+    Clusters clusters(n, NONE);
+    for (std::size_t i = 0; i < n; i++) {
+        this->assign(pas, i, NONE, clusters, nullptr);
+    }
+    this->num_lines += n;
+    return clusters;
+}
+
+void PatternClusterer::save(std::string & out) const {
+    std::lock_guard<std::mutex> lock(this->mutex);
+    write_value<std::uint32_t>(out, PATTERN_CLUSTERER_FORMAT_VERSION);
+    write_vector(out, this->densities);
+    write_value<double>(out, this->max_dist);
+    write_value<std::uint32_t>(out, this->order);
+    write_value<std::uint64_t>(out, this->num_lines);
+    write_value<std::uint64_t>(out, this->representatives.size());
+    for (const PatternAutomaton & pa : this->representatives) {
+        pa.save(out);
+    }
+    write_vector(out, std::vector<std::uint64_t>(this->representative_ids.begin(), this->representative_ids.end()));
+    write_vector(out, std::vector<std::uint64_t>(this->representative_order.begin(), this->representative_order.end()));
+    write_vector(out, std::vector<std::uint64_t>(this->num_matches.begin(), this->num_matches.end()));
+}
+
+PatternClusterer PatternClusterer::load(const char * & p, const char * end) {
+    if (read_value<std::uint32_t>(p, end) != PATTERN_CLUSTERER_FORMAT_VERSION) {
+        throw std::runtime_error("PatternClusterer::load: unsupported format version");
+    }
+    Densities densities = read_vector<double>(p, end);
+    double max_dist = read_value<double>(p, end);
+    std::uint32_t order = read_value<std::uint32_t>(p, end);
+    if (order > REPRESENTATIVE_ORDER_FREQUENCY) {
+        throw std::runtime_error("PatternClusterer::load: invalid order");
+    }
+    PatternClusterer clusterer(densities, max_dist, static_cast<RepresentativeOrder>(order));
+    clusterer.num_lines = read_value<std::uint64_t>(p, end);
+
+    // A serialized PatternAutomaton takes at least 40 bytes: the sizes of its
+    // word, offsets and edges, its alphabet size, and two offsets.
+    const std::uint64_t min_pattern_automaton_size = 5 * sizeof(std::uint64_t);
+    std::uint64_t num_representatives = read_value<std::uint64_t>(p, end);
+    if (num_representatives > static_cast<std::uint64_t>(end - p) / min_pattern_automaton_size) {
+        throw std::runtime_error("PatternClusterer::load: inconsistent representatives");
+    }
+    clusterer.representatives.reserve(num_representatives);
+    clusterer.representative_features.reserve(num_representatives);
+    for (std::uint64_t k = 0; k < num_representatives; k++) {
+        clusterer.representatives.push_back(PatternAutomaton::load(p, end));
+        const PatternAutomaton & pa = clusterer.representatives.back();
+        if (pa.get_alphabet_size() > densities.size()) {
+            throw std::runtime_error("PatternClusterer::load: missing densities");
+        }
+        clusterer.representative_features.push_back(
+            make_pattern_automaton_features(pa, densities)
+        );
+    }
+    std::vector<std::uint64_t> ids = read_vector<std::uint64_t>(p, end);
+    std::vector<std::uint64_t> ks = read_vector<std::uint64_t>(p, end);
+    std::vector<std::uint64_t> num_matches = read_vector<std::uint64_t>(p, end);
+    bool valid = (
+        ids.size() == num_representatives
+        && ks.size() == num_representatives
+        && num_matches.size() == num_representatives
+    );
+    std::vector<bool> seen(num_representatives, false);
+    for (std::uint64_t k : ks) {
+        if (!valid) break;
+        valid = (k < num_representatives && !seen[k]);
+        if (valid) seen[k] = true;
+    }
+    if (!valid) {
+        throw std::runtime_error("PatternClusterer::load: inconsistent representatives");
+    }
+    clusterer.representative_ids.assign(ids.begin(), ids.end());
+    clusterer.representative_order.assign(ks.begin(), ks.end());
+    clusterer.num_matches.assign(num_matches.begin(), num_matches.end());
+    return clusterer;
+}
+
+std::size_t PatternClusterer::get_num_lines() const {
+    std::lock_guard<std::mutex> lock(this->mutex);
+    return this->num_lines;
+}
+
+PatternAutomata PatternClusterer::get_representatives() const {
+    std::lock_guard<std::mutex> lock(this->mutex);
+    return this->representatives;
+}
+
+std::vector<std::size_t> PatternClusterer::get_representative_ids() const {
+    std::lock_guard<std::mutex> lock(this->mutex);
+    return this->representative_ids;
+}
+
+const Densities & PatternClusterer::get_densities() const {
+    return this->densities;
+}
+
+double PatternClusterer::get_max_dist() const {
+    return this->max_dist;
+}
+
+RepresentativeOrder PatternClusterer::get_order() const {
+    return this->order;
+}
+
+Clusters pattern_clustering(
+    const PatternAutomata & pas,
+    const Densities & densities,
+    double max_dist,
+    bool use_async,
+    LcsCache * lcs_cache,
+    bool use_heuristic,
+    PatternDistanceStats * stats,
+    bool use_prefilter,
+    std::size_t num_threads,
+    RepresentativeOrder order,
+    std::size_t block_size
+) {
+    PatternClusterer clusterer(densities, max_dist, order);
+    return clusterer.add(
+        pas, use_async, lcs_cache, use_heuristic, stats, use_prefilter,
+        num_threads, block_size
+    );
+}
+
+Assignments assign_to_clusters(
+    const PatternAutomata & pas,
+    const PatternAutomata & representative_pas,
+    const Densities & densities,
+    double max_dist,
+    bool use_async,
+    LcsCache * lcs_cache,
+    bool use_heuristic,
+    PatternDistanceStats * stats,
+    bool use_prefilter,
+    std::size_t num_threads
+) {
+    std::size_t n = pas.size();
+    Assignments assignments(n, std::make_pair(UNASSIGNED, max_dist));
+    std::vector<PatternAutomatonFeatures> representative_features;
+    if (use_prefilter) {
+        representative_features.reserve(representative_pas.size());
+        for (const PatternAutomaton & pa : representative_pas) {
+            representative_features.push_back(make_pattern_automaton_features(pa, densities));
+        }
+    }
+    std::vector<std::size_t> ks(representative_pas.size());
+    for (std::size_t k = 0; k < ks.size(); k++) ks[k] = k;
+
+    // The lines are independent: each of them is compared to the
+    // representatives (in order) using the mono thread way.
+    ThreadPool::Job job = [&] (std::size_t begin, std::size_t end) {
+        for (std::size_t i = begin; i < end; i++) {
+            PatternAutomatonFeatures features;
+            if (use_prefilter) features = make_pattern_automaton_features(pas[i], densities);
+            std::size_t k;
+            double dist;
+            std::tie(k, dist) = find_closest_neighbor(
+                representative_pas, ks, pas[i], densities, max_dist, nullptr,
+                lcs_cache, use_heuristic, stats,
+                use_prefilter ? &representative_features : nullptr, &features
+            );
+            if (k != NONE) assignments[i] = std::make_pair(k, dist);
+        }
+    };
+    if (use_async) {
+        ThreadPool pool(num_threads);
+        pool.parallel_for(n, std::max<std::size_t>(1, n / (16 * pool.size())), job);
+    } else {
+        job(0, n);
+    }
+    return assignments;
+}
@@ -1,20 +1,139 @@
 #ifndef PATTERN_CLUSTERING_HPP
 #define PATTERN_CLUSTERING_HPP
 
+#include <limits>
+#include <mutex>
+#include <string>
+#include <utility>
 #include <vector>
 #include "density.hpp"
+#include "lcs_cache.hpp"
+#include "pattern_distance.hpp"
 #include "pattern_automaton.hpp"
 
 typedef std::vector<std::size_t> Clusters;
 typedef std::vector<PatternAutomaton> PatternAutomata;
 typedef std::vector<double> Densities;
 
+// Maps each line with its (representative index, normalized distance) pair.
+typedef std::vector<std::pair<std::size_t, double>> Assignments;
+
+// Representative index of the lines far from every representative.
+const std::size_t UNASSIGNED = std::numeric_limits<std::size_t>::max();
+
+// Order in which the cluster representatives are compared to each line. As
+// the ties are broken in favor of the representative compared first, the
+// policy may (slightly) change the resulting clusters, which are anyway
+// deterministic.
+enum RepresentativeOrder {
+    REPRESENTATIVE_ORDER_CREATION,      // Oldest representatives first
+    REPRESENTATIVE_ORDER_MOVE_TO_FRONT, // Most recently matched (or created) first
+    REPRESENTATIVE_ORDER_FREQUENCY      // Most often matched first (then by creation)
+};
+
+// Online pattern clustering: the lines are added by batches, and each line is
+// only compared to the representatives found so far. Hence, the clusters do
+// not depend on how the lines are split into batches, and match those of
+// pattern_clustering (run on all the lines). The cluster identifiers are the
+// indices of the representatives among all the added lines. The methods may be
+// called concurrently (e.g., from several python threads): the calls that
+// access the clusters are serialized.
+class PatternClusterer
+{
+    private:
+        mutable std::mutex mutex;                               // Protects the members below, except the parameters
+        Densities densities;
+        double max_dist;
+        RepresentativeOrder order;
+        std::size_t num_lines;                                  // Number of lines added so far
+        PatternAutomata representatives;                        // By creation order
+        std::vector<std::size_t> representative_ids;            // Cluster identifier of each representative
+        std::vector<PatternAutomatonFeatures> representative_features;
+        std::vector<std::size_t> representative_order;          // Representatives sorted according to order
+        std::vector<std::size_t> num_matches;                   // Number of lines of each cluster
+
+        void assign(
+            const PatternAutomata & pas,
+            std::size_t i,
+            std::size_t k,
+            Clusters & clusters,
+            const std::vector<PatternAutomatonFeatures> * features
+        );
+    public:
+        PatternClusterer(
+            const Densities & densities,
+            double max_dist = 0.5,
+            RepresentativeOrder order = REPRESENTATIVE_ORDER_CREATION
+        );
+        PatternClusterer(const PatternClusterer & clusterer);
+        PatternClusterer & operator = (const PatternClusterer & clusterer);
+
+        // See pattern_clustering.
+        Clusters add(
+            const PatternAutomata & pattern_automata,
+            bool use_async = true,
+            LcsCache * lcs_cache = nullptr,
+            bool use_heuristic = true,
+            PatternDistanceStats * stats = nullptr,
+            bool use_prefilter = true,
+            std::size_t num_threads = 0,
+            std::size_t block_size = 0
+        );
+
+        // Adds each PatternAutomaton as the representative of a new cluster,
+        // without comparing it to the existing representatives.
+        Clusters add_representatives(const PatternAutomata & pattern_automata);
+
+        // Appends the binary representation of this PatternClusterer
+        // (including its representatives) to out.
+        void save(std::string & out) const;
+
+        // Rebuilds a PatternClusterer from a binary representation written by
+        // save, starting at p. Moves p after it.
+        static PatternClusterer load(const char * & p, const char * end);
+
+        // The clusters may change concurrently, hence these getters return
+        // copies.
+        std::size_t get_num_lines() const;
+        PatternAutomata get_representatives() const;
+        std::vector<std::size_t> get_representative_ids() const;
+        const Densities & get_densities() const;
+        double get_max_dist() const;
+        RepresentativeOrder get_order() const;
+};
+
+// If block_size is positive, the lines are processed by blocks of block_size
+// lines, whose comparisons to the existing representatives are run in
+// parallel (if use_async). The clusters are the same as if block_size == 0.
 Clusters pattern_clustering(
     const PatternAutomata & pattern_automata,
     const Densities & densities,
     double max_dist = 0.5,
-    bool use_async = true
+    bool use_async = true,
+    LcsCache * lcs_cache = nullptr,
+    bool use_heuristic = true,
+    PatternDistanceStats * stats = nullptr,
+    bool use_prefilter = true,
+    std::size_t num_threads = 0, // If use_async, 0 means one thread per core
+    RepresentativeOrder order = REPRESENTATIVE_ORDER_CREATION,
+    std::size_t block_size = 0
 );
 
-#endif
+// Assigns each line (see pas) to its closest representative (see
+// representative_pas), if closer than max_dist, like pattern_clustering would
+// do (ties are broken in favor of the first representative), but without
+// creating any new cluster. The lines are processed in parallel if use_async.
+Assignments assign_to_clusters(
+    const PatternAutomata & pas,
+    const PatternAutomata & representative_pas,
+    const Densities & densities,
+    double max_dist = 0.5,
+    bool use_async = true,
+    LcsCache * lcs_cache = nullptr,
+    bool use_heuristic = true,
+    PatternDistanceStats * stats = nullptr,
+    bool use_prefilter = true,
+    std::size_t num_threads = 0 // If use_async, 0 means one thread per core
+);
 
+#endif
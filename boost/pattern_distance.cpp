@@ -1,131 +1,415 @@
 #include "pattern_distance.hpp"
 
+#include <algorithm>                        // std::push_heap, std::pop_heap, std::sort
+#include <cstdint>                          // std::uint32_t
+#include <functional>                       // std::greater
 #include <limits>                           // std::numeric_limits
-#include <queue>                            // std::priority_queue
 #include <string>                           // std::string
 #include <tuple>                            // std::tuple
-#include <boost/numeric/ublas/matrix.hpp>   // boost::numeric::ublas::matrix
+#include <vector>                           // std::vector
 #include "lcs_distance.hpp"
+#include "string_view.hpp"
 
 #include "stl_util.hpp"
 
-// It's important to put the cumulated distance first, so that heap_item_t are
-// naturally correctly ordered in heap_t.
+// Relative tolerance used before aborting a search, which absorbs the
+// rounding errors made when summing the estimated distance: the estimated
+// distance of a prefix may exceed the distance of the whole path by a few ulps.
+#define ABORT_TOLERANCE 1e-9
+
+// It's important to put the estimated distance first, so that heap_item_t are
+// naturally correctly ordered in the heap. Without heuristic, the estimated
+// distance equals the cumulated distance.
 typedef std::tuple<
-    double,      // d: cumulated distance
+    double,      // f: estimated distance (cumulated distance + heuristic)
     std::size_t, // i1: current position in w1
-    std::size_t  // i2: current position in w2
+    std::size_t, // i2: current position in w2
+    double       // d: cumulated distance
 > heap_item_t;
 
 // For debug, so that after include "stl_utils.hpp", you may use: std::cout << heap << std::endl;
 std::ostream & operator << (std::ostream & out, const heap_item_t & h) {
-    out << "<i1="  << std::get<0>(h)
-        << ", i2=" << std::get<1>(h)
-        << ", d="  << std::get<2>(h)
+    out << "<f="    << std::get<0>(h)
+        << ", i1="  << std::get<1>(h)
+        << ", i2="  << std::get<2>(h)
+        << ", d="   << std::get<3>(h)
         << ">";
     return out;
 }
 
-typedef std::priority_queue<
-    heap_item_t,
-    std::vector<heap_item_t>,
-    std::greater<heap_item_t>
-> heap_t; // heap_min
+PatternDistanceStats::PatternDistanceStats():
+    num_calls(0),
+    num_heap_pops(0),
+    num_skips(0)
+{}
 
-double pattern_distance(
+void PatternDistanceStats::update(std::size_t num_heap_pops) {
+    this->num_calls++;
+    this->num_heap_pops += num_heap_pops;
+}
+
+void PatternDistanceStats::skip() {
+    this->num_skips++;
+}
+
+std::size_t PatternDistanceStats::calls() const {
+    return this->num_calls;
+}
+
+std::size_t PatternDistanceStats::heap_pops() const {
+    return this->num_heap_pops;
+}
+
+std::size_t PatternDistanceStats::skips() const {
+    return this->num_skips;
+}
+
+void PatternDistanceStats::clear() {
+    this->num_calls = 0;
+    this->num_heap_pops = 0;
+    this->num_skips = 0;
+}
+
+// Lowers each weights[c] to the density of the edges of g (whose label is
+// less than densities.size()) covering an occurrence of c, if smaller.
+static void make_char_weights(
+    const PatternAutomaton & g,
+    const std::vector<Density> & densities,
+    double * weights // 256 entries
+) {
+    const std::string & w = g.get_word();
+    std::size_t k_max = densities.size();
+    for (std::size_t q = 0; q < g.num_vertices(); q++) {
+        for (auto e = g.out_edges_begin(q); e != g.out_edges_end(q); e++) {
+            if (e->label >= k_max || densities[e->label] >= 1.0) continue;
+            double density = densities[e->label];
+            // Nothing ties the vertices of a hand-built PatternAutomaton to its word.
+            std::size_t j = std::min<std::size_t>(e->target, w.size());
+            for (std::size_t i = q; i < j; i++) {
+                double & weight = weights[static_cast<unsigned char>(w[i])];
+                weight = std::min(weight, density);
+            }
+        }
+    }
+}
+
+PatternAutomatonFeatures make_pattern_automaton_features(
+    const PatternAutomaton & pa,
+    const std::vector<Density> & densities
+) {
+    const std::string & w = pa.get_word();
+    double weights[256];
+    std::uint32_t counts[256] = {0};
+    std::fill(weights, weights + 256, 1.0);
+    make_char_weights(pa, densities, weights);
+    for (char a : w) counts[static_cast<unsigned char>(a)]++;
+
+    PatternAutomatonFeatures features;
+    features.length = w.size();
+    for (std::size_t c = 0; c < 256; c++) {
+        if (!counts[c]) continue;
+        features.chars.push_back(static_cast<unsigned char>(c));
+        features.counts.push_back(counts[c]);
+        features.weights.push_back(weights[c]);
+    }
+    return features;
+}
+
+double pattern_distance_lower_bound(
+    const PatternAutomatonFeatures & f1,
+    const PatternAutomatonFeatures & f2
+) {
+    // This is the heuristic used by pattern_distance at (0, 0), without
+    // grouping the characters having the same weight.
+    double h = 0.0;
+    std::size_t i1 = 0, i2 = 0, n1 = f1.chars.size(), n2 = f2.chars.size();
+    while (i1 < n1 || i2 < n2) {
+        if (i2 == n2 || (i1 < n1 && f1.chars[i1] < f2.chars[i2])) {
+            h += f1.weights[i1] * f1.counts[i1];
+            i1++;
+        } else if (i1 == n1 || f2.chars[i2] < f1.chars[i1]) {
+            h += f2.weights[i2] * f2.counts[i2];
+            i2++;
+        } else {
+            std::uint32_t
+                c1 = f1.counts[i1],
+                c2 = f2.counts[i2];
+            h += std::min(f1.weights[i1], f2.weights[i2]) * (c1 > c2 ? c1 - c2 : c2 - c1);
+            i1++;
+            i2++;
+        }
+    }
+    return h;
+}
+
+// Heap min, managed using std::push_heap and std::pop_heap.
+typedef std::vector<heap_item_t> heap_t;
+
+// Assigns a contiguous index to each vertex of g involved in at least one
+// edge (and to 0 and the last vertex), as the other vertices can never be
+// reached during the search. Returns the number of indexed vertices.
+static std::size_t index_vertices(
+    const PatternAutomaton & g,
+    std::vector<std::uint32_t> & index
+) {
+    const std::uint32_t UNINDEXED = std::numeric_limits<std::uint32_t>::max();
+    std::size_t n = g.num_vertices();
+    index.assign(n, UNINDEXED);
+    if (n == 0) return 0;
+    index[0] = index[n - 1] = 0;
+    for (std::size_t q = 0; q < n; q++) {
+        for (auto e = g.out_edges_begin(q); e != g.out_edges_end(q); e++) {
+            index[q] = index[e->target] = 0;
+        }
+    }
+    std::size_t num_indexed = 0;
+    for (std::uint32_t & i : index) {
+        if (i != UNINDEXED) i = num_indexed++;
+    }
+    return num_indexed;
+}
+
+// The distances are divided by scale before being compared to max_dist (and
+// to *shared_max_dist, if not null). The search returns -1 unless the
+// distance d satisfies d / scale < max_dist (and d / scale <= *shared_max_dist).
+// The pending paths are only pruned if they exceed these bounds by more than
+// ABORT_TOLERANCE, so that the result never depends on the rounding errors of
+// the estimated distances, nor on when *shared_max_dist is lowered. In
+// particular, a candidate tied with *shared_max_dist is never aborted.
+static double pattern_distance_impl(
     const PatternAutomaton & g1,
     const PatternAutomaton & g2,
     const std::vector<Density> & densities,
-    double max_dist
+    double max_dist,
+    LcsCache * lcs_cache,
+    bool use_heuristic,
+    PatternDistanceStats * stats,
+    const std::atomic<double> * shared_max_dist,
+    double scale
 ) {
     // We assume that vertex identifiers of g1 (resp. g2) conforms to w1 (resp. w2) indices.
     // This means that vertex i1 (resp. i2)  means that we have reached w1[i1] (resp. w2[i2]).
-    const std::string &
-        w1 = g1.get_word(),
-        w2 = g2.get_word();
+    const std::string
+        & w1 = g1.get_word(),
+        & w2 = g2.get_word();
     std::size_t
         w1_len = w1.size(),
         w2_len = w2.size();
-    unsigned k_max = densities.size();
+    std::size_t k_max = densities.size();
+
+    // The buffers are reused from one call to the next one (in a given thread),
+    // so that the search does not allocate memory once they are large enough.
+    // The visited matrix is only indexed by the pairs of vertices
+    // that may be reached, and hence scales with the size of the PAs.
+    static thread_local heap_t heap;
+    static thread_local std::vector<bool> visited;
+    static thread_local std::vector<std::uint32_t> index1, index2;
+    std::greater<heap_item_t> heap_greater;
+    heap.clear();
+    std::size_t num_indexed2 = index_vertices(g2, index2);
+    visited.assign(index_vertices(g1, index1) * num_indexed2, false);
 
-    boost::numeric::ublas::matrix<bool> visited(w1_len + 1, w2_len + 1, false);
-    heap_t heap;
-    heap.push(std::make_tuple(0, 0, 0.0));
+    // Heuristic: each character c is given the weight weights[c], i.e., the
+    // smallest cost of an occurrence of c, which is 1 for the horizontal and
+    // vertical edges, and densities[k] for a diagonal edge labeled by k (that
+    // only involves the characters of the edges labeled by k). As the LCS distance between two infixes is at least the L1 distance
+    // between their character histograms, an edge costs at least the sum over
+    // c of weights[c] times the variation of the difference between the number
+    // of c in the suffixes of w1 and w2. Hence the heuristic below (where the
+    // characters having the same weight are grouped) is consistent.
+    static thread_local std::vector<double> class_weights;
+    static thread_local std::vector<std::uint32_t> suffix_counts1, suffix_counts2;
+    std::size_t num_classes = 0;
+    if (use_heuristic) {
+        double weights[256];
+        std::fill(weights, weights + 256, 1.0);
+        make_char_weights(g1, densities, weights);
+        make_char_weights(g2, densities, weights);
+        class_weights.assign(weights, weights + 256);
+        std::sort(class_weights.begin(), class_weights.end());
+        class_weights.erase(std::unique(class_weights.begin(), class_weights.end()), class_weights.end());
+        num_classes = class_weights.size();
+        std::size_t classes[256];
+        for (std::size_t c = 0; c < 256; c++) {
+            classes[c] = std::lower_bound(class_weights.begin(), class_weights.end(), weights[c]) - class_weights.begin();
+        }
+        auto make_suffix_counts = [&] (const std::string & w, std::vector<std::uint32_t> & suffix_counts) {
+            std::size_t n = w.size();
+            suffix_counts.assign((n + 1) * num_classes, 0);
+            for (std::size_t i = n; i-- > 0; ) {
+                std::copy(
+                    suffix_counts.begin() + (i + 1) * num_classes,
+                    suffix_counts.begin() + (i + 2) * num_classes,
+                    suffix_counts.begin() + i * num_classes
+                );
+                suffix_counts[i * num_classes + classes[static_cast<unsigned char>(w[i])]]++;
+            }
+        };
+        make_suffix_counts(w1, suffix_counts1);
+        make_suffix_counts(w2, suffix_counts2);
+    }
+    auto heuristic = [&] (std::size_t i1, std::size_t i2) -> double {
+        // The vertices beyond the end of the word (in a hand-built
+        // PatternAutomaton) have an empty suffix.
+        const std::uint32_t
+            * counts1 = suffix_counts1.data() + std::min(i1, w1_len) * num_classes,
+            * counts2 = suffix_counts2.data() + std::min(i2, w2_len) * num_classes;
+        double h = 0.0;
+        for (std::size_t c = 0; c < num_classes; c++) {
+            h += class_weights[c] * (
+                counts1[c] > counts2[c] ? counts1[c] - counts2[c] : counts2[c] - counts1[c]
+            );
+        }
+        return h;
+    };
 
     // Lambda function: pushes the new item to the heap
-    auto heap_push = [&heap] (
+    auto heap_push = [&heap_greater, &heuristic, use_heuristic] (
         PatternAutomaton::State i1_next,
         PatternAutomaton::State i2_next,
         double current_dist,
         double edge_weight
     ) -> void {
+        double d = current_dist + edge_weight;
         heap_item_t heap_item = std::make_tuple(
-            current_dist + edge_weight,
-            i1_next, i2_next
+            use_heuristic ? d + heuristic(i1_next, i2_next) : d,
+            i1_next, i2_next, d
         );
-        heap.push(heap_item);
-    };
-
-    // Lambda function: returns the reached state (in the edit graph sense).
-    auto edit_graph_delta = [] (
-        std::size_t i,
-        std::size_t k,
-        const PatternAutomaton & g
-    ) -> std::size_t {
-        PatternAutomaton::State j = g.delta(i, k);
-        return j == BOTTOM ? i : std::size_t(j);
+        heap.push_back(heap_item);
+        std::push_heap(heap.begin(), heap.end(), heap_greater);
     };
 
+    heap_push(0, 0, 0.0, 0.0);
+    std::size_t num_heap_pops = 0;
+    double result = -2;
     while (!heap.empty()) {
-        double current_dist;
+        double estimated_dist, current_dist;
         std::size_t i1, i2;
-        std::tie(current_dist, i1, i2) = heap.top();
-        heap.pop();
-        if (current_dist >= max_dist) {
-            return -1;
-        } else if (i1 == w1_len && i2 == w2_len) {
-            return current_dist;
-        } else if (visited(i1, i2)) {
+        std::pop_heap(heap.begin(), heap.end(), heap_greater);
+        std::tie(estimated_dist, i1, i2, current_dist) = heap.back();
+        heap.pop_back();
+        num_heap_pops++;
+        double shared_dist = shared_max_dist ?
+            shared_max_dist->load(std::memory_order_relaxed) :
+            std::numeric_limits<double>::infinity();
+        if (i1 == w1_len && i2 == w2_len) {
+            bool is_valid = (current_dist / scale < max_dist && current_dist / scale <= shared_dist);
+            result = is_valid ? current_dist : -1;
+            break;
+        } else if (
+            estimated_dist / scale >= max_dist * (1 + ABORT_TOLERANCE)
+            || estimated_dist / scale > shared_dist * (1 + ABORT_TOLERANCE)
+        ) {
+            result = -1;
+            break;
+        }
+        std::size_t v = index1[i1] * num_indexed2 + index2[i2];
+        if (visited[v]) {
             continue;
         }
-        visited(i1, i2) = true;
-        for (std::size_t k = 0; k < k_max; k++) {
+        visited[v] = true;
+        // The out-edges of i1 and i2 are sorted by label: they are merged so
+        // that only the labels of the actual out-edges are processed.
+        const PatternAutomaton::Edge
+            * e1 = g1.out_edges_begin(i1),
+            * e1_end = g1.out_edges_end(i1),
+            * e2 = g2.out_edges_begin(i2),
+            * e2_end = g2.out_edges_end(i2);
+        while (e1 != e1_end || e2 != e2_end) {
+            std::size_t k = std::min(
+                e1 != e1_end ? e1->label : k_max,
+                e2 != e2_end ? e2->label : k_max
+            );
+            if (k >= k_max) break;
+            bool
+                has_edge1 = (e1 != e1_end && e1->label == k),
+                has_edge2 = (e2 != e2_end && e2->label == k);
             std::size_t
-                j1 = edit_graph_delta(i1, k, g1),
-                j2 = edit_graph_delta(i2, k, g2),
+                j1 = has_edge1 ? std::size_t(e1->target) : i1,
+                j2 = has_edge2 ? std::size_t(e2->target) : i2,
                 n1 = j1 - i1,
                 n2 = j2 - i2;
+            if (has_edge1) e1++;
+            if (has_edge2) e2++;
 
-            if (j1 != i1 && j2 != i2) {
+            if (has_edge1 && has_edge2) {
                 // Diagonal edge
-                std::string
-                    s1 = w1.substr(i1, n1),
-                    s2 = w2.substr(i2, n2);
+                StringView
+                    s1 = g1.get_infix(i1, j1),
+                    s2 = g2.get_infix(i2, j2);
                 double
-                    lcs_weight = (s1 == s2 ? 0.0 : n1 + n2 - 2 * lcs_length(s1, s2)),
+                    lcs_weight = (
+                        s1 == s2 ? 0.0 :
+                        n1 + n2 - 2 * (
+                            lcs_cache ? lcs_cache->lcs_length(s1, s2) :
+                            lcs_length(s1, s2)
+                        )
+                    ),
                     edge_weight = lcs_weight * densities[k];
                 heap_push(j1, j2, current_dist, edge_weight);
             }
-            if (j1 != i1) {
+            if (has_edge1) {
                 // Horizontal edge
                 heap_push(j1, i2, current_dist, n1);
             }
-            if (j2 != i2) {
+            if (has_edge2) {
                 // Vertical edge
                 heap_push(i1, j2, current_dist, n2);
             }
         }
     }
-    return -2;
+    if (stats) stats->update(num_heap_pops);
+    return result;
+}
+
+double pattern_distance(
+    const PatternAutomaton & g1,
+    const PatternAutomaton & g2,
+    const std::vector<Density> & densities,
+    double max_dist,
+    LcsCache * lcs_cache,
+    bool use_heuristic,
+    PatternDistanceStats * stats
+) {
+    return pattern_distance_impl(
+        g1, g2, densities, max_dist, lcs_cache, use_heuristic, stats,
+        nullptr, 1.0
+    );
 }
 
 double pattern_distance_normalized(
     const PatternAutomaton & g1,
     const PatternAutomaton & g2,
     const std::vector<Density> & densities,
-    double max_dist = std::numeric_limits<double>::max()
+    double max_dist,
+    LcsCache * lcs_cache,
+    bool use_heuristic,
+    PatternDistanceStats * stats
+) {
+    size_t norm = g1.get_word().size() + g2.get_word().size();
+    if (norm == 0) return -1; // Undefined for two empty words
+    double d = pattern_distance_impl(
+        g1, g2, densities, max_dist, lcs_cache, use_heuristic, stats,
+        nullptr, norm
+    );
+    return d <= 0 ? d : d / norm;
+}
+
+double pattern_distance_normalized_bounded(
+    const PatternAutomaton & g1,
+    const PatternAutomaton & g2,
+    const std::vector<Density> & densities,
+    double max_dist,
+    const std::atomic<double> & shared_max_dist,
+    LcsCache * lcs_cache,
+    bool use_heuristic,
+    PatternDistanceStats * stats
 ) {
     size_t norm = g1.get_word().size() + g2.get_word().size();
-    double d = pattern_distance(g1, g2, densities, max_dist * norm);
+    if (norm == 0) return -1; // Undefined for two empty words
+    double d = pattern_distance_impl(
+        g1, g2, densities, max_dist, lcs_cache, use_heuristic, stats,
+        &shared_max_dist, norm
+    );
     return d <= 0 ? d : d / norm;
 }
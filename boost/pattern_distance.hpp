@@ -1,22 +1,87 @@
 #ifndef PATTERN_DISTANCE_HPP
 #define PATTERN_DISTANCE_HPP
 
-#include <vector>
+#include <atomic>     // std::atomic
+#include <cstdint>    // std::uint32_t
+#include <vector>     // std::vector
 #include "density.hpp"
+#include "lcs_cache.hpp"
 #include "pattern_automaton.hpp"
 
+// Counters updated by pattern_distance (if passed). It may be shared by
+// concurrent pattern_distance calls.
+class PatternDistanceStats
+{
+    private:
+        std::atomic<std::size_t> num_calls;
+        std::atomic<std::size_t> num_heap_pops;
+        std::atomic<std::size_t> num_skips;
+    public:
+        PatternDistanceStats();
+        void update(std::size_t num_heap_pops);
+        void skip();
+        std::size_t calls() const;
+        std::size_t heap_pops() const;
+        std::size_t skips() const;
+        void clear();
+};
+
+// Summary of a PatternAutomaton, computed once, used to bound the pattern
+// distance between two PAs without running any search.
+struct PatternAutomatonFeatures
+{
+    std::size_t length;                 // Length of the word
+    std::vector<unsigned char> chars;   // Distinct characters of the word (sorted)
+    std::vector<std::uint32_t> counts;  // Number of occurrences of each character
+    std::vector<double> weights;        // Cheapest cost of each character (at most 1)
+};
+
+PatternAutomatonFeatures make_pattern_automaton_features(
+    const PatternAutomaton & pa,
+    const std::vector<Density> & densities
+);
+
+// Lower bound of pattern_distance(pa1, pa2, ...), where f1 and f2 are the
+// features of pa1 and pa2. It runs in O(|f1.chars| + |f2.chars|).
+double pattern_distance_lower_bound(
+    const PatternAutomatonFeatures & f1,
+    const PatternAutomatonFeatures & f2
+);
+
+// If use_heuristic is true, the search is an A* guided by an admissible
+// lower bound of the remaining distance. The returned distance is unchanged.
 double pattern_distance(
     const PatternAutomaton & pa1,
     const PatternAutomaton & pa2,
     const std::vector<Density> & densities,
-    double max_dist // Not normalized
+    double max_dist, // Not normalized
+    LcsCache * lcs_cache = nullptr,
+    bool use_heuristic = false,
+    PatternDistanceStats * stats = nullptr
 );
 
 double pattern_distance_normalized(
     const PatternAutomaton & pa1,
     const PatternAutomaton & pa2,
     const std::vector<Density> & densities,
-    double max_dist // Normalized, between 0.0 and 1.0
+    double max_dist, // Normalized, between 0.0 and 1.0
+    LcsCache * lcs_cache = nullptr,
+    bool use_heuristic = false,
+    PatternDistanceStats * stats = nullptr
+);
+
+// Like pattern_distance_normalized, but the search is also aborted (and
+// returns -1) as soon as the (normalized) distance is known to be greater
+// than shared_max_dist, which may be lowered concurrently by other threads.
+double pattern_distance_normalized_bounded(
+    const PatternAutomaton & pa1,
+    const PatternAutomaton & pa2,
+    const std::vector<Density> & densities,
+    double max_dist, // Normalized, between 0.0 and 1.0
+    const std::atomic<double> & shared_max_dist,
+    LcsCache * lcs_cache = nullptr,
+    bool use_heuristic = false,
+    PatternDistanceStats * stats = nullptr
 );
 
 #endif
@@ -0,0 +1,64 @@
+#ifndef SERIALIZATION_HPP
+#define SERIALIZATION_HPP
+
+#include <cstdint>    // std::uint64_t
+#include <cstring>    // std::memcpy
+#include <stdexcept>  // std::runtime_error
+#include <string>     // std::string
+#include <vector>     // std::vector
+
+// Helpers used to write (resp. read) values to (resp. from) a binary buffer.
+// The values are stored using the native byte order, so that loading a
+// buffer boils down to a few memcpy. The read_* functions move p after the
+// read value, and throw a std::runtime_error if the buffer is too short.
+
+template <typename T>
+inline void write_value(std::string & out, const T & x) {
+    out.append(reinterpret_cast<const char *>(&x), sizeof(T));
+}
+
+template <typename T>
+inline T read_value(const char * & p, const char * end) {
+    T x;
+    if (static_cast<std::size_t>(end - p) < sizeof(T)) {
+        throw std::runtime_error("read_value: truncated buffer");
+    }
+    std::memcpy(&x, p, sizeof(T));
+    p += sizeof(T);
+    return x;
+}
+
+template <typename T>
+inline void write_vector(std::string & out, const std::vector<T> & v) {
+    write_value<std::uint64_t>(out, v.size());
+    out.append(reinterpret_cast<const char *>(v.data()), v.size() * sizeof(T));
+}
+
+template <typename T>
+inline std::vector<T> read_vector(const char * & p, const char * end) {
+    std::uint64_t n = read_value<std::uint64_t>(p, end);
+    if (static_cast<std::uint64_t>(end - p) / sizeof(T) < n) {
+        throw std::runtime_error("read_vector: truncated buffer");
+    }
+    std::vector<T> v(n);
+    std::memcpy(v.data(), p, n * sizeof(T));
+    p += n * sizeof(T);
+    return v;
+}
+
+inline void write_string(std::string & out, const std::string & s) {
+    write_value<std::uint64_t>(out, s.size());
+    out.append(s);
+}
+
+inline std::string read_string(const char * & p, const char * end) {
+    std::uint64_t n = read_value<std::uint64_t>(p, end);
+    if (static_cast<std::uint64_t>(end - p) < n) {
+        throw std::runtime_error("read_string: truncated buffer");
+    }
+    std::string s(p, n);
+    p += n;
+    return s;
+}
+
+#endif
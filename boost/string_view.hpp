@@ -0,0 +1,10 @@
+#ifndef STRING_VIEW_HPP
+#define STRING_VIEW_HPP
+
+// The C++ code is compiled in C++11, hence boost::string_view is used in
+// place of std::string_view.
+#include <boost/utility/string_view.hpp>
+
+typedef boost::string_view StringView;
+
+#endif
@@ -0,0 +1,88 @@
+#include "thread_pool.hpp"
+
+#include <algorithm>  // std::min, std::max
+
+ThreadPool::ThreadPool(std::size_t num_threads):
+    job(nullptr),
+    num_items(0),
+    chunk_size(1),
+    next_item(0),
+    num_busy(0),
+    generation(0),
+    stopping(false)
+{
+    if (num_threads == 0) {
+        num_threads = std::max(1u, std::thread::hardware_concurrency());
+    }
+    this->threads.reserve(num_threads);
+    for (std::size_t i = 0; i < num_threads; i++) {
+        this->threads.emplace_back(&ThreadPool::work, this);
+    }
+}
+
+ThreadPool::~ThreadPool() {
+    {
+        std::lock_guard<std::mutex> lock(this->mutex);
+        this->stopping = true;
+    }
+    this->cv_work.notify_all();
+    for (std::thread & thread : this->threads) {
+        thread.join();
+    }
+}
+
+std::size_t ThreadPool::size() const {
+    return this->threads.size();
+}
+
+void ThreadPool::work() {
+    std::unique_lock<std::mutex> lock(this->mutex);
+    std::size_t last_generation = 0;
+    while (true) {
+        this->cv_work.wait(lock, [&] {
+            return this->stopping || this->generation != last_generation;
+        });
+        if (this->stopping) return;
+        last_generation = this->generation;
+        this->num_busy++;
+        while (this->next_item < this->num_items) {
+            std::size_t
+                begin = this->next_item,
+                end = std::min(begin + this->chunk_size, this->num_items);
+            this->next_item = end;
+            const Job & job = *this->job;
+            lock.unlock();
+            try {
+                job(begin, end);
+                lock.lock();
+            } catch (...) {
+                lock.lock();
+                if (!this->error) this->error = std::current_exception();
+                this->next_item = this->num_items;
+            }
+        }
+        if (--this->num_busy == 0) {
+            this->cv_done.notify_all();
+        }
+    }
+}
+
+void ThreadPool::parallel_for(std::size_t num_items, std::size_t chunk_size, const Job & job) {
+    if (num_items == 0) return;
+    std::unique_lock<std::mutex> lock(this->mutex);
+    this->job = &job;
+    this->num_items = num_items;
+    this->chunk_size = std::max<std::size_t>(chunk_size, 1);
+    this->next_item = 0;
+    this->error = nullptr;
+    this->generation++;
+    this->cv_work.notify_all();
+    this->cv_done.wait(lock, [&] {
+        return this->next_item >= this->num_items && this->num_busy == 0;
+    });
+    this->job = nullptr;
+    std::exception_ptr error = this->error;
+    this->error = nullptr;
+    lock.unlock();
+    if (error) std::rethrow_exception(error);
+}
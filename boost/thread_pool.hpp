@@ -0,0 +1,50 @@
+#ifndef THREAD_POOL_HPP
+#define THREAD_POOL_HPP
+
+#include <condition_variable> // std::condition_variable
+#include <exception>          // std::exception_ptr
+#include <functional>         // std::function
+#include <mutex>              // std::mutex
+#include <thread>             // std::thread
+#include <vector>             // std::vector
+
+// Fixed-size pool of worker threads, started once and reused by each
+// parallel_for call. The workers sleep (rather than spin) when idle.
+class ThreadPool
+{
+    public:
+        // Processes the items [begin, end).
+        typedef std::function<void(std::size_t, std::size_t)> Job;
+    private:
+        std::vector<std::thread> threads;
+        std::mutex mutex;
+        std::condition_variable cv_work;    // Notified when a job is queued
+        std::condition_variable cv_done;    // Notified when the job is done
+        const Job * job;                    // The current job
+        std::size_t num_items;              // Number of items of the current job
+        std::size_t chunk_size;             // Number of items processed at once
+        std::size_t next_item;              // First item not yet processed
+        std::size_t num_busy;               // Number of workers running the job
+        std::size_t generation;             // Incremented for each job
+        bool stopping;
+        std::exception_ptr error;           // First exception raised by the job
+
+        void work();
+    public:
+        // If num_threads is 0, std::thread::hardware_concurrency() threads are used.
+        ThreadPool(std::size_t num_threads = 0);
+        ~ThreadPool();
+        ThreadPool(const ThreadPool &) = delete;
+        ThreadPool & operator = (const ThreadPool &) = delete;
+
+        std::size_t size() const;
+
+        // Splits [0, num_items) into chunks of (at most) chunk_size items, runs
+        // job on each of them using the worker threads, and returns once all
+        // of them are processed. If job throws, the remaining chunks are
+        // skipped and the exception is rethrown. It must not be called
+        // concurrently.
+        void parallel_for(std::size_t num_items, std::size_t chunk_size, const Job & job);
+};
+
+#endif
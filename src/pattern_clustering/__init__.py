@@ -14,6 +14,8 @@ __license__    = "BSD-3"
 __version__ = '1.0.0'  # Use single quotes for bumpversion (see setup.cfg)
 
 from .boost import *
+from .cache import *
+from .executor import *
 from .html import *
 from .language_density import *
 from .multi_grep import *
@@ -12,7 +12,9 @@ __email__ = "marc-olivier.buob@nokia-bell-labs.com, maxime.raynal@nokia.com"
 __copyright__ = "Copyright (C) 2022, Nokia"
 __license__ = "BSD-3"
 
-import multiprocessing, string, sys
+import json, mmap, string, struct, sys, threading
+from array import array
+from functools import partial
 from pprint import pformat
 from pybgl.singleton import Singleton
 
@@ -20,9 +22,17 @@ try:
     # Import from C++
     # Naming convention: symbols from pc_boost are prefixed by _ to prevent
     # them to clash with those from the python module.
+    from pattern_clustering.pattern_clustering import LcsCache
+    from pattern_clustering.pattern_clustering import assign_to_clusters as _assign_to_clusters
     from pattern_clustering.pattern_clustering import PatternAutomaton as _PatternAutomaton
+    from pattern_clustering.pattern_clustering import PatternDistanceStats
+    from pattern_clustering.pattern_clustering import MultiGrep as _MultiGrep
+    from pattern_clustering.pattern_clustering import MultiGrepStrategy
+    from pattern_clustering.pattern_clustering import make_pattern_automata as _make_pattern_automata
     from pattern_clustering.pattern_clustering import pattern_distance as _pattern_distance
     from pattern_clustering.pattern_clustering import pattern_clustering as _pattern_clustering
+    from pattern_clustering.pattern_clustering import PatternClusterer as _PatternClusterer
+    from pattern_clustering.pattern_clustering import RepresentativeOrder
     from pattern_clustering.pattern_clustering import pattern_distance_normalized
 except ImportError:
     print("pattern_clustering is not yet installed and so the C++ objects cannot be imported!", file=sys.stderr)
@@ -30,6 +40,8 @@ except ImportError:
     print(sys.path)
     sys.exit()
 
+from .cache import default_disk_cache, dfa_from_dict, dfa_to_dict, make_map_name_dfa_density
+from .executor import PatternAutomatonExecutor
 from .language_density import language_density
 from .pattern_automaton import *
 from .regexp import MAP_NAME_RE, make_dfa_any, make_map_name_dfa
@@ -59,14 +71,34 @@ def make_name_density(map_name_dfa: dict, alphabet: str) -> dict:
     return map_name_density
 
 
-class PatternClusteringEnv(metaclass=Singleton):
+class _PatternClusteringEnvMeta(Singleton):
+    """
+    Metaclass of ``PatternClusteringEnv``, which builds the default pattern
+    collection on first use rather than at import time.
+    """
+    def __getattr__(cls, name: str):
+        if name in ("map_name_dfa", "map_name_density"):
+            # The alphabet may have been set by the caller in the meantime.
+            cls.set_default_patterns()
+            return getattr(cls, name)
+        raise AttributeError(name)
+
+
+class PatternClusteringEnv(metaclass=_PatternClusteringEnvMeta):
     alphabet = set(string.printable)
     map_name_re = MAP_NAME_RE
-    map_name_dfa = make_map_name_dfa(
-        map_name_re,
-        ["any", "float", "hexa", "int", "ipv4", "spaces", "uint", "word"]
-    )
-    map_name_density = make_name_density(map_name_dfa, alphabet)
+    # map_name_dfa and map_name_density are set on first use (see _PatternClusteringEnvMeta).
+
+    # Maps each (patterns, alphabet) pair with the corresponding (map_name_dfa, map_name_density).
+    cache = dict()
+
+    # The on-disk cache storing the compiled DFAs and their densities, or None.
+    # It is disabled unless $PATTERN_CLUSTERING_CACHE_DIR is set (see
+    # default_disk_cache), but may be set to any PatternCache instance.
+    disk_cache = default_disk_cache()
+
+    def __getattr__(self, name: str):
+        return getattr(type(self), name)
 
     @classmethod
     def reset(cls):
@@ -74,6 +106,14 @@ class PatternClusteringEnv(metaclass=Singleton):
         Reset the ``PatternClusteringEnv`` singleton to its default settings.
         """
         cls.alphabet = set(string.printable)
+        cls.set_default_patterns()
+
+    @classmethod
+    def set_default_patterns(cls):
+        """
+        Defines the default patterns used in the pattern clustering,
+        without changing the alphabet.
+        """
         cls.set_patterns(
             MAP_NAME_RE,
             ["any", "float", "hexa", "int", "ipv4", "spaces", "uint", "word"]
@@ -83,6 +123,9 @@ class PatternClusteringEnv(metaclass=Singleton):
     def set_patterns(cls, map_name_re: dict, names: iter =None):
         """
         Defines the patterns used in the pattern clustering.
+        The DFAs and densities are memoized, so that switching back to
+        an already used pattern collection is free. They are also stored
+        in ``disk_cache`` (if set) so that they are not recomputed by the next processes.
 
         Args:
             map_name_re (dict): A dictionary mapping each pattern (``str``)
@@ -92,8 +135,27 @@ class PatternClusteringEnv(metaclass=Singleton):
         cls.map_name_re = map_name_re
         if not names:
             names = list(map_name_re.keys())
-        cls.map_name_dfa = make_map_name_dfa(map_name_re, names)
-        cls.map_name_density = make_name_density(cls.map_name_dfa, cls.alphabet)
+        key = (
+            tuple((name, map_name_re[name]) for name in names),
+            tuple(sorted(cls.alphabet))
+        )
+        if key not in cls.cache:
+            if cls.disk_cache is None:
+                map_name_dfa = make_map_name_dfa(map_name_re, names)
+                map_name_density = make_name_density(map_name_dfa, cls.alphabet)
+            else:
+                (map_name_dfa, map_name_density) = make_map_name_dfa_density(
+                    map_name_re, names, cls.alphabet, cls.disk_cache
+                )
+                if "any" not in map_name_density:
+                    map_name_density["any"] = language_density(
+                        make_dfa_any(cls.alphabet),
+                        cls.alphabet
+                    )
+            cls.cache[key] = (map_name_dfa, map_name_density)
+        (map_name_dfa, map_name_density) = cls.cache[key]
+        cls.map_name_dfa = dict(map_name_dfa)
+        cls.map_name_density = dict(map_name_density)
 
     @classmethod
     def densities(cls) -> list:
@@ -110,6 +172,106 @@ class PatternClusteringEnv(metaclass=Singleton):
             f"map_name_dfa = {pformat(self.map_name_dfa)}",
         ])
 
+# Maps each MultiGrepFunctor supported by the C++ code with its C++ counterpart.
+# MultiGrepFunctorGreedy is not listed: its output depends on the order in which
+# simultaneous matches are reported, while MultiGrepStrategy.GREEDY always
+# processes them by increasing start index.
+MAP_MAKE_MG_STRATEGY = {
+    None: MultiGrepStrategy.LARGEST,
+    MultiGrepFunctorAll: MultiGrepStrategy.ALL,
+    MultiGrepFunctorLargest: MultiGrepStrategy.LARGEST,
+}
+
+
+def make_multi_grep(map_name_dfa: dict) -> _MultiGrep:
+    """
+    Builds a ``MultiGrep`` C++ instance, which compiles a pattern collection
+    so that ``PatternAutomaton`` C++ instances can be built without any python
+    intermediate object.
+
+    The C++ code processes the UTF-8 bytes of the input strings. Hence, only
+    ASCII characters may be caught by the patterns; the other bytes are only
+    caught by the ``"any"`` pattern.
+
+    Args:
+        map_name_dfa (dict): Maps each pattern name (``str``) with its corresponding
+            ``Automaton``, or the corresponding ``MultiGrepMatcher``.
+    Returns:
+        The ``MultiGrep`` C++ instance.
+    """
+    matcher = (
+        map_name_dfa if isinstance(map_name_dfa, MultiGrepMatcher) else
+        MultiGrepMatcher(map_name_dfa)
+    )
+    names = sorted(matcher.names)
+    map_name_id = {k: i for (i, k) in enumerate(names)}
+    unknown = matcher.num_cols - 1
+    return _MultiGrep(
+        matcher.num_cols,
+        [
+            matcher.map_char_col.get(chr(b), unknown) if b < 128 else unknown
+            for b in range(256)
+        ],
+        [list(t) for t in matcher.deltas],
+        [[bool(x) for x in f] for f in matcher.finals],
+        list(matcher.initials),
+        [map_name_id[name] for name in matcher.names],
+        len(names),
+        map_name_id.get("any", len(names))
+    )
+
+
+# Maps each pattern collection, identified by its (name, DFA) pairs, with the
+# corresponding MultiGrep C++ instance. The cache keeps the DFAs alive, so
+# that their id() cannot be reused by other DFAs.
+_MULTI_GREP_CACHE = dict()
+_MULTI_GREP_CACHE_SIZE = 16
+_MULTI_GREP_CACHE_LOCK = threading.Lock()
+
+
+def _get_multi_grep(map_name_dfa: dict) -> _MultiGrep:
+    # Memoized version of make_multi_grep, so that building the pattern
+    # automata of a few lines does not compile the pattern collection again.
+    if isinstance(map_name_dfa, MultiGrepMatcher):
+        (key, refs) = ((id(map_name_dfa),), map_name_dfa)
+    else:
+        key = tuple(sorted((name, id(dfa)) for (name, dfa) in map_name_dfa.items()))
+        refs = list(map_name_dfa.values())
+    with _MULTI_GREP_CACHE_LOCK:
+        entry = _MULTI_GREP_CACHE.get(key)
+    if entry is None:
+        entry = (refs, make_multi_grep(map_name_dfa))
+        with _MULTI_GREP_CACHE_LOCK:
+            if len(_MULTI_GREP_CACHE) >= _MULTI_GREP_CACHE_SIZE:
+                # Evict the oldest pattern collection.
+                del _MULTI_GREP_CACHE[next(iter(_MULTI_GREP_CACHE))]
+            _MULTI_GREP_CACHE[key] = entry
+    return entry[1]
+
+
+def _to_pc_boost_pattern_automaton(map_name_id: dict, g: PatternAutomaton) -> _PatternAutomaton:
+    # Transforms a python PatternAutomaton to a C++ PatternAutomaton.
+    # It is defined at the module level so that it can be sent to the
+    # worker processes of a PatternAutomatonExecutor.
+    # The C++ vertices are the positions in the UTF-8 encoded word, while
+    # the python vertices are character positions.
+    if len(g.w.encode()) == len(g.w):
+        pos = range(len(g.w) + 1)
+    else:
+        pos = [0]
+        for c in g.w:
+            pos.append(pos[-1] + len(c.encode()))
+    n = pos[-1] + 1
+    _g = _PatternAutomaton(n, len(map_name_id), g.w)
+    es = list(edges(g))
+    _g.add_edges(
+        array("i", [pos[source(e, g)] for e in es]),
+        array("i", [pos[target(e, g)] for e in es]),
+        array("i", [map_name_id[label(e, g)] for e in es])
+    )
+    return _g
+
+
 def make_pattern_automaton(w: str, map_name_dfa: dict, make_mg=None):
     """
     Builds a ``PatternAutomaton`` C++ instance from a input string.
@@ -123,19 +285,17 @@ def make_pattern_automaton(w: str, map_name_dfa: dict, make_mg=None):
     Returns:
         The ``PatternAutomaton`` C++ instance.
     """
+    if make_mg in MAP_MAKE_MG_STRATEGY:
+        return _get_multi_grep(map_name_dfa).make_pattern_automaton(
+            w, MAP_MAKE_MG_STRATEGY[make_mg]
+        )
+
     # Build the python PatternAutomaton
     g = PatternAutomaton(w, map_name_dfa, make_mg)
 
     # Transform python PatternAutomaton to a C++ PatternAutomaton
     map_name_id = {k: i for (i, k) in enumerate(sorted(map_name_dfa.keys()))}
-    n = len(w) + 1
-    _g = _PatternAutomaton(n, len(map_name_dfa), w)
-    for e in edges(g):
-        q = source(e, g)
-        r = target(e, g)
-        a = map_name_id[label(e, g)]
-        _g.add_edge(q, r, a)
-    return _g
+    return _to_pc_boost_pattern_automaton(map_name_id, g)
 
 
 def make_densities(map_name_density: dict = None) -> list:
@@ -163,7 +323,8 @@ def pattern_distance(
     map_name_dfa: dict = None,
     densities: list = None,
     infinity: float = INFINITY,
-    normalized: bool = False
+    normalized: bool = False,
+    use_heuristic: bool = False
 ) -> float:
     """
     Computes the pattern distance between two strings.
@@ -178,6 +339,8 @@ def pattern_distance(
         normalized (bool): Pass ``True`` to get a distance between ``0.0`` and ``1.0``
             (resp. between ``0`` and ``len(w1) + len(w2)``)
             if it is normalized (resp. not normalized).
+        use_heuristic (bool): Pass ``True`` to run an A* search rather than
+            a Dijkstra search. This does not change the resulting distance.
     Returns:
         The corresponding distance.
     """
@@ -188,12 +351,11 @@ def pattern_distance(
     g1 = make_pattern_automaton(w1, map_name_dfa)
     g2 = make_pattern_automaton(w2, map_name_dfa)
     return (
-        pattern_distance_normalized(g1, g2, densities, infinity) if normalized else
-        _pattern_distance(g1, g2, densities, infinity)
+        pattern_distance_normalized(g1, g2, densities, infinity, None, use_heuristic) if normalized else
+        _pattern_distance(g1, g2, densities, infinity, None, use_heuristic)
     )
 
 
-# pool.starmap prevents to use a lambda.
 def make_pattern_automaton_python(w: str, map_name_dfa: dict, make_mg: MultiGrepFunctor = None):
     """
     ``PatternAutomaton.__init__`` wrapper.
@@ -201,7 +363,7 @@ def make_pattern_automaton_python(w: str, map_name_dfa: dict, make_mg: MultiGrep
     Args:
         w (str): The string to convert.
         map_name_dfa (dict): Maps each pattern name (``str``) with its
-            corresponding ``Automaton``.
+            corresponding ``Automaton``, or the corresponding ``MultiGrepMatcher``.
         make_mg (MultiGrepFunctor): The strategy used to build the PatternAutomaton.
             Defaults to ``None``.
 
@@ -214,7 +376,8 @@ def make_pattern_automaton_python(w: str, map_name_dfa: dict, make_mg: MultiGrep
 def make_pattern_automata(
     lines: list,
     map_name_dfa: dict,
-    make_mg: callable = None
+    make_mg: callable = None,
+    executor: PatternAutomatonExecutor = None
 ) -> list:
     """
     Converts input lines to the ``PatternAutomaton`` C++ instances.
@@ -223,33 +386,30 @@ def make_pattern_automata(
         lines (list): A list gathering the input lines (``str``).
         map_name_dfa (dict): Maps each pattern name (``str``) with its
             corresponding ``Automaton``.
-        make_mg: A ``MultiGrepFunctor`` instance.
+        make_mg: A ``MultiGrepFunctor`` instance. If it is supported by
+            the C++ code (see ``MAP_MAKE_MG_STRATEGY``), the pattern automata
+            are directly built in C++.
+        executor (PatternAutomatonExecutor): The executor used to build the
+            python pattern automata when ``make_mg`` is not supported by the C++
+            code. It must be built using the same ``map_name_dfa`` and ``make_mg``.
+            Pass ``None`` to use a temporary executor.
     Returns:
         The corresponding list of pattern automata.
     """
-
-    # Transform python PatternAutomaton to a C++ PatternAutomaton
-    def to_pc_boost_pattern_automaton(g: PatternAutomaton):
-        map_name_id = {k: i for (i, k) in enumerate(sorted(map_name_dfa.keys()))}
-        n = len(g.w) + 1
-        _g = _PatternAutomaton(n, len(map_name_id), g.w)
-        for e in edges(g):
-            q = source(e, g)
-            r = target(e, g)
-            a = map_name_id[label(e, g)]
-            _g.add_edge(q, r, a)
-        return _g
-
-    # Parallelize PatternAutomata construction
-    with multiprocessing.Pool(multiprocessing.cpu_count()) as pool:
-        pas = pool.starmap(
-            make_pattern_automaton_python,
-            [(line, map_name_dfa, make_mg) for line in lines]
+    if make_mg in MAP_MAKE_MG_STRATEGY:
+        return _make_pattern_automata(
+            _get_multi_grep(map_name_dfa),
+            list(lines),
+            MAP_MAKE_MG_STRATEGY[make_mg]
         )
-    return [
-        to_pc_boost_pattern_automaton(pa)
-        for pa in pas
-    ]
+
+    if executor is None:
+        with PatternAutomatonExecutor(map_name_dfa, make_mg) as executor:
+            return make_pattern_automata(lines, map_name_dfa, make_mg, executor)
+
+    # The C++ PatternAutomaton are built by the workers and then pickled.
+    map_name_id = {k: i for (i, k) in enumerate(sorted(map_name_dfa.keys()))}
+    return executor.map(lines, partial(_to_pc_boost_pattern_automaton, map_name_id))
 
 def _fix_parameters(
     map_name_dfa: dict = None,
@@ -278,7 +438,15 @@ def pattern_clustering_without_preprocess(
     densities: list = None,
     max_dist: float = 0.6,
     use_async: bool = True,
-    make_mg: callable = None
+    make_mg: callable = None,
+    executor: PatternAutomatonExecutor = None,
+    lcs_cache: LcsCache = None,
+    use_heuristic: bool = True,
+    stats: PatternDistanceStats = None,
+    use_prefilter: bool = True,
+    num_threads: int = 0,
+    order: RepresentativeOrder = RepresentativeOrder.CREATION,
+    block_size: int = 0
 ) -> list:
     """
     Computes the pattern clustering of input lines without aggregating duplicated PAs.
@@ -292,15 +460,45 @@ def pattern_clustering_without_preprocess(
         max_dist: The maximum distance between an element of a cluster and the
             cluster representative. As distances are normalized, this value should
             be between ``0.0`` and ``1.0``.
-        use_async: Pass ``True`` to run computations using async calls. This accelerates
-            computations.
+        use_async: Pass ``True`` to compute the distances using a pool of threads.
+            This accelerates computations.
         make_mg: A ``MultiGrepFunctor`` instance.
+        executor: The ``PatternAutomatonExecutor`` used to build the python
+            pattern automata. Pass ``None`` to use a temporary executor.
+        lcs_cache: A ``LcsCache`` instance, memoizing the LCS computations
+            of this call. Its ``hits()`` and ``misses()`` counters
+            can be inspected afterwards. Pass ``None`` to disable it.
+        use_heuristic: Pass ``True`` to compute the distances using an A* search,
+            which prunes faster the pairs of lines that are too far.
+        stats: A ``PatternDistanceStats`` instance, counting the distance
+            computations, their heap pops and the skipped computations.
+            Pass ``None`` to disable it.
+        use_prefilter: Pass ``True`` to skip the distance computations
+            whose lower bound, computed from the characters of both lines,
+            already exceeds the current maximal distance.
+            This does not change the resulting clusters.
+        num_threads: The number of threads computing the distances
+            if ``use_async`` is ``True``. Pass ``0`` to use one thread per core.
+        order: The ``RepresentativeOrder`` in which the cluster representatives
+            are compared to each line. As ties are broken in favor of the first
+            compared representative, it may slightly change the clusters.
+            ``RepresentativeOrder.MOVE_TO_FRONT`` accelerates the clustering
+            of bursty logs.
+        block_size: Pass a positive value to process the lines by blocks of
+            ``block_size`` lines, compared in parallel to the existing cluster
+            representatives (if ``use_async`` is ``True``). This keeps every
+            thread busy when there are few representatives, and does not
+            change the resulting clusters.
     Returns:
         A ``list(int)`` mapping each line index with its corresponding cluster identifier.
     """
     (map_name_dfa, densities) = _fix_parameters(map_name_dfa, densities)
-    pattern_automata = make_pattern_automata(lines, map_name_dfa, make_mg)
-    return _pattern_clustering(pattern_automata, densities, max_dist, use_async)
+    pattern_automata = make_pattern_automata(lines, map_name_dfa, make_mg, executor)
+    return _pattern_clustering(
+        pattern_automata, densities, max_dist, use_async,
+        lcs_cache, use_heuristic, stats, use_prefilter, num_threads, order,
+        block_size
+    )
 
 
 def group_by_identical_pa(pas: list, are_equal: callable = None) -> dict:
@@ -311,16 +509,20 @@ def group_by_identical_pa(pas: list, are_equal: callable = None) -> dict:
         pas: A ``list(PatternAutomaton)`` instance.
         are_equal: A ``callable(PatternAutomaton, PatternAutomaton) -> bool``
             checking whether two PAs are homomorphic (pass ``None``
-            if the compared PAs are minimal to accelerate the processing).
+            if the compared PAs are minimal to accelerate the processing:
+            the PAs are then grouped by ``pattern_automaton_signature``).
     Returns:
         A dictionary mapping each reference PAs to the matching instances found in ``pas``.
     """
+    map_refpa_pas = dict()
     if are_equal is None:
-        def are_equal(pa1, pa2):
-            return pa1 == pa2
+        map_signature_refpa = dict()
+        for (i, pa) in enumerate(pas):
+            ref_pai = map_signature_refpa.setdefault(pattern_automaton_signature(pa), i)
+            map_refpa_pas.setdefault(ref_pai, list()).append(i)
+        return map_refpa_pas
 
     ref_pa_indices = list()
-    map_refpa_pas = dict()
     for (i, pa) in enumerate(pas):
         ref_pai = next(
             (
@@ -344,7 +546,15 @@ def pattern_clustering_with_preprocess(
     densities: list = None,
     max_dist: float = 0.6,
     use_async: bool = True,
-    make_mg: callable = None
+    make_mg: callable = None,
+    executor: PatternAutomatonExecutor = None,
+    lcs_cache: LcsCache = None,
+    use_heuristic: bool = True,
+    stats: PatternDistanceStats = None,
+    use_prefilter: bool = True,
+    num_threads: int = 0,
+    order: RepresentativeOrder = RepresentativeOrder.CREATION,
+    block_size: int = 0
 ) -> list:
     """
     Computes the pattern clustering of input lines by grouping matching PAs.
@@ -361,19 +571,48 @@ def pattern_clustering_with_preprocess(
         max_dist: The maximum distance between an element of a cluster and the
             cluster representative. As distances are normalized, this value should
             be between ``0.0`` and ``1.0``.
-        use_async: Pass ``True`` to run computations using async calls. This accelerates
-            computations.
+        use_async: Pass ``True`` to compute the distances using a pool of threads.
+            This accelerates computations.
         make_mg: A ``MultiGrepFunctor`` instance.
+        executor: The ``PatternAutomatonExecutor`` used to build the python
+            pattern automata. Pass ``None`` to use a temporary executor.
+        lcs_cache: A ``LcsCache`` instance, memoizing the LCS computations
+            of this call. Its ``hits()`` and ``misses()`` counters
+            can be inspected afterwards. Pass ``None`` to disable it.
+        use_heuristic: Pass ``True`` to compute the distances using an A* search,
+            which prunes faster the pairs of lines that are too far.
+        stats: A ``PatternDistanceStats`` instance, counting the distance
+            computations, their heap pops and the skipped computations.
+            Pass ``None`` to disable it.
+        use_prefilter: Pass ``True`` to skip the distance computations
+            whose lower bound, computed from the characters of both lines,
+            already exceeds the current maximal distance.
+            This does not change the resulting clusters.
+        num_threads: The number of threads computing the distances
+            if ``use_async`` is ``True``. Pass ``0`` to use one thread per core.
+        order: The ``RepresentativeOrder`` in which the cluster representatives
+            are compared to each line. As ties are broken in favor of the first
+            compared representative, it may slightly change the clusters.
+            ``RepresentativeOrder.MOVE_TO_FRONT`` accelerates the clustering
+            of bursty logs.
+        block_size: Pass a positive value to process the lines by blocks of
+            ``block_size`` lines, compared in parallel to the existing cluster
+            representatives (if ``use_async`` is ``True``). This keeps every
+            thread busy when there are few representatives, and does not
+            change the resulting clusters.
     Returns:
         A ``list(int)`` mapping each line index with its corresponding cluster identifier.
     """
     (map_name_dfa, densities) = _fix_parameters(map_name_dfa, densities)
 
-    with multiprocessing.Pool(multiprocessing.cpu_count()) as pool:
-        pas = pool.starmap(
-            make_pattern_automaton_python,
-            [(line, map_name_dfa) for line in lines]
-        )
+    if executor is None:
+        with PatternAutomatonExecutor(map_name_dfa, make_mg) as executor:
+            return pattern_clustering_with_preprocess(
+                lines, map_name_dfa, densities, max_dist, use_async, make_mg,
+                executor, lcs_cache, use_heuristic, stats, use_prefilter,
+                num_threads, order, block_size
+            )
+    pas = executor.map(lines)
 
     # Group pattern automat by distinct PA. As PAs are indexed by rows,
     # this indexes rows by reference row.
@@ -383,10 +622,17 @@ def pattern_clustering_with_preprocess(
     # Run the pattern clustering only for the reference lines.
     distinct_lines = [lines[row] for row in ref_rows]
     ref_clusters = _pattern_clustering(
-        make_pattern_automata(distinct_lines, map_name_dfa, make_mg),
+        make_pattern_automata(distinct_lines, map_name_dfa, make_mg, executor),
         densities,
         max_dist,
-        use_async
+        use_async,
+        lcs_cache,
+        use_heuristic,
+        stats,
+        use_prefilter,
+        num_threads,
+        order,
+        block_size
     )
 
     # Map each row with its corresponding cluster
@@ -399,3 +645,265 @@ def pattern_clustering_with_preprocess(
 
 
 pattern_clustering = pattern_clustering_without_preprocess
+
+
+# Header of the files written by PatternClusterer.save. Increase MODEL_VERSION
+# whenever the format of these files changes.
+MODEL_MAGIC = b"PCMODEL\0"
+MODEL_VERSION = 1
+_MODEL_HEADER = struct.Struct("<8sIQ")  # Magic, version, JSON header size
+
+
+class PatternClusterer:
+    """
+    Online pattern clustering. The lines are added by batches (see ``add_lines``)
+    and each batch is only compared to the cluster representatives found so far,
+    so that processing a batch does not depend on the size of the previous ones.
+
+    The clusters do not depend on how the lines are split into batches: they
+    match those returned by ``pattern_clustering`` on the concatenated batches.
+    In particular, the cluster identifier of a line is the index (among all the
+    added lines) of its cluster representative.
+
+    .. code-block:: python
+
+        clusterer = PatternClusterer(max_dist=0.3)
+        for lines in batches:
+            clusters = clusterer.add_lines(lines)
+    """
+    def __init__(
+        self,
+        map_name_dfa: dict = None,
+        densities: list = None,
+        max_dist: float = 0.6,
+        order: RepresentativeOrder = RepresentativeOrder.CREATION,
+        use_async: bool = True,
+        make_mg: callable = None,
+        executor: PatternAutomatonExecutor = None,
+        lcs_cache: LcsCache = None,
+        use_heuristic: bool = True,
+        use_prefilter: bool = True,
+        num_threads: int = 0,
+        block_size: int = 0
+    ):
+        """
+        Constructor.
+
+        Args:
+            map_name_dfa: A ``dict{str : Automaton}`` mapping each pattern name
+                with the corresponding Automaton.
+            densities: A density vector. See ``make_densities()``.
+            max_dist: The maximum distance between an element of a cluster and the
+                cluster representative, between ``0.0`` and ``1.0``.
+            order: The ``RepresentativeOrder`` in which the cluster representatives
+                are compared to each line.
+            use_async, make_mg, executor, lcs_cache, use_heuristic, use_prefilter,
+            num_threads, block_size: See ``pattern_clustering_without_preprocess``.
+        """
+        (self.map_name_dfa, densities) = _fix_parameters(map_name_dfa, densities)
+        self.use_async = use_async
+        self.make_mg = make_mg
+        self.executor = executor
+        self.lcs_cache = lcs_cache
+        self.use_heuristic = use_heuristic
+        self.use_prefilter = use_prefilter
+        self.num_threads = num_threads
+        self.block_size = block_size
+        self.clusterer = _PatternClusterer(densities, max_dist, order)
+        self.representatives = list()
+        self.representative_ids = list()
+        # Serializes the updates of the clusters, so that several threads
+        # may add lines concurrently.
+        self.lock = threading.Lock()
+
+    @property
+    def densities(self) -> list:
+        return self.clusterer.densities()
+
+    @property
+    def max_dist(self) -> float:
+        return self.clusterer.max_dist()
+
+    @property
+    def order(self) -> RepresentativeOrder:
+        return self.clusterer.order()
+
+    @property
+    def num_lines(self) -> int:
+        """
+        Retrieves the number of lines added so far.
+
+        Returns:
+            The number of lines added so far.
+        """
+        return self.clusterer.num_lines()
+
+    def add_lines(self, lines: list, stats: PatternDistanceStats = None) -> list:
+        """
+        Clusters a batch of lines.
+
+        Args:
+            lines: A ``list(str)`` gathering the input lines.
+            stats: A ``PatternDistanceStats`` instance, counting the distance
+                computations. Pass ``None`` to disable it.
+        Returns:
+            A ``list(int)`` mapping each line of the batch with its corresponding
+            cluster identifier.
+        """
+        lines = list(lines)
+        pas = make_pattern_automata(lines, self.map_name_dfa, self.make_mg, self.executor)
+        with self.lock:
+            num_lines = self.num_lines
+            clusters = self.clusterer.add(
+                pas, self.use_async, self.lcs_cache, self.use_heuristic, stats,
+                self.use_prefilter, self.num_threads, self.block_size
+            )
+            for (i, cluster) in enumerate(clusters):
+                if cluster == num_lines + i:
+                    self.representatives.append(lines[i])
+                    self.representative_ids.append(cluster)
+        return clusters
+
+    def add_representatives(self, lines: list) -> list:
+        """
+        Adds each input line as the representative of a new cluster, without
+        comparing it to the existing representatives (e.g., to reuse the
+        representatives found beforehand by ``pattern_clustering``).
+
+        Args:
+            lines: A ``list(str)`` gathering the new representatives.
+        Returns:
+            A ``list(int)`` mapping each line with its cluster identifier.
+        """
+        lines = list(lines)
+        pas = make_pattern_automata(lines, self.map_name_dfa, self.make_mg, self.executor)
+        with self.lock:
+            clusters = self.clusterer.add_representatives(pas)
+            self.representatives += lines
+            self.representative_ids += clusters
+        return clusters
+
+    def save(self, filename: str):
+        """
+        Saves the trained model (pattern collection, densities, threshold and
+        cluster representatives) to a binary file. The pattern automata of the
+        representatives are stored, so that ``load`` does not have to rebuild
+        them. The runtime parameters (``use_async``, ``num_threads``...)
+        are not saved.
+
+        Args:
+            filename: The path of the output file.
+        """
+        header = json.dumps({
+            "map_name_dfa": {
+                name: dfa_to_dict(dfa)
+                for (name, dfa) in self.map_name_dfa.items()
+            },
+        }).encode("utf-8")
+        with open(filename, "wb") as f:
+            f.write(_MODEL_HEADER.pack(MODEL_MAGIC, MODEL_VERSION, len(header)))
+            f.write(header)
+            f.write(self.clusterer.save())
+
+    @classmethod
+    def load(cls, filename: str, **kwargs):
+        """
+        Loads a model saved using ``save``. The file is memory-mapped and
+        the pattern automata are read as is: neither the DFAs nor the
+        pattern automata of the representatives are recomputed.
+
+        Args:
+            filename: The path of the input file.
+            kwargs: The runtime parameters (``use_async``, ``make_mg``,
+                ``num_threads``...), see ``PatternClusterer.__init__``.
+        Raises:
+            ValueError: if the file is not a model or has an unsupported version.
+            RuntimeError: if the file is corrupted.
+        Returns:
+            The corresponding ``PatternClusterer`` instance.
+        """
+        with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if len(data) < _MODEL_HEADER.size:
+                raise ValueError(f"{filename}: not a pattern clustering model")
+            (magic, version, header_size) = _MODEL_HEADER.unpack_from(data)
+            if magic != MODEL_MAGIC:
+                raise ValueError(f"{filename}: not a pattern clustering model")
+            if version != MODEL_VERSION:
+                raise ValueError(f"{filename}: unsupported model version {version}")
+            begin = _MODEL_HEADER.size + header_size
+            header = json.loads(data[_MODEL_HEADER.size:begin].decode("utf-8"))
+            with memoryview(data) as view, view[begin:] as blob:
+                clusterer = _PatternClusterer.load(blob)
+        map_name_dfa = {
+            name: dfa_from_dict(d)
+            for (name, d) in header["map_name_dfa"].items()
+        }
+        model = cls(
+            map_name_dfa, clusterer.densities(), clusterer.max_dist(),
+            clusterer.order(), **kwargs
+        )
+        model.clusterer = clusterer
+        model.representatives = clusterer.representative_words()
+        model.representative_ids = list(clusterer.representative_ids())
+        return model
+
+
+def assign_to_clusters(
+    lines: list,
+    representatives: list,
+    map_name_dfa: dict = None,
+    densities: list = None,
+    max_dist: float = 0.6,
+    use_async: bool = True,
+    make_mg: callable = None,
+    executor: PatternAutomatonExecutor = None,
+    lcs_cache: LcsCache = None,
+    use_heuristic: bool = True,
+    stats: PatternDistanceStats = None,
+    use_prefilter: bool = True,
+    num_threads: int = 0
+) -> list:
+    """
+    Assigns input lines to a fixed set of cluster representatives (e.g., the
+    representatives found by ``pattern_clustering`` on a sample), without
+    creating any new cluster. The lines are processed in parallel,
+    with the GIL released.
+
+    Args:
+        lines: A ``list(str)`` gathering the input lines.
+        representatives: A ``list(str)`` gathering the cluster representatives.
+        map_name_dfa: A ``dict{str : Automaton}`` mapping each pattern name
+            with the corresponding Automaton.
+        densities: A density vector. See ``make_densities()``.
+        max_dist: The maximum distance between a line and its representative.
+            As distances are normalized, this value should be between ``0.0`` and ``1.0``.
+        use_async: Pass ``True`` to process the lines using a pool of threads.
+        make_mg: A ``MultiGrepFunctor`` instance.
+        executor: The ``PatternAutomatonExecutor`` used to build the python
+            pattern automata. Pass ``None`` to use a temporary executor.
+        lcs_cache: A ``LcsCache`` instance. Pass ``None`` to disable it.
+        use_heuristic: Pass ``True`` to compute the distances using an A* search.
+        stats: A ``PatternDistanceStats`` instance. Pass ``None`` to disable it.
+        use_prefilter: Pass ``True`` to skip the distance computations
+            whose lower bound already exceeds the current maximal distance.
+        num_threads: The number of threads if ``use_async`` is ``True``.
+            Pass ``0`` to use one thread per core.
+    Returns:
+        A list mapping each line index with the ``(i, distance)`` pair, where
+        ``i`` is the index of its closest representative in ``representatives``,
+        or with ``None`` if every representative is farther than ``max_dist``.
+    """
+    (map_name_dfa, densities) = _fix_parameters(map_name_dfa, densities)
+    if executor is None and make_mg not in MAP_MAKE_MG_STRATEGY:
+        with PatternAutomatonExecutor(map_name_dfa, make_mg) as executor:
+            return assign_to_clusters(
+                lines, representatives, map_name_dfa, densities, max_dist,
+                use_async, make_mg, executor, lcs_cache, use_heuristic, stats,
+                use_prefilter, num_threads
+            )
+    return _assign_to_clusters(
+        make_pattern_automata(lines, map_name_dfa, make_mg, executor),
+        make_pattern_automata(representatives, map_name_dfa, make_mg, executor),
+        densities, max_dist, use_async, lcs_cache, use_heuristic, stats,
+        use_prefilter, num_threads
+    )
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of the pattern-clustering project.
+# https://github.com/nokia/pattern-clustering
+
+"""On-disk cache of the compiled pattern DFAs and their language densities."""
+
+__author__ = "Marc-Olivier Buob, Maxime Raynal"
+__maintainer__ = "Marc-Olivier Buob, Maxime Raynal"
+__email__ = "marc-olivier.buob@nokia-bell-labs.com, maxime.raynal@nokia.com"
+__copyright__ = "Copyright (C) 2022, Nokia"
+__license__ = "BSD-3"
+
+import hashlib, json, os, string, tempfile
+from collections import defaultdict
+from pybgl.automaton import (
+    Automaton, add_edge, edges, initial, is_final, label,
+    set_final, source, target, vertices
+)
+from pybgl.regexp import compile_dfa
+
+from .language_density import language_density
+
+# Increase this number whenever the format of the cached entries changes.
+CACHE_VERSION = 2
+
+# Versions of the DFA serialization (see dfa_to_dict) and of the density
+# computation (see language_density). They are part of the key of each entry,
+# so that changing either of them invalidates the entries computed beforehand.
+DFA_VERSION = 1
+DENSITY_VERSION = 1
+
+# Environment variable enabling the on-disk cache of PatternClusteringEnv.
+CACHE_DIR_ENV = "PATTERN_CLUSTERING_CACHE_DIR"
+
+
+def default_cache_dir() -> str:
+    """
+    Retrieves the default cache directory, i.e.,
+    ``$XDG_CACHE_HOME/pattern_clustering`` (or ``~/.cache/pattern_clustering``
+    if ``XDG_CACHE_HOME`` is not set).
+
+    Returns:
+        The path of the default cache directory.
+    """
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(root, "pattern_clustering")
+
+
+def dfa_to_dict(g: Automaton) -> dict:
+    """
+    Serializes an ``Automaton`` to a JSON-compliant dictionary.
+    The states are renumbered from ``0`` in increasing order and the
+    transitions sharing the same source and target are grouped.
+
+    Args:
+        g (Automaton): The serialized automaton.
+    Returns:
+        The corresponding dictionary. See also ``dfa_from_dict``.
+    """
+    map_q_id = {q: i for (i, q) in enumerate(sorted(vertices(g)))}
+    map_qr_chars = defaultdict(str)
+    for e in edges(g):
+        map_qr_chars[(map_q_id[source(e, g)], map_q_id[target(e, g)])] += label(e, g)
+    return {
+        "num_vertices": len(map_q_id),
+        "initial": map_q_id[initial(g)],
+        "finals": [i for (q, i) in map_q_id.items() if is_final(q, g)],
+        "transitions": [
+            [q, r, "".join(sorted(chars))]
+            for ((q, r), chars) in sorted(map_qr_chars.items())
+        ],
+    }
+
+
+def dfa_from_dict(d: dict) -> Automaton:
+    """
+    Deserializes an ``Automaton`` serialized using ``dfa_to_dict``.
+
+    Args:
+        d (dict): The serialized automaton.
+    Returns:
+        The corresponding ``Automaton``.
+    """
+    g = Automaton(d["num_vertices"], d["initial"])
+    for q in d["finals"]:
+        set_final(q, g)
+    for (q, r, chars) in d["transitions"]:
+        for a in chars:
+            add_edge(q, r, a, g)
+    return g
+
+
+class PatternCache:
+    """
+    On-disk cache storing, for each (regular expression, alphabet, density parameters)
+    triple, the corresponding DFA and its language density.
+
+    Each entry is stored in its own file, named according to a hash of its key.
+    The files are written atomically, so that concurrent processes can safely
+    read and fill the cache. As the regular expression is part of the key,
+    modifying a pattern automatically invalidates its entry.
+    """
+    def __init__(self, cache_dir: str = None):
+        """
+        Constructor.
+
+        Args:
+            cache_dir (str): The cache directory. Defaults to ``default_cache_dir()``.
+        """
+        self.cache_dir = os.path.join(
+            cache_dir if cache_dir else default_cache_dir(),
+            f"v{CACHE_VERSION}"
+        )
+
+    def path(self, regex: str, alphabet: set, n_max: int) -> str:
+        """
+        Retrieves the path of the file storing a given cache entry.
+
+        Args:
+            regex (str): The regular expression.
+            alphabet (set): The characters of the alphabet.
+            n_max (int): See ``language_density``.
+        Returns:
+            The corresponding path.
+        """
+        key = json.dumps([regex, "".join(sorted(alphabet)), n_max, DFA_VERSION, DENSITY_VERSION])
+        return os.path.join(
+            self.cache_dir,
+            hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json"
+        )
+
+    def load(self, regex: str, alphabet: set, n_max: int) -> tuple:
+        """
+        Loads a cache entry.
+
+        Args:
+            regex (str): The regular expression.
+            alphabet (set): The characters of the alphabet.
+            n_max (int): See ``language_density``.
+        Returns:
+            The corresponding ``(Automaton, float)`` pair if found, ``None`` otherwise.
+        """
+        try:
+            with open(self.path(regex, alphabet, n_max)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (
+            entry.get("regex") != regex
+            or entry.get("alphabet") != "".join(sorted(alphabet))
+            or entry.get("n_max") != n_max
+            or entry.get("dfa_version") != DFA_VERSION
+            or entry.get("density_version") != DENSITY_VERSION
+        ):
+            return None
+        return (dfa_from_dict(entry["dfa"]), entry["density"])
+
+    def save(self, regex: str, alphabet: set, n_max: int, dfa: Automaton, density: float):
+        """
+        Saves a cache entry. Errors (e.g., read-only file system) are ignored.
+
+        Args:
+            regex (str): The regular expression.
+            alphabet (set): The characters of the alphabet.
+            n_max (int): See ``language_density``.
+            dfa (Automaton): The DFA corresponding to ``regex``.
+            density (float): The language density of ``dfa``.
+        """
+        entry = {
+            "regex": regex,
+            "alphabet": "".join(sorted(alphabet)),
+            "n_max": n_max,
+            "dfa_version": DFA_VERSION,
+            "density_version": DENSITY_VERSION,
+            "dfa": dfa_to_dict(dfa),
+            "density": density,
+        }
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            (fd, tmp_path) = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(entry, f)
+                os.replace(tmp_path, self.path(regex, alphabet, n_max))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            pass
+
+    def compile(self, regex: str, alphabet: set = None, n_max: int = 30) -> tuple:
+        """
+        Compiles a regular expression and computes its language density,
+        or retrieves them from the cache.
+
+        Args:
+            regex (str): The regular expression.
+            alphabet (set): The characters of the alphabet.
+                Defaults to ``string.printable``.
+            n_max (int): See ``language_density``.
+        Returns:
+            The corresponding ``(Automaton, float)`` pair.
+        """
+        if not alphabet:
+            alphabet = set(string.printable)
+        result = self.load(regex, alphabet, n_max)
+        if result is None:
+            dfa = compile_dfa(regex)
+            density = language_density(dfa, alphabet, n_max)
+            self.save(regex, alphabet, n_max, dfa, density)
+            result = (dfa, density)
+        return result
+
+
+def default_disk_cache() -> PatternCache:
+    """
+    Builds the on-disk cache used by default by ``PatternClusteringEnv``.
+    This cache is opt-in: it is only enabled if the ``PATTERN_CLUSTERING_CACHE_DIR``
+    environment variable is set, and is then stored in this directory.
+
+    Returns:
+        The corresponding ``PatternCache`` if enabled, ``None`` otherwise.
+    """
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    return PatternCache(cache_dir) if cache_dir else None
+
+
+def make_map_name_dfa_density(
+    map_name_re: dict,
+    names: iter = None,
+    alphabet: set = None,
+    cache: PatternCache = None
+) -> tuple:
+    """
+    Builds the DFA and the language density of each pattern, using an on-disk cache.
+
+    Args:
+        map_name_re (dict): Maps each pattern name (``str``) with the corresponding
+            regular expression (``str``).
+        names (list): The pattern names to consider. Defaults to every key
+            of ``map_name_re``.
+        alphabet (set): The characters of the alphabet.
+            Defaults to ``string.printable``.
+        cache (PatternCache): The cache. Defaults to ``PatternCache()``.
+    Returns:
+        A ``(map_name_dfa, map_name_density)`` pair, (see ``make_map_name_dfa``
+        and ``make_name_density``).
+    """
+    if not names:
+        names = list(map_name_re.keys())
+    if cache is None:
+        cache = PatternCache()
+    map_name_dfa = dict()
+    map_name_density = dict()
+    for name in names:
+        try:
+            (map_name_dfa[name], map_name_density[name]) = cache.compile(
+                map_name_re[name], alphabet
+            )
+        except Exception as e:
+            raise Exception("Error when processing %r: %s" % (name, e))
+    return (map_name_dfa, map_name_density)
@@ -17,7 +17,7 @@ import sys
 from collections import defaultdict
 from optparse import OptionParser
 from pattern_clustering import (
-    MAP_NAME_RE, PatternClusteringEnv, pattern_clustering_to_html,
+    MAP_NAME_RE, PatternClusteringEnv, RepresentativeOrder, pattern_clustering_to_html,
     pattern_clustering_with_preprocess, pattern_clustering_without_preprocess,
     pattern_distance
 )
@@ -156,6 +156,15 @@ def main_pattern_clustering():
         help    = "Automatically groups in the same cluster every line having the same pattern-level structure. This accelerates the computation but may lead to inaccurate clusters.",
         action  = "store_true"
     )
+    parser.add_option(
+        "-r", "--representative-order",
+        metavar = "ORDER",
+        type    = "choice",
+        choices = ["creation", "move-to-front", "frequency"],
+        dest    = "representative_order",
+        help    = "Order in which the cluster representatives are compared to each line: creation (oldest first), move-to-front (most recently matched first) or frequency (most often matched first). Defaults to creation",
+        default = "creation"
+    )
     parser.add_option(
         "-t", "--threshold",
         metavar = "THRESHOLD",
@@ -180,6 +189,7 @@ def main_pattern_clustering():
     threshold = options.threshold
     conf = defaultdict()
     no_async = options.no_async
+    representative_order = options.representative_order
 
     if options.config_filename:
         if verbose:
@@ -195,10 +205,15 @@ def main_pattern_clustering():
             PatternClusteringEnv.patterns = patterns
         threshold = conf.get("threshold", threshold)
         no_async = conf.get("no_async", no_async)
+        representative_order = conf.get("representative_order", representative_order)
     elif verbose:
         info(f"Using command-line and default parameters.")
 
     use_async = not options.no_async
+    try:
+        order = RepresentativeOrder.names[representative_order.upper().replace("-", "_")]
+    except KeyError:
+        error(f"Invalid representative order: {representative_order}")
     pattern_clustering = (
         pattern_clustering_with_preprocess if options.with_preprocessing else
         pattern_clustering_without_preprocess
@@ -207,6 +222,7 @@ def main_pattern_clustering():
     # Verbose messages
     if verbose:
         info(f"threshold: {threshold}")
+        info(f"representative order: {representative_order}")
         info(f"env:\n{PatternClusteringEnv()}")
         info(f"pattern_clustering: {pattern_clustering}")
 
@@ -215,7 +231,8 @@ def main_pattern_clustering():
         map_row_cluster = pattern_clustering(
             lines,
             max_dist=threshold,
-            use_async=use_async
+            use_async=use_async,
+            order=order
         )
 
     if options.output_filename:
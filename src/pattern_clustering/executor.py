@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of the pattern-clustering project.
+# https://github.com/nokia/pattern-clustering
+
+"""Persistent worker pool used to build ``PatternAutomaton`` instances."""
+
+__author__ = "Marc-Olivier Buob, Maxime Raynal"
+__maintainer__ = "Marc-Olivier Buob, Maxime Raynal"
+__email__ = "marc-olivier.buob@nokia-bell-labs.com, maxime.raynal@nokia.com"
+__copyright__ = "Copyright (C) 2022, Nokia"
+__license__ = "BSD-3"
+
+import multiprocessing
+from functools import partial
+
+from .multi_grep import MultiGrepMatcher
+from .pattern_automaton import PatternAutomaton
+
+# State of each worker process, set once by _init_worker.
+_WORKER_MATCHER = None
+_WORKER_MAKE_MG = None
+
+
+def _init_worker(matcher: MultiGrepMatcher, make_mg: callable):
+    global _WORKER_MATCHER, _WORKER_MAKE_MG
+    _WORKER_MATCHER = matcher
+    _WORKER_MAKE_MG = make_mg
+
+
+def _make_pattern_automaton(
+    w: str,
+    matcher: MultiGrepMatcher,
+    make_mg: callable,
+    convert: callable
+) -> PatternAutomaton:
+    g = PatternAutomaton(w, matcher, make_mg)
+    return convert(g) if convert else g
+
+
+# pool.imap prevents to use a lambda.
+def _make_pattern_automaton_worker(w: str, convert: callable = None) -> PatternAutomaton:
+    return _make_pattern_automaton(w, _WORKER_MATCHER, _WORKER_MAKE_MG, convert)
+
+
+class PatternAutomatonExecutor:
+    """
+    Builds ``PatternAutomaton`` python instances using a reusable pool of processes.
+
+    The pattern collection is compiled once (see ``MultiGrepMatcher``) and sent
+    once to each worker when the pool starts. Small batches are processed in
+    the current process, as the inter-process communication would then cost
+    more than the actual work.
+
+    The pool is started on demand and must be released using ``close()``,
+    or by using the executor as a context manager:
+
+    .. code-block:: python
+
+        with PatternAutomatonExecutor(map_name_dfa) as executor:
+            for lines in batches:
+                pas = executor.map(lines)
+    """
+    def __init__(
+        self,
+        map_name_dfa: dict,
+        make_mg: callable = None,
+        processes: int = None,
+        chunksize: int = 64,
+        min_batch_size: int = 256
+    ):
+        """
+        Constructor.
+
+        Args:
+            map_name_dfa (dict): Maps each pattern name (``str``) with its
+                corresponding ``Automaton``, or the corresponding ``MultiGrepMatcher``.
+            make_mg (MultiGrepFunctor): The strategy used to build the PatternAutomaton.
+                Defaults to ``None``. It must be picklable (e.g., a class).
+            processes (int): The number of worker processes.
+                Defaults to ``multiprocessing.cpu_count()``.
+            chunksize (int): The number of lines sent at once to a worker.
+            min_batch_size (int): The batches having less lines are
+                processed in the current process.
+        """
+        self.matcher = (
+            map_name_dfa if isinstance(map_name_dfa, MultiGrepMatcher) else
+            MultiGrepMatcher(map_name_dfa)
+        )
+        self.make_mg = make_mg
+        self.processes = processes if processes else multiprocessing.cpu_count()
+        self.chunksize = chunksize
+        self.min_batch_size = min_batch_size
+        self.pool = None
+
+    def start(self):
+        """
+        Starts the worker processes, if not yet started.
+        """
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(
+                self.processes,
+                initializer=_init_worker,
+                initargs=(self.matcher, self.make_mg)
+            )
+
+    def close(self):
+        """
+        Stops the worker processes, if started.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        if self.pool is not None:
+            self.pool.terminate()
+
+    def is_in_process(self, lines: iter) -> bool:
+        """
+        Checks whether a batch of lines is processed in the current process.
+
+        Args:
+            lines (iter): The input lines (``str``). If their number is
+                unknown (e.g., a generator), the pool is used.
+        Returns:
+            ``True`` if the lines are processed in the current process,
+            ``False`` otherwise.
+        """
+        return (
+            self.processes <= 1
+            or (hasattr(lines, "__len__") and len(lines) < self.min_batch_size)
+        )
+
+    def imap(self, lines: iter, convert: callable = None) -> iter:
+        """
+        Lazily builds the ``PatternAutomaton`` of each input line.
+
+        Args:
+            lines (iter): The input lines (``str``).
+            convert (callable): A function applied by the workers to each
+                ``PatternAutomaton``, e.g., to return the corresponding C++
+                ``PatternAutomaton``. It must be picklable, as well as its
+                output. Pass ``None`` to return the ``PatternAutomaton`` as is.
+        Returns:
+            An iterator over the corresponding ``PatternAutomaton`` instances
+            (or their converted counterpart), in the order of ``lines``.
+        """
+        if self.is_in_process(lines):
+            return (
+                _make_pattern_automaton(line, self.matcher, self.make_mg, convert)
+                for line in lines
+            )
+        self.start()
+        return self.pool.imap(
+            partial(_make_pattern_automaton_worker, convert=convert),
+            lines,
+            self.chunksize
+        )
+
+    def map(self, lines: iter, convert: callable = None) -> list:
+        """
+        Builds the ``PatternAutomaton`` of each input line.
+
+        Args:
+            lines (iter): The input lines (``str``).
+            convert (callable): See ``imap``.
+        Returns:
+            The list of the corresponding ``PatternAutomaton`` instances
+            (or their converted counterpart).
+        """
+        return list(self.imap(lines, convert))
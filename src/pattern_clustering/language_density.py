@@ -12,9 +12,31 @@ __email__      = "maxime.raynal@nokia.com, marc-olivier.buob@nokia-bell-labs.com
 __copyright__  = "Copyright (C) 2022, Nokia"
 __license__    = "BSD-3"
 
+import numpy as np
 import string
-from collections        import defaultdict
-from pybgl.automaton    import Automaton, BOTTOM, finals, initial, is_final
+from pybgl.automaton    import Automaton, BOTTOM, initial, is_final, vertices
+
+def make_transition_count_matrix(g: Automaton) -> tuple:
+    """
+    Builds the transition count matrix of an ``Automaton``.
+
+    Args:
+        g (Automaton): The input Automaton.
+    Returns:
+        A ``(m, f, map_q_i)`` tuple where ``m[i, j]`` counts the transitions from
+        the ``i``-th to the ``j``-th state, ``f`` is the 0/1 vector indicating
+        the final states and ``map_q_i`` maps each state with its row.
+    """
+    map_q_i = {q: i for (i, q) in enumerate(vertices(g))}
+    n = len(map_q_i)
+    m = np.zeros((n, n))
+    for (q, map_a_r) in g.m_adjacencies.items():
+        i = map_q_i[q]
+        for r in map_a_r.values():
+            if r is not BOTTOM:
+                m[i, map_q_i[r]] += 1
+    f = np.array([1.0 if is_final(q, g) else 0.0 for q in map_q_i])
+    return (m, f, map_q_i)
 
 def language_density(
     g        :Automaton,
@@ -34,27 +56,27 @@ def language_density(
             to compute the language density.
             The greater ``n_max``, the better the accuracy, but the slower the computation.
         series (callable): ``Callback(int) -> float`` returning the coefficient
-            of a monome according to its degree.
+            of a monome according to its degree. Defaults to ``k -> 1 / 2 ** k``,
+            in which case the (truncated) series is computed in closed form.
     Returns:
         A ``float`` in [0.0, 1.0] corresponding to the language density of ``g``
         according to ``alphabet``.
     """
     if not alphabet:
         alphabet = set(string.printable)
+    (m, f, map_q_i) = make_transition_count_matrix(g)
+    m /= len(alphabet)
+    x0 = np.zeros(len(map_q_i))
+    x0[map_q_i[initial(g)]] = 1.0
     if series is None:
-        def series(k):
-            return 1 / (2 ** k)
-    m = defaultdict(int)
-    q0 = initial(g)
-    m[q0] = series(0)
-    result = m[q0] if is_final(q0, g) else 0
+        # With the geometric series, sum_{n < n_max} (m / 2) ** n
+        # equals (I - m / 2) ** -1 . (I - (m / 2) ** n_max).
+        a = m / 2
+        b = f - np.linalg.matrix_power(a, max(n_max, 1)) @ f
+        return float(x0 @ np.linalg.solve(np.eye(len(f)) - a, b))
+    x = x0 * series(0)
+    result = x @ f
     for n in range(1, n_max):
-        m2 = defaultdict(int)
-        for (q, map_a_r) in g.m_adjacencies.items():
-            for (a, r) in map_a_r.items():
-                if r is not BOTTOM:
-                    if r in finals(g):
-                        result += series(n) * m[q] / (len(alphabet) ** n)
-                    m2[r] += m[q]
-        m = m2
-    return result
+        x = x @ m
+        result += series(n) * (x @ f)
+    return float(result)
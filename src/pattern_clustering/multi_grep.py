@@ -12,15 +12,214 @@ __license__ = "BSD-3"
 
 """Multigrep detects pattern occurences involved in an input string"""
 
+from array import array
 from collections import defaultdict
 from itertools import combinations
-from pybgl.automaton import BOTTOM, initial, is_final, delta
+import numpy as np
+from pybgl.automaton import delta, initial, is_final, sigma, vertices
 from pybgl.deterministic_inclusion import deterministic_inclusion
 
 
+class MultiGrepMatcher:
+    """
+    Compiled form of a pattern collection used by ``multi_grep``.
+
+    Each DFA is turned once into a dense (state x symbol) transition table stored
+    in a flat ``array``, so that scanning a string only involves integer lookups.
+    Symbols are the characters labeling at least one DFA transition; any other
+    character is mapped to an extra column that has no transition.
+    """
+
+    def __init__(self, map_name_dfa: dict):
+        """
+        Constructor.
+
+        Args:
+            map_name_dfa (dict): Maps each pattern (``str``)
+                with its corresponding DFA (``pybgl.Automaton``).
+        """
+        self.names = list(map_name_dfa.keys())
+
+        # Map each symbol with its column
+        self.map_char_col = dict()
+        for g in map_name_dfa.values():
+            for q in vertices(g):
+                for a in sorted(sigma(q, g)):
+                    if a not in self.map_char_col:
+                        self.map_char_col[a] = len(self.map_char_col)
+        self.num_cols = len(self.map_char_col) + 1
+        unknown = self.num_cols - 1
+
+        # Translation table used to encode latin-1 strings in one call.
+        if self.num_cols <= 256:
+            self.byte_cols = bytes(
+                self.map_char_col.get(chr(b), unknown)
+                for b in range(256)
+            )
+        else:
+            self.byte_cols = None
+
+        # Build the transition tables
+        self.deltas = list()
+        self.finals = list()
+        self.initials = list()
+        for g in map_name_dfa.values():
+            map_q_i = {q: i for (i, q) in enumerate(vertices(g))}
+            t = array("i", [-1]) * (len(map_q_i) * self.num_cols)
+            f = bytearray(len(map_q_i))
+            for (q, i) in map_q_i.items():
+                f[i] = bool(is_final(q, g))
+                for a in sigma(q, g):
+                    t[i * self.num_cols + self.map_char_col[a]] = map_q_i[delta(q, a, g)]
+            self.deltas.append(t)
+            self.finals.append(f)
+            self.initials.append(map_q_i[initial(g)])
+
+        # Per pattern, maps each column with 1 iff it leaves the initial state.
+        # It allows to skip (using bytes.find) the prefixes that cannot start a match.
+        self.starts = [
+            bytes(
+                1 if c < self.num_cols and t[q0 * self.num_cols + c] >= 0 else 0
+                for c in range(256)
+            ) if self.byte_cols else None
+            for (t, q0) in zip(self.deltas, self.initials)
+        ]
+
+    def encode(self, w: str):
+        """
+        Maps each character of a string to its column in the transition tables.
+
+        Args:
+            w (str): The input string.
+        Returns:
+            A ``bytes`` (or a ``list`` if there are more than 256 columns)
+            of column indices.
+        """
+        if self.byte_cols:
+            try:
+                return w.encode("latin-1").translate(self.byte_cols)
+            except UnicodeEncodeError:
+                pass
+        unknown = self.num_cols - 1
+        cols = [self.map_char_col.get(a, unknown) for a in w]
+        return bytes(cols) if self.byte_cols else cols
+
+    def encode_batch(self, lines: list) -> np.ndarray:
+        """
+        Encodes a block of strings in a padded matrix of columns (see ``encode``).
+
+        Args:
+            lines (list): The input strings.
+        Returns:
+            A ``numpy.ndarray`` of shape ``(len(lines), max(len(w) for w in lines))``.
+            The row of each string is padded with the column of unknown characters.
+        """
+        unknown = self.num_cols - 1
+        m = max((len(w) for w in lines), default=0)
+        if self.byte_cols:
+            pad = bytes([unknown])
+            buffer = b"".join(self.encode(w).ljust(m, pad) for w in lines)
+            return np.frombuffer(buffer, dtype=np.uint8).reshape(len(lines), m)
+        cols = np.full((len(lines), m), unknown, dtype=np.int32)
+        for (i, w) in enumerate(lines):
+            cols[i, :len(w)] = self.encode(w)
+        return cols
+
+    def __call__(
+        self,
+        w: str,
+        callback: callable = lambda name, j, k, w: None
+    ):
+        """
+        Searches sub-strings of a string matched by the compiled patterns.
+        See ``multi_grep``.
+
+        Args:
+            w (str): The input string.
+            callback (callable): A ``callable(Name, int, int, str)`` called whenever
+                ``w[j:k]`` is matched by pattern ``name``.
+        """
+        cols = self.encode(w)
+        m = len(cols)
+        num_cols = self.num_cols
+
+        # The patterns are processed one by one, but the callbacks are replayed
+        # by increasing k (and then by pattern) to follow the order in which
+        # they were historically triggered. map_k_events[k] gathers the (name, js)
+        # pairs such that w[j:k] is matched by name for each j in js.
+        map_k_events = [[] for _ in range(m + 1)]
+
+        for (name, t, f, q0, starts) in zip(
+            self.names, self.deltas, self.finals, self.initials, self.starts
+        ):
+            # For each reached state q, we maintain the set of indices j such that
+            # w[j:k] leads to q. qs (resp. jss) stores these states (resp. sets) by
+            # order of discovery; slots maps each state q with its index in qs.
+            slots = [-1] * len(f)
+            mask = cols.translate(starts) if starts else None
+            k = 0
+            while k < m:
+                # Idle: the only active set is {k} in the initial state. Jump to the
+                # next character leaving the initial state.
+                if mask is not None:
+                    k = mask.find(1, k)
+                    if k < 0:
+                        break
+                elif t[q0 * num_cols + cols[k]] < 0:
+                    k += 1
+                    continue
+                qs = [q0]
+                jss = [{k}]
+                while k < m:
+                    c = cols[k]
+                    qs_next = list()
+                    jss_next = list()
+                    for (q, js) in zip(qs, jss):
+                        if not js:
+                            continue
+                        r = t[q * num_cols + c]
+                        if r < 0:
+                            # Keep the historical behavior of multi_grep (q is reset).
+                            s = slots[q]
+                            if s < 0:
+                                slots[q] = len(qs_next)
+                                qs_next.append(q)
+                                jss_next.append(set())
+                            else:
+                                jss_next[s] = set()
+                        else:
+                            s = slots[r]
+                            if s < 0:
+                                slots[r] = len(qs_next)
+                                qs_next.append(r)
+                                jss_next.append(set(js))
+                            else:
+                                jss_next[s] |= js
+                            if f[r]:
+                                map_k_events[k + 1].append((name, js))
+                    k += 1
+                    s = slots[q0]
+                    if s < 0:
+                        qs_next.append(q0)
+                        jss_next.append({k})
+                    else:
+                        jss_next[s] |= {k}
+                    for q in qs_next:
+                        slots[q] = -1
+                    (qs, jss) = (qs_next, jss_next)
+                    if len(qs) == 1 and len(jss[0]) == 1:
+                        # Back to the idle configuration.
+                        break
+
+        for (k, events) in enumerate(map_k_events):
+            for (name, js) in events:
+                for j in js:
+                    callback(name, j, k, w)
+
+
 def multi_grep(
     w: str,
-    map_name_dfa: dict,
+    map_name_dfa,
     callback: callable = lambda name, j, k, w: None,
 ):
     """
@@ -28,43 +227,118 @@ def multi_grep(
 
     Args:
         w (str): The input string.
-        map_name_dfa (dict): Maps each pattern (``str``)
-            with its corresponding DFA (``pybgl.Automaton``).
+        map_name_dfa: Maps each pattern (``str``) with its corresponding DFA
+            (``pybgl.Automaton``). You may also pass the corresponding
+            ``MultiGrepMatcher`` to avoid compiling the DFAs at each call.
         callback (callable): A ``callable(Name, int, int, str)`` called whenever
             ``w[j:k]`` is matched by pattern ``name``.
     """
+    matcher = (
+        map_name_dfa if isinstance(map_name_dfa, MultiGrepMatcher) else
+        MultiGrepMatcher(map_name_dfa)
+    )
+    matcher(w, callback)
 
-    def make_map_name_q_js_next() -> dict:
-        return {
-            name: defaultdict(set)
-            for (name, g) in map_name_dfa.items()
-        }
 
-    m = len(w)
-    map_name_q_js = {
-        name: {initial(g): {0}}
-        for (name, g) in map_name_dfa.items()
-    }
+def multi_grep_batch(lines: list, map_name_dfa) -> list:
+    """
+    Searches, in a block of strings, the sub-strings matched by multiple patterns.
+    It is equivalent to running ``multi_grep`` with a ``MultiGrepFunctorLargest``
+    on each string, but the DFAs are advanced on all the strings at once, one
+    column at a time, using vectorized table lookups.
 
-    map_name_q_js_next = make_map_name_q_js_next()
-    for k in range(m):
-        a = w[k]
-        for (name, g) in map_name_dfa.items():
-            map_q_js = map_name_q_js[name]
-            for (q, js) in map_q_js.items():
-                if not js:
-                    continue
-                r = delta(q, a, g)
-                if r is BOTTOM:
-                    map_name_q_js_next[name][q] = set()
-                else:
-                    map_name_q_js_next[name][r] |= map_q_js[q]
-                    if is_final(r, g):
-                        for j in js:
-                            callback(name, j, k + 1, w)
-            map_name_q_js_next[name][initial(g)] |= {k + 1}
-        map_name_q_js = map_name_q_js_next
-        map_name_q_js_next = make_map_name_q_js_next()
+    The memory footprint is in ``O(len(lines) * max(len(w) for w in lines))``,
+    so large inputs should be split in blocks of similar lengths.
+
+    Args:
+        lines (list): The input strings.
+        map_name_dfa: Maps each pattern (``str``) with its corresponding DFA
+            (``pybgl.Automaton``), or the corresponding ``MultiGrepMatcher``.
+    Returns:
+        A list which maps each line index with a dict ``{name: [(j, k)]}``, i.e.,
+        what ``MultiGrepFunctorLargest.indices()`` returns for this line.
+        It may be passed to ``PatternAutomaton`` (see its ``indices`` parameter).
+    """
+    matcher = (
+        map_name_dfa if isinstance(map_name_dfa, MultiGrepMatcher) else
+        MultiGrepMatcher(map_name_dfa)
+    )
+    n = len(lines)
+    result = [dict() for _ in range(n)]
+    cols = np.ascontiguousarray(matcher.encode_batch(lines).T)  # cols[k] is the k-th column
+    m = cols.shape[0]
+    num_cols = matcher.num_cols
+    empty = np.empty(0, dtype=np.int64)
+
+    for (name, t, f, q0) in zip(
+        matcher.names, matcher.deltas, matcher.finals, matcher.initials
+    ):
+        t = np.array(t, dtype=np.int64)
+        f = np.frombuffer(bytes(f), dtype=np.uint8).astype(bool)
+        num_states = len(f)
+        t_q0 = t[q0 * num_cols:(q0 + 1) * num_cols]
+
+        # Each active match is a triple (line, j, q): w[j:k] leads to the state q.
+        # As the DFA is deterministic, the matches of a line that reach the same
+        # state are merged and only the one having the smallest j is kept. The
+        # others are said to be absorbed and are processed at the end.
+        (lines_, js, qs) = (empty, empty, empty)
+        last_k = np.full((n, m + 1), -1, dtype=np.int32)  # (line, j) -> last k
+        absorptions = list()
+        for k in range(m):
+            # Advance the active matches, start the new ones
+            qs = t[qs * num_cols + cols[k][lines_]]
+            new_lines = np.nonzero(t_q0[cols[k]] >= 0)[0]
+            lines_ = np.concatenate([lines_, new_lines])
+            js = np.concatenate([js, np.full(len(new_lines), k)])
+            qs = np.concatenate([qs, t_q0[cols[k][new_lines]]])
+            alive = qs >= 0
+            (lines_, js, qs) = (lines_[alive], js[alive], qs[alive])
+            if not len(lines_):
+                continue
+
+            # Merge the matches reaching the same (line, state) pair
+            keys = lines_ * num_states + qs
+            order = np.lexsort((js, keys))
+            (keys, lines_, js, qs) = (keys[order], lines_[order], js[order], qs[order])
+            is_first = np.ones(len(keys), dtype=bool)
+            is_first[1:] = keys[1:] != keys[:-1]
+            if not is_first.all():
+                firsts = np.maximum.accumulate(np.where(is_first, np.arange(len(keys)), 0))
+                absorbed = ~is_first
+                absorptions.append((lines_[absorbed], js[absorbed], js[firsts[absorbed]], k + 1))
+                (lines_, js, qs) = (lines_[is_first], js[is_first], qs[is_first])
+
+            is_final_ = f[qs]
+            last_k[lines_[is_final_], js[is_final_]] = k + 1
+
+        # An absorbed j gets the last k of the match that absorbed it, if this match
+        # reaches a final state afterwards. In this case, j is dropped, as the
+        # absorbing match has a smaller j. Absorptions are processed by decreasing
+        # time, so that the last k of the absorbing match is already up-to-date.
+        dropped = np.zeros((n, m + 1), dtype=bool)
+        for (lines_a, js_a, parents, k) in reversed(absorptions):
+            k_parents = last_k[lines_a, parents]
+            updated = k_parents >= k
+            (lines_a, js_a) = (lines_a[updated], js_a[updated])
+            last_k[lines_a, js_a] = k_parents[updated]
+            dropped[lines_a, js_a] = True
+
+        # For each (line, k), keep the smallest j such that last_k[line, j] == k.
+        (lines_, js) = np.nonzero((last_k >= 0) & ~dropped)
+        ks = last_k[lines_, js]
+        order = np.lexsort((js, ks, lines_))
+        (lines_, js, ks) = (lines_[order], js[order], ks[order])
+        keep = np.ones(len(lines_), dtype=bool)
+        keep[1:] = (lines_[1:] != lines_[:-1]) | (ks[1:] != ks[:-1])
+        (lines_, js, ks) = (lines_[keep], js[keep], ks[keep])
+        order = np.lexsort((ks, js, lines_))
+        (lines_, js, ks) = (lines_[order], js[order], ks[order])
+        bounds = np.searchsorted(lines_, np.arange(n + 1))
+        for i in np.nonzero(bounds[1:] > bounds[:-1])[0]:
+            (a, b) = (bounds[i], bounds[i + 1])
+            result[i][name] = list(zip(js[a:b].tolist(), ks[a:b].tolist()))
+    return result
 
 
 def multi_grep_with_delimiters(
@@ -183,25 +457,29 @@ class MultiGrepFunctorLargest(MultiGrepFunctor):
     """
 
     def __init__(self):
-        self.map_i_j_k = defaultdict(lambda: defaultdict(lambda: None))
+        # Maps each pattern with a list which maps each j with its k (-1 if unset).
+        # Lists are allocated at the first match, as the length of w is then known.
+        self.map_i_j_k = dict()
 
     def __call__(self, i, j, k, w):
-        # As we read w from left to right, k > self.map_pattern_indices[i][j]
-        self.map_i_j_k[i][j] = k
+        # As we read w from left to right, k > self.map_i_j_k[i][j]
+        try:
+            self.map_i_j_k[i][j] = k
+        except KeyError:
+            self.map_i_j_k[i] = [-1] * (len(w) + 1)
+            self.map_i_j_k[i][j] = k
 
     def indices(self) -> dict:
-        # Rebuild {i : [(j, k)]} for each (i, j) pair
+        # Rebuild {i : [(j, k)]} by keeping, for each k, the smallest j.
+        # As j increases, the result is sorted.
         result = defaultdict(list)
-        for i in self.map_i_j_k:
-            for k in set(self.map_i_j_k[i].values()):
-                result[i] += [(
-                    min(
-                        j for j in self.map_i_j_k[i].keys()
-                        if self.map_i_j_k[i][j] == k
-                    ),
-                    k
-                )]
-            result[i] = sorted(result[i])
+        for (i, j_k) in self.map_i_j_k.items():
+            seen = bytearray(len(j_k))
+            jks = result[i]
+            for (j, k) in enumerate(j_k):
+                if k >= 0 and not seen[k]:
+                    seen[k] = 1
+                    jks.append((j, k))
         return result
 
 
@@ -213,12 +491,17 @@ class MultiGrepFunctorGreedy(MultiGrepFunctorLargest):
 
     def __init__(self):
         super().__init__()
-        self.map_i_k_j = defaultdict(lambda: defaultdict(lambda: None))
+        # Maps each pattern with a list which maps each k with its j (-1 if unset).
+        self.map_i_k_j = dict()
 
     def __call__(self, i, j, k, w):
-        j_ = self.map_i_k_j[i][k]
-        if j_ is None or j < j_:
-            self.map_i_k_j[i][k] = j
+        try:
+            k_j = self.map_i_k_j[i]
+        except KeyError:
+            k_j = self.map_i_k_j[i] = [-1] * (len(w) + 1)
+        j_ = k_j[k]
+        if j_ < 0 or j < j_:
+            k_j[k] = j
             super().__call__(i, j, k, w)
 
 
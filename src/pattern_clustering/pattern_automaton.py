@@ -12,6 +12,7 @@ __email__ = "marc-olivier.buob@nokia-bell-labs.com, maxime.raynal@nokia.com"
 __copyright__ = "Copyright (C) 2022, Nokia"
 __license__ = "BSD-3"
 
+from collections import deque
 from functools import partial
 from pybgl.automaton import *
 from pybgl.deterministic_inclusion import deterministic_inclusion
@@ -32,7 +33,8 @@ class PatternAutomaton(Automaton):
         word: str,
         map_name_dfa: dict,
         make_mg: callable = None,
-        filtered_patterns :set = None
+        filtered_patterns :set = None,
+        indices: dict = None
     ):
         """
         Constructs the ``PatternAutomaton`` related to an input word according
@@ -42,19 +44,19 @@ class PatternAutomaton(Automaton):
             word (str): The input string.
             map_name_dfa (dict): The pattern collection mapping each pattern name (``str``)
                  with its corresponding ``Automaton`` instance. The ``"any"`` pattern is
-                 always ignored.
+                 always ignored. You may also pass the corresponding ``MultiGrepMatcher``.
             filtered_patterns (set): A subset (possibly empty) of ``map_name_dfa.keys()``
                 keying the types that must be caught my ``multi_grep``, but not appearing
                 in the arcs involved in the ``PatternAutomaton``. It may be used for instance
                 to drop spaces and get a smaller ``PatternAutomaton``, but the position
                 of spaces in the original lines will be lost.
+            indices (dict): The ``multi_grep`` results for ``word``, as returned by
+                ``MultiGrepFunctor.indices()`` or ``multi_grep_batch``. If set,
+                ``multi_grep`` is not called and ``map_name_dfa`` and ``make_mg`` are
+                ignored.
         """
         if filtered_patterns is None:
             filtered_patterns = set()
-        if not make_mg:
-            make_mg = MultiGrepFunctorLargest
-        _map_name_dfa = {k : v for (k, v) in map_name_dfa.items() if k != "any"}
-        mg = make_mg()
 
         # Add vertices
         n = len(word)
@@ -63,11 +65,16 @@ class PatternAutomaton(Automaton):
         self.w = word
 
         # Add edges
-        multi_grep(word, map_name_dfa, mg)
-        if mg.indices():
+        if indices is None:
+            if not make_mg:
+                make_mg = MultiGrepFunctorLargest
+            mg = make_mg()
+            multi_grep(word, map_name_dfa, mg)
+            indices = mg.indices()
+        if indices:
             vertices_with_successors = set()
             vertices_with_predecessors = set()
-            for (name, jks) in mg.indices().items():
+            for (name, jks) in indices.items():
                 if name in filtered_patterns:
                     continue
                 for (j, k) in jks:
@@ -144,6 +151,42 @@ class PatternAutomaton(Automaton):
         return deterministic_inclusion(self, pa) == 0
 
 
+def pattern_automaton_signature(g: PatternAutomaton) -> tuple:
+    """
+    Computes a canonical signature of a ``PatternAutomaton``. The states are
+    numbered by a breadth-first search from the initial state, exploring the
+    out-edges by increasing label. The signature gathers the number of
+    vertices and edges (as checked by ``PatternAutomaton.__eq__``, since the
+    states unreachable from the initial state are not explored) and maps each
+    explored state with its finality and its out-edges, as
+    ``(label, target number)`` pairs.
+
+    If the ``PatternAutomaton`` are deterministic and minimal (see
+    ``PatternAutomaton.__eq__``), two ``PatternAutomaton`` are equal
+    iff they have the same signature.
+
+    Args:
+        g (PatternAutomaton): The queried ``PatternAutomaton`` instance.
+    Returns:
+        The corresponding signature, which is hashable.
+    """
+    q0 = initial(g)
+    map_q_id = {q0: 0}
+    queue = deque([q0])
+    signature = list()
+    while queue:
+        q = queue.popleft()
+        transitions = list()
+        for (a, r) in sorted((label(e, g), target(e, g)) for e in out_edges(q, g)):
+            i = map_q_id.get(r)
+            if i is None:
+                i = map_q_id[r] = len(map_q_id)
+                queue.append(r)
+            transitions.append((a, i))
+        signature.append((is_final(q, g), tuple(transitions)))
+    return (num_vertices(g), num_edges(g), tuple(signature))
+
+
 def pattern_automaton_edge_weight(
     e: EdgeDescriptor,
     g: PatternAutomaton,
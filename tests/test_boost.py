@@ -10,9 +10,52 @@ __email__      = "marc-olivier.buob@nokia-bell-labs.com"
 __copyright__  = "Copyright (C) 2020, Nokia"
 __license__    = "Nokia"
 
+import math, subprocess, sys
 from pprint import pformat
 from pattern_clustering import *
 
+LINES = [
+    "Jun 14 15:16:01 combo sshd(pam_unix)[19939]: authentication failure; rhost=218.188.2.4",
+    "Jun 14 15:16:02 combo sshd(pam_unix)[19937]: check pass; user unknown",
+    "0.0.0.0         192.168.0.254   0.0.0.0         UG    600    0        0 wlp2s0",
+    "Jun 15 02:04:59 combo sshd(pam_unix)[20882]: authentication failure; rhost=220-135-151-1.hinet-ip.hinet.net",
+    "Jun 15 04:06:18 combo su(pam_unix)[21416]: session opened for user cyrus by (uid=0)",
+    "192.168.0.0     0.0.0.0         255.255.255.0   U     600    0        0 wlp2s0",
+]
+
+# The last line is at the same distance from the first two lines.
+TIE_LINES = ["afba 12 puboo", "qvyt 12 qnlqu", "afba 12 qnlqu"]
+
+
+def tie_max_dist() -> float:
+    # Returns a threshold such that the last line of TIE_LINES is close to
+    # the first two lines, which are far from each other.
+    pas = make_pattern_automata(TIE_LINES, PatternClusteringEnv.map_name_dfa)
+    densities = make_densities()
+    d20 = pattern_distance_normalized(pas[2], pas[0], densities)
+    d21 = pattern_distance_normalized(pas[2], pas[1], densities)
+    d01 = pattern_distance_normalized(pas[0], pas[1], densities)
+    assert d20 == d21 < d01
+    return (d20 + d01) / 2
+
+
+def clustering_cases() -> list:
+    # Returns the (lines, max_dist) pairs on which the options of
+    # pattern_clustering are checked.
+    return [(LINES * 3, max_dist) for max_dist in [0.05, 0.2, 0.6]] + [(TIE_LINES, tie_max_dist())]
+
+
+def check_same_as_serial(lines: list, max_dist: float, num_runs: int = 1, **kwargs) -> list:
+    # Checks that pattern_clustering, run with the kwargs options, returns
+    # the clusters of the serial algorithm.
+    order = kwargs.get("order", RepresentativeOrder.CREATION)
+    expected = pattern_clustering(lines, max_dist=max_dist, use_async=False, order=order)
+    for _ in range(num_runs):
+        obtained = pattern_clustering(lines, max_dist=max_dist, **kwargs)
+        assert obtained == expected, f"{pformat(locals())}"
+    return expected
+
+
 def test_pattern_clustering_env():
     env = PatternClusteringEnv()
     assert env.map_name_dfa
@@ -46,6 +89,34 @@ def test_pattern_clustering_env_set_patterns():
     assert obtained == expected
 
 
+def test_pattern_clustering_env_lazy():
+    # Importing pattern_clustering must not compile the default pattern collection.
+    script = "\n".join([
+        "from pattern_clustering import PatternClusteringEnv",
+        "assert 'map_name_dfa' not in vars(PatternClusteringEnv)",
+        "PatternClusteringEnv.map_name_density",
+        "assert 'map_name_dfa' in vars(PatternClusteringEnv)",
+    ])
+    subprocess.run([sys.executable, "-c", script], check=True)
+
+    # The alphabet set before the first use is kept.
+    script = "\n".join([
+        "from pattern_clustering import PatternClusteringEnv",
+        "PatternClusteringEnv.alphabet = set('abc ')",
+        "PatternClusteringEnv.map_name_density",
+        "assert PatternClusteringEnv.alphabet == set('abc ')",
+    ])
+    subprocess.run([sys.executable, "-c", script], check=True)
+
+    # Already seen pattern collections are not recompiled.
+    env = PatternClusteringEnv()
+    env.reset()
+    map_name_dfa = env.map_name_dfa
+    env.set_patterns({"abc": "abc"})
+    env.reset()
+    assert env.map_name_dfa["int"] is map_name_dfa["int"]
+
+
 def test_make_densities():
     map_name_density = {"a" : 0.1, "c" : 0.2, "b" : 0.3, "d" : 0.0}
     obtained = make_densities(map_name_density)
@@ -63,6 +134,43 @@ def test_make_pattern_automaton():
     assert num_edges(g1) == num_edges(g2) == 132
 
 
+def test_make_pattern_automaton_multi_grep_cache():
+    from pattern_clustering.boost import _get_multi_grep
+    map_name_dfa = make_map_name_dfa()
+    mg = _get_multi_grep(map_name_dfa)
+    assert _get_multi_grep(map_name_dfa) is mg
+    assert _get_multi_grep(dict(map_name_dfa)) is mg
+    # The pattern collection is modified.
+    map_name_dfa = make_map_name_dfa(MAP_NAME_RE, ["any", "int"])
+    assert "0--[1]-->3" not in str(make_pattern_automaton("abc", map_name_dfa))
+    mg = _get_multi_grep(map_name_dfa)
+    map_name_dfa["int"] = make_map_name_dfa(MAP_NAME_RE, ["word"])["word"]
+    assert _get_multi_grep(map_name_dfa) is not mg
+    assert "0--[1]-->3" in str(make_pattern_automaton("abc", map_name_dfa))
+
+
+def test_multi_grep_invalid():
+    from pattern_clustering.pattern_clustering import MultiGrep as _MultiGrep
+    # num_cols, byte_cols, deltas, finals, initials, labels, alphabet_size, any_label
+    args = (2, [0] * 256, [[0, 0]], [[True]], [0], [0], 1, 0)
+    mg = _MultiGrep(*args)
+    assert mg.make_pattern_automaton("abc" * 1000, MultiGrepStrategy.LARGEST).num_vertices() == 3001
+    for (i, value) in [
+        (1, [10 ** 9] * 256),
+        (2, [[0, 5]]),
+        (2, [[0, -2]]),
+        (4, [1]),
+        (4, [-1]),
+        (5, [1]),
+        (7, 2),
+    ]:
+        try:
+            _MultiGrep(*args[:i], value, *args[i + 1:])
+            assert False, (i, value)
+        except RuntimeError:
+            pass
+
+
 def test_pattern_distance():
     obtained = pattern_distance(
         "0.0.0.0         192.168.0.254   0.0.0.0         UG    600    0        0 wlp2s0",
@@ -70,7 +178,7 @@ def test_pattern_distance():
         normalized = True
     )
     expected = 0.007259624900493844
-    assert obtained == expected, f"{pformat(locals())}"
+    assert math.isclose(obtained, expected, rel_tol=1e-12), f"{pformat(locals())}"
 
 
 def test_custom_collection():
@@ -87,3 +195,496 @@ hdr_a    hdr_b    hdr_c
         max_dist=0.3
     )
     assert res == [0, 0, 2, 3, 3, 3], f"{pformat(locals())}"
+
+
+def test_make_pattern_automata():
+    map_name_dfa = make_map_name_dfa()
+    map_name_id = {name: i for (i, name) in enumerate(sorted(map_name_dfa.keys()))}
+    lines = [
+        "",
+        "abc",
+        "0.0.0.0         192.168.0.254   0.0.0.0         UG    600    0        0 wlp2s0",
+        "Jun 14 15:16:01 combo sshd(pam_unix)[19939]: authentication failure; rhost=218.188.2.4",
+    ]
+    for make_mg in [None, MultiGrepFunctorAll, MultiGrepFunctorLargest]:
+        pas = make_pattern_automata(lines, map_name_dfa, make_mg)
+        assert len(pas) == len(lines)
+        for (line, _g) in zip(lines, pas):
+            g = make_pattern_automaton_python(line, map_name_dfa, make_mg)
+            expected = sorted(
+                f"{source(e, g)}--[{map_name_id[label(e, g)]}]-->{target(e, g)}"
+                for e in edges(g)
+            )
+            obtained = sorted(str(_g).split())
+            assert _g.get_word() == line
+            assert obtained == expected, f"{pformat(locals())}"
+
+
+def test_group_by_identical_pa():
+    map_name_dfa = make_map_name_dfa()
+    lines = [
+        "",
+        "abc",
+        "abd",
+        "abc def",
+        "0.0.0.0         192.168.0.254   0.0.0.0         UG    600    0        0 wlp2s0",
+        "192.168.0.0     0.0.0.0         255.255.255.0   U     600    0        0 wlp2s0",
+        "10.0.0.0        10.0.0.254      10.0.0.0        UG    100    0        0 eth0",
+        "Jun 14 15:16:01 combo sshd(pam_unix)[19939]: authentication failure; rhost=218.188.2.4",
+        "Jun 14 15:16:02 combo sshd(pam_unix)[19937]: check pass; user unknown",
+        "Jun 15 02:04:59 combo sshd(pam_unix)[20882]: authentication failure; rhost=220.135.151.1",
+        "Jun 15 04:06:18 combo su(pam_unix)[21416]: session opened for user cyrus by (uid=0)",
+        "Jul 1 4:06:18 combo su(pam_unix)[1]: session opened for user news by (uid=10)",
+        "1.2 3.4 5",
+        "1 2.3 4.5",
+        "11.22.33.44 55.66 789",
+        "1.2.3.4 77.88 90",
+    ] * 2
+    pas = [
+        PatternAutomaton(line, map_name_dfa, MultiGrepFunctorLargest)
+        for line in lines
+    ]
+    expected = group_by_identical_pa(pas, are_equal=lambda pa1, pa2: pa1 == pa2)
+    obtained = group_by_identical_pa(pas)
+    assert obtained == expected, f"{pformat(locals())}"
+    assert list(obtained.keys()) == list(expected.keys())
+    assert len(obtained) < len(lines) // 2
+
+    # With the default patterns, some PAs have states unreachable from
+    # their initial state, e.g., for "/usr/lib ==".
+    map_name_dfa = PatternClusteringEnv.map_name_dfa
+    lines = ["/usr/lib ==", ": :", "x ==", "/usr/lib ==", "x =="]
+    pas = [
+        PatternAutomaton(line, map_name_dfa, MultiGrepFunctorLargest)
+        for line in lines
+    ]
+    expected = group_by_identical_pa(pas, are_equal=lambda pa1, pa2: pa1 == pa2)
+    obtained = group_by_identical_pa(pas)
+    assert obtained == expected, f"{pformat(locals())}"
+
+
+def test_pattern_automaton_executor():
+    map_name_dfa = make_map_name_dfa()
+    lines = [
+        "",
+        "abc",
+        "0.0.0.0         192.168.0.254   0.0.0.0         UG    600    0        0 wlp2s0",
+        "Jun 14 15:16:01 combo sshd(pam_unix)[19939]: authentication failure; rhost=218.188.2.4",
+    ] * 5
+    expected = [
+        make_pattern_automaton_python(line, map_name_dfa, MultiGrepFunctorGreedy)
+        for line in lines
+    ]
+    with PatternAutomatonExecutor(
+        map_name_dfa, MultiGrepFunctorGreedy,
+        processes=2, chunksize=3, min_batch_size=0
+    ) as executor:
+        assert not executor.is_in_process(lines)
+        # The pool is reused from one batch to the next one.
+        assert executor.map(lines) == expected
+        pool = executor.pool
+        assert list(executor.imap(iter(lines))) == expected
+        assert executor.pool is pool
+        clusters = pattern_clustering_with_preprocess(
+            lines, map_name_dfa, make_mg=MultiGrepFunctorGreedy, executor=executor
+        )
+        assert clusters[:4] == clusters[4:8]
+    assert executor.pool is None
+
+    executor = PatternAutomatonExecutor(map_name_dfa, min_batch_size=len(lines) + 1)
+    assert executor.is_in_process(lines)
+    assert executor.map(lines) == [
+        make_pattern_automaton_python(line, map_name_dfa)
+        for line in lines
+    ]
+    assert executor.pool is None
+
+
+def test_pattern_automaton_add_edges():
+    from array import array
+    import numpy as np
+    from pattern_clustering.pattern_clustering import PatternAutomaton as _PatternAutomaton
+    edges = [(0, 1, 2), (0, 2, 0), (1, 3, 1), (0, 3, 2), (2, 3, 1), (3, 4, 0)]
+    expected = _PatternAutomaton(5, 3, "abcd")
+    expected.add_edge(1, 2, 0)
+    for (q, r, a) in edges:
+        expected.add_edge(q, r, a)
+    (qs, rs, labels) = zip(*edges)
+    for make_array in [
+        list,
+        lambda x: array("i", x),
+        lambda x: array("B", x),
+        lambda x: np.array(x, dtype=np.int64),
+        lambda x: np.array(x, dtype=np.uint16),
+    ]:
+        obtained = _PatternAutomaton(5, 3, "abcd")
+        obtained.add_edge(1, 2, 0)
+        obtained.add_edges(make_array(qs), make_array(rs), make_array(labels))
+        assert str(obtained) == str(expected)
+
+    # Invalid edges are rejected and the automaton is left unchanged.
+    for (qs, rs, labels) in [
+        ([0, 1], [1, 2], [0]),
+        ([0, 5], [1, 2], [0, 0]),
+        ([0, -1], [1, 2], [0, 0]),
+        ([0, 1], [1, 2], [0, 3]),
+        (np.array([[0, 1]]), [1, 2], [0, 0]),
+        (np.array([0.0, 1.0]), [1, 2], [0, 0]),
+        (np.array([0, 2 ** 40]), [1, 2], [0, 0]),
+    ]:
+        obtained = _PatternAutomaton(5, 3, "abcd")
+        try:
+            obtained.add_edges(qs, rs, labels)
+            assert False, f"{pformat(locals())}"
+        except (RuntimeError, TypeError, OverflowError):
+            pass
+        assert obtained.num_edges() == 0
+
+
+def test_pattern_automaton_pickle():
+    import pickle
+    map_name_dfa = make_map_name_dfa()
+    lines = [
+        "",
+        "abc",
+        "0.0.0.0         192.168.0.254   0.0.0.0         UG    600    0        0 wlp2s0",
+        "Jun 14 15:16:01 combo sshd(pam_unix)[19939]: authentication failure; rhost=218.188.2.4",
+        "é 12 €3.4",
+    ]
+    densities = make_densities()
+    for line in lines:
+        pa = make_pattern_automaton(line, map_name_dfa)
+        obtained = pickle.loads(pickle.dumps(pa))
+        assert obtained.get_word() == pa.get_word()
+        assert obtained.alphabet_size() == pa.alphabet_size()
+        assert str(obtained) == str(pa)
+        assert (
+            pattern_distance_normalized(obtained, pa, densities)
+            == pattern_distance_normalized(pa, pa, densities)
+        )
+
+    # The C++ pattern automata are built and pickled by the worker processes.
+    with PatternAutomatonExecutor(
+        map_name_dfa, MultiGrepFunctorGreedy,
+        processes=2, chunksize=1, min_batch_size=0
+    ) as executor:
+        pas = make_pattern_automata(lines, map_name_dfa, MultiGrepFunctorGreedy, executor)
+        assert executor.pool is not None
+    assert [str(pa) for pa in pas] == [
+        str(make_pattern_automaton(line, map_name_dfa, MultiGrepFunctorGreedy))
+        for line in lines
+    ]
+
+    # Pattern automata built by hand.
+    import struct
+    from pattern_clustering.pattern_clustering import PatternAutomaton as _PatternAutomaton
+    alphabet_size = len(map_name_dfa)
+    backward_edge = _PatternAutomaton(4, alphabet_size, "abc")
+    backward_edge.add_edge(2, 1, 0)
+    added_vertex = _PatternAutomaton(2, 2, "ab")
+    added_vertex.add_vertex()
+    added_vertex.add_edge(2, 0, 1)
+    for pa in [
+        _PatternAutomaton(),
+        _PatternAutomaton(3, 2),
+        _PatternAutomaton(2, 2, "ab"),
+        _PatternAutomaton(5, alphabet_size, "abc"),
+        backward_edge,
+        added_vertex,
+    ]:
+        obtained = pickle.loads(pickle.dumps(pa))
+        assert obtained.get_word() == pa.get_word()
+        assert obtained.alphabet_size() == pa.alphabet_size()
+        assert obtained.num_vertices() == pa.num_vertices()
+        assert str(obtained) == str(pa)
+
+    # Corrupted edges (the last 8 bytes encode the label and the target of the last edge).
+    pa = _PatternAutomaton(4, alphabet_size, "abc")
+    pa.add_edge(0, 3, 0)
+    data = pa.__getstate__()
+    for (a, r) in [(alphabet_size, 3), (0, 4), (0, -1)]:
+        obtained = _PatternAutomaton()
+        try:
+            obtained.__setstate__(data[:-8] + struct.pack("=Ii", a, r))
+            assert False, (a, r)
+        except RuntimeError:
+            pass
+
+
+def test_lcs_length():
+    from pattern_clustering.pattern_clustering import lcs_length, lcs_length_dp
+    words = ["", "a", "abc", "acb", "192.168.0.1", "x" * 64, "xy" * 40, "yx" * 100]
+    for w1 in words:
+        for w2 in words:
+            assert lcs_length(w1, w2) == lcs_length_dp(w1, w2), f"{pformat(locals())}"
+    assert lcs_length("x" * 64, "xy" * 40) == 40
+    assert lcs_length("yx" * 100, "xy" * 100) == 199
+
+
+def test_lcs_cache():
+    lcs_cache = LcsCache(2)
+    assert lcs_cache.lcs_length("abc", "axc") == 2
+    assert lcs_cache.lcs_length("axc", "abc") == 2
+    assert (lcs_cache.hits(), lcs_cache.misses(), lcs_cache.size()) == (1, 1, 1)
+    lcs_cache.lcs_length("a", "b")
+    lcs_cache.lcs_length("c", "d")
+    assert lcs_cache.size() == 2
+    lcs_cache.lcs_length("abc", "axc")  # Evicted (least recently used)
+    assert (lcs_cache.hits(), lcs_cache.misses()) == (1, 4)
+
+    for use_async in [True, False]:
+        lcs_cache = LcsCache()
+        check_same_as_serial(LINES * 2, 0.2, use_async=use_async, lcs_cache=lcs_cache)
+        assert lcs_cache.hits() > 0
+        assert lcs_cache.misses() >= lcs_cache.size() > 0
+
+
+def test_pattern_distance_heuristic():
+    lines = [
+        "Jun 14 15:16:01 combo sshd(pam_unix)[19939]: authentication failure; rhost=218.188.2.4",
+        "Jun 15 04:06:18 combo su(pam_unix)[21416]: session opened for user cyrus by (uid=0)",
+        "0.0.0.0         192.168.0.254   0.0.0.0         UG    600    0        0 wlp2s0",
+    ]
+    for w1 in lines:
+        for w2 in lines:
+            for normalized in [True, False]:
+                expected = pattern_distance(w1, w2, normalized=normalized)
+                obtained = pattern_distance(w1, w2, normalized=normalized, use_heuristic=True)
+                assert abs(obtained - expected) < 1e-9, f"{pformat(locals())}"
+
+    stats = [PatternDistanceStats(), PatternDistanceStats()]
+    clusters = [
+        pattern_clustering(lines * 2, max_dist=0.3, use_async=False, use_heuristic=use_heuristic, stats=stats[use_heuristic])
+        for use_heuristic in [False, True]
+    ]
+    assert clusters[0] == clusters[1]
+    assert stats[0].calls() == stats[1].calls() > 0
+    assert stats[0].heap_pops() >= stats[1].heap_pops() > 0
+
+    # A hand-built PA having more vertices than its word.
+    from pattern_clustering.pattern_clustering import PatternAutomaton as _PatternAutomaton
+    from pattern_clustering.pattern_clustering import pattern_distance as _pattern_distance
+    map_name_dfa = PatternClusteringEnv.map_name_dfa
+    densities = PatternClusteringEnv.densities()
+    pa1 = _PatternAutomaton(10000000, len(map_name_dfa), "ab")
+    pa1.add_edge(0, 9999999, sorted(map_name_dfa).index("int"))
+    pa2 = make_pattern_automaton("ab", map_name_dfa)
+    for use_heuristic in [False, True]:
+        assert _pattern_distance(pa1, pa2, densities, use_heuristic=use_heuristic) < 0
+
+
+def test_pattern_clustering_prefilter():
+    lines = LINES + ["x"]
+    for use_async in [True, False]:
+        stats = [PatternDistanceStats(), PatternDistanceStats()]
+        clusters = [
+            pattern_clustering(lines, max_dist=0.1, use_async=use_async, stats=stats[use_prefilter], use_prefilter=use_prefilter)
+            for use_prefilter in [False, True]
+        ]
+        assert clusters[0] == clusters[1]
+        assert stats[0].skips() == 0
+        assert stats[1].skips() > 0
+        assert stats[0].calls() == stats[1].calls() + stats[1].skips()
+
+    # The features of a hand-built PA having more vertices than its word.
+    from pattern_clustering.pattern_clustering import PatternAutomaton as _PatternAutomaton
+    clusterer = PatternClusterer(max_dist=0.5)
+    pa = _PatternAutomaton(10000000, len(clusterer.map_name_dfa), "ab")
+    pa.add_edge(0, 9999999, sorted(clusterer.map_name_dfa).index("int"))
+    assert clusterer.clusterer.add_representatives([pa]) == [0]
+
+
+def test_pattern_clustering_num_threads():
+    for (lines, max_dist) in clustering_cases():
+        for num_threads in [0, 1, 3]:
+            check_same_as_serial(lines, max_dist, use_async=True, num_threads=num_threads)
+
+
+def test_pattern_clustering_zero_distance():
+    lines = [LINES[0], LINES[2], LINES[0]]
+    stats = PatternDistanceStats()
+    clusters = pattern_clustering(lines, max_dist=0.1, use_async=False, stats=stats, use_prefilter=False)
+    assert clusters == [0, 1, 0]
+    assert stats.calls() == 2  # The last line is not compared to the second one.
+
+
+def test_pattern_clustering_ties():
+    # The last line must join the first cluster, whatever the thread
+    # finishing first.
+    expected = check_same_as_serial(
+        TIE_LINES, tie_max_dist(), num_runs=500, use_async=True, num_threads=4
+    )
+    assert expected == [0, 1, 0]
+
+
+def test_pattern_clustering_order():
+    lines = [LINES[0], LINES[2], LINES[4], LINES[5], LINES[5], LINES[4]]
+    expected = pattern_clustering(lines, max_dist=0.1, use_async=False)
+    map_order_calls = dict()
+    for order in RepresentativeOrder.values.values():
+        stats = PatternDistanceStats()
+        obtained = [
+            pattern_clustering(lines, max_dist=0.1, use_async=use_async, order=order, stats=stats, use_prefilter=False)
+            for use_async in [False, True]
+        ]
+        assert obtained[0] == obtained[1] == expected, f"{pformat(locals())}"
+        map_order_calls[order] = stats.calls()
+    # The last line exactly matches the second most recently matched representative.
+    assert (
+        map_order_calls[RepresentativeOrder.MOVE_TO_FRONT]
+        < map_order_calls[RepresentativeOrder.CREATION]
+    )
+
+
+def test_pattern_clustering_block_size():
+    for order in RepresentativeOrder.values.values():
+        for (lines, max_dist) in clustering_cases():
+            for use_async in [False, True]:
+                for block_size in [1, 4, 100]:
+                    check_same_as_serial(
+                        lines, max_dist, use_async=use_async, num_threads=3,
+                        order=order, block_size=block_size
+                    )
+
+
+def test_assign_to_clusters():
+    lines = LINES
+    max_dist = 0.1
+    clusters = pattern_clustering(lines, max_dist=max_dist, use_async=False)
+    rows = sorted(set(clusters))
+    representatives = [lines[row] for row in rows]
+    for use_async in [False, True]:
+        assignments = assign_to_clusters(lines, representatives, max_dist=max_dist, use_async=use_async)
+        assert len(assignments) == len(lines)
+        for (row, (i, dist)) in enumerate(assignments):
+            assert rows[i] == clusters[row]
+            assert 0.0 <= dist < max_dist
+            assert (dist == 0.0) == (row in rows)
+    assert assign_to_clusters(["Hello world"], representatives, max_dist=max_dist) == [None]
+    assert assign_to_clusters(lines, [], max_dist=max_dist) == [None] * len(lines)
+
+
+def test_pattern_clusterer():
+    lines = LINES * 2
+    for order in RepresentativeOrder.values.values():
+        expected = pattern_clustering(lines, max_dist=0.1, order=order)
+        for batch_size in [1, 5, len(lines)]:
+            clusterer = PatternClusterer(max_dist=0.1, order=order, block_size=batch_size % 3)
+            obtained = list()
+            for i in range(0, len(lines), batch_size):
+                obtained += clusterer.add_lines(lines[i:i + batch_size])
+            assert obtained == expected, f"{pformat(locals())}"
+            assert clusterer.num_lines == len(lines)
+            assert clusterer.representative_ids == sorted(set(expected))
+            assert clusterer.representatives == [lines[i] for i in clusterer.representative_ids]
+
+
+def test_pattern_clusterer_threads():
+    from concurrent.futures import ThreadPoolExecutor
+    lines = LINES
+    num_batches = 8
+    expected = pattern_clustering(lines * num_batches, max_dist=0.1, use_async=False)
+    expected_batches = [
+        expected[i:i + len(lines)]
+        for i in range(0, len(expected), len(lines))
+    ]
+    for use_async in [False, True]:
+        clusterer = PatternClusterer(max_dist=0.1, use_async=use_async, num_threads=2)
+        with ThreadPoolExecutor(4) as executor:
+            # Whatever the interleaving, each batch is clustered as if the
+            # batches were added one after the other.
+            obtained_batches = list(executor.map(
+                lambda _: clusterer.add_lines(lines),
+                range(num_batches)
+            ))
+        assert sorted(obtained_batches) == sorted(expected_batches), f"{pformat(locals())}"
+        assert clusterer.num_lines == len(expected)
+        assert clusterer.representative_ids == sorted(set(expected))
+        assert clusterer.representatives == [
+            lines[i % len(lines)] for i in clusterer.representative_ids
+        ]
+        assert clusterer.clusterer.representative_words() == clusterer.representatives
+
+
+def test_pattern_clusterer_save_load(tmp_path):
+    lines = LINES * 2
+    filename = str(tmp_path / "model.bin")
+    for order in RepresentativeOrder.values.values():
+        expected = PatternClusterer(max_dist=0.1, order=order)
+        expected.add_lines(lines[:5])
+        expected.save(filename)
+        obtained = PatternClusterer.load(filename)
+        assert obtained.max_dist == expected.max_dist
+        assert obtained.order == expected.order
+        assert obtained.densities == expected.densities
+        assert obtained.num_lines == expected.num_lines
+        assert obtained.representatives == expected.representatives
+        assert obtained.representative_ids == expected.representative_ids
+        assert obtained.add_lines(lines[5:]) == expected.add_lines(lines[5:])
+
+    # Representatives added without any comparison.
+    clusterer = PatternClusterer(max_dist=0.1)
+    assert clusterer.add_representatives(lines[:3]) == [0, 1, 2]
+    assert clusterer.add_lines(lines[6:9]) == [0, 1, 2]
+    clusterer.save(filename)
+    assert PatternClusterer.load(filename).representatives == lines[:3]
+
+    # Corrupted files.
+    with open(filename, "rb") as f:
+        data = f.read()
+    for corrupted in [b"", b"not a model", data[:-1], data + b"\0"]:
+        with open(filename, "wb") as f:
+            f.write(corrupted)
+        try:
+            PatternClusterer.load(filename)
+            assert False, f"{corrupted!r}"
+        except (ValueError, RuntimeError):
+            pass
+
+    # Inflated number of representatives.
+    import struct
+    from pattern_clustering.pattern_clustering import PatternClusterer as _PatternClusterer
+    blob = clusterer.clusterer.save()
+    pos = 4 + 8 + 8 * len(clusterer.densities) + 8 + 4 + 8
+    assert struct.unpack_from("=Q", blob, pos) == (3,)
+    for num_representatives in [2 ** 40, 2 ** 62]:
+        corrupted = blob[:pos] + struct.pack("=Q", num_representatives) + blob[pos + 8:]
+        try:
+            _PatternClusterer.load(corrupted)
+            assert False, num_representatives
+        except RuntimeError as e:
+            assert str(e).startswith("PatternClusterer::load"), str(e)
+
+    # Invalid pattern automata.
+    from pattern_clustering.pattern_clustering import PatternAutomaton as _PatternAutomaton
+    alphabet_size = len(clusterer.map_name_dfa)
+    pa = _PatternAutomaton(4, alphabet_size, "abc")
+    pa.add_edge(0, 3, 0)
+    clusterer = PatternClusterer(max_dist=0.1)
+    clusterer.add_representatives(lines[:1])
+    clusterer.clusterer.add_representatives([pa])
+    blob = clusterer.clusterer.save()
+    data = pa.__getstate__()
+    pos = blob.index(data) + len(data)
+    for (a, r) in [(alphabet_size, 3), (0, 4)]:
+        corrupted = blob[:pos - 8] + struct.pack("=Ii", a, r) + blob[pos:]
+        try:
+            _PatternClusterer.load(corrupted)
+            assert False, (a, r)
+        except RuntimeError as e:
+            assert str(e).startswith("PatternAutomaton::load"), str(e)
+
+    # Pattern automata whose vertices go beyond the end of their word,
+    # or whose edges go backward, can be loaded and compared to other lines.
+    int_label = sorted(clusterer.map_name_dfa).index("int")
+    pa = _PatternAutomaton(1000, alphabet_size, "ab")
+    pa.add_edge(0, 999, int_label)
+    pa.add_edge(999, 1, int_label)
+    pa.add_edge(1, 2, int_label)
+    for max_dist in [0.1, 0.9]:
+        clusterer = PatternClusterer(max_dist=max_dist)
+        clusterer.add_representatives(lines[:1])
+        clusterer.clusterer.add_representatives([pa])
+        clusterer.save(filename)
+        obtained = PatternClusterer.load(filename)
+        assert len(obtained.add_lines(lines + ["ab", "12"])) == len(lines) + 2
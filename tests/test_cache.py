@@ -0,0 +1,90 @@
+#!/usr/bin/env pytest
+# -*- coding: utf-8 -*-
+#
+# This file is part of the pattern-clustering project.
+# https://github.com/nokia/pattern-clustering
+
+__author__ = "Marc-Olivier Buob, Maxime Raynal"
+__maintainer__ = "Marc-Olivier Buob, Maxime Raynal"
+__email__ = "marc-olivier.buob@nokia-bell-labs.com, maxime.raynal@nokia.com"
+__copyright__ = "Copyright (C) 2022, Nokia"
+__license__ = "Nokia"
+
+import os, string
+from pprint import pformat
+from pybgl.automaton import accepts
+from pattern_clustering import (
+    MAP_NAME_RE, PatternCache, PatternClusteringEnv, default_cache_dir,
+    default_disk_cache, dfa_from_dict, dfa_to_dict, language_density,
+    make_map_name_dfa, make_map_name_dfa_density
+)
+import pattern_clustering.cache
+
+NAMES = ["float", "hexa", "int", "ipv4", "spaces", "uint", "word"]
+
+
+def test_dfa_to_dict():
+    map_name_dfa = make_map_name_dfa(MAP_NAME_RE, NAMES)
+    for (name, g) in map_name_dfa.items():
+        d = dfa_to_dict(g)
+        assert dfa_to_dict(dfa_from_dict(d)) == d, f"{pformat(locals())}"
+
+
+def test_pattern_cache(tmp_path):
+    cache = PatternCache(str(tmp_path))
+    expected_dfa = make_map_name_dfa(MAP_NAME_RE, NAMES)
+    for _ in range(2):
+        (map_name_dfa, map_name_density) = make_map_name_dfa_density(
+            MAP_NAME_RE, NAMES, cache=cache
+        )
+        assert set(map_name_dfa) == set(NAMES)
+        for name in NAMES:
+            assert dfa_to_dict(map_name_dfa[name]) == dfa_to_dict(expected_dfa[name])
+            assert map_name_density[name] == language_density(expected_dfa[name])
+    num_entries = len({MAP_NAME_RE[name] for name in NAMES})
+    assert len(os.listdir(cache.cache_dir)) == num_entries
+
+    # Changing the regular expression invalidates the entry.
+    (g, density) = cache.compile("x[0-9]+")
+    assert accepts("x123", g)
+    (g, density) = cache.compile("x[a-z]+")
+    assert not accepts("x123", g) and accepts("xabc", g)
+    assert len(os.listdir(cache.cache_dir)) == num_entries + 2
+
+    # Corrupted entries are ignored and overwritten.
+    with open(cache.path("[a-z]+", set("abc"), 30), "w") as f:
+        f.write("{")
+    assert cache.load("[a-z]+", set("abc"), 30) is None
+    (g, density) = cache.compile("[a-z]+", set("abc"))
+    assert cache.load("[a-z]+", set("abc"), 30)[1] == density
+
+
+def test_pattern_cache_version(tmp_path, monkeypatch):
+    cache = PatternCache(str(tmp_path))
+    (g, density) = cache.compile("x[0-9]+")
+    assert cache.load("x[0-9]+", set(string.printable), 30) is not None
+    # Changing how the densities are computed invalidates the entries.
+    monkeypatch.setattr(pattern_clustering.cache, "DENSITY_VERSION", -1)
+    assert cache.load("x[0-9]+", set(string.printable), 30) is None
+
+
+def test_default_disk_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "xdg"))
+    assert default_cache_dir() == str(tmp_path / "xdg" / "pattern_clustering")
+
+    # The on-disk cache is disabled by default.
+    monkeypatch.delenv("PATTERN_CLUSTERING_CACHE_DIR", raising=False)
+    assert default_disk_cache() is None
+    monkeypatch.setenv("PATTERN_CLUSTERING_CACHE_DIR", str(tmp_path / "cache"))
+    cache = default_disk_cache()
+    assert cache.cache_dir.startswith(str(tmp_path / "cache"))
+
+    # PatternClusteringEnv fills the cache, if any.
+    monkeypatch.setattr(PatternClusteringEnv, "disk_cache", cache)
+    monkeypatch.setattr(PatternClusteringEnv, "cache", dict())
+    try:
+        PatternClusteringEnv.set_patterns({"abc": "abc"})
+        assert len(os.listdir(cache.cache_dir)) == 2  # "abc" and "any"
+    finally:
+        monkeypatch.undo()
+        PatternClusteringEnv.reset()
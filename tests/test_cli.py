@@ -11,6 +11,7 @@ __copyright__  = "Copyright (C) 2023, Nokia"
 __license__    = "Nokia"
 
 import json
+import math
 import subprocess
 from pattern_clustering.cli import *
 
@@ -37,4 +38,12 @@ def call(cmd: str) -> str:
 def test_main_pattern_distance():
     w1 = "0.0.0.0         192.168.0.254   0.0.0.0         UG    600    0        0 wlp2s0"
     w2 = "192.168.0.0     0.0.0.0         255.255.255.0   U     600    0        0 wlp2s0"
-    assert call(f"pattern-distance -n '{w1}' '{w2}'") == "0.007259624900493844"
+    obtained = float(call(f"pattern-distance -n '{w1}' '{w2}'"))
+    assert math.isclose(obtained, 0.007259624900493844, rel_tol=1e-12)
+
+
+def test_main_pattern_clustering_order(tmp_path):
+    filename = tmp_path / "input.log"
+    filename.write_text("a 1\nb 2\na 1\n")
+    for order in ["creation", "move-to-front", "frequency"]:
+        assert json.loads(call(f"pattern-clustering -n -r {order} -i {filename}")) == [0, 0, 0]
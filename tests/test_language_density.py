@@ -10,7 +10,7 @@ __email__ = "marc-olivier.buob@nokia-bell-labs.com, maxime.raynal@nokia.com"
 __copyright__ = "Copyright (C) 2022, Nokia"
 __license__ = "Nokia"
 
-import math
+import math, string
 from pprint import pformat
 from pattern_clustering import MAP_NAME_RE, PatternAutomaton, language_density, make_map_name_dfa
 
@@ -28,3 +28,16 @@ def test_language_density():
         if name in map_name_expected:
             obtained = language_density(g)
             assert math.isclose(obtained, map_name_expected[name]), f"test_language_density: {pformat(locals())}"
+
+
+def test_language_density_series():
+    map_name_dfa = make_map_name_dfa(MAP_NAME_RE, ["float", "int", "ipv4", "spaces", "uint", "word"])
+    for (name, g) in map_name_dfa.items():
+        for n_max in [1, 2, 10, 30]:
+            # The default series is computed in closed form.
+            obtained = language_density(g, n_max=n_max)
+            expected = language_density(g, n_max=n_max, series=lambda k: 1 / (2 ** k))
+            assert math.isclose(obtained, expected, abs_tol=1e-15), f"test_language_density_series: {pformat(locals())}"
+    g = map_name_dfa["uint"]
+    assert language_density(g, n_max=1) == 0.0
+    assert math.isclose(language_density(g, n_max=2), 10 / (2 * len(string.printable)))
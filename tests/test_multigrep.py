@@ -36,6 +36,32 @@ def test_multi_grep_largest():
         "ipv4" : ["1.2.3.4", "5.6.7.8"],
     }
 
+def test_multi_grep_greedy():
+    fonctor = MultiGrepFunctorGreedy()
+    multi_grep(W, MAP_NAME_DFA, fonctor)
+    assert multi_grep_fonctor_to_dict(W, fonctor) == {
+        "int"  : ["1", "2", "3", "4", "5", "6", "7", "8"],
+        "float": ["1.2", "2.3", "3.4", "5.6", "6.7", "7.8"],
+        "ipv4" : ["1.2.3.4", "5.6.7.8"],
+    }
+
+def test_multi_grep_largest_long_line():
+    w = "12.345 6789 " * 500
+    for make_mg in [MultiGrepFunctorLargest, MultiGrepFunctorGreedy]:
+        fonctor = make_mg()
+        multi_grep(w, MAP_NAME_DFA, fonctor)
+        indices = fonctor.indices()
+        assert indices["int"] == [
+            (12 * i + j, 12 * i + k)
+            for i in range(500)
+            for (j, k) in [(0, 2), (3, 6), (7, 11)]
+        ]
+        assert indices["float"] == [
+            (12 * i + j, 12 * i + k)
+            for i in range(500)
+            for (j, k) in [(0, 6), (7, 11)]
+        ]
+
 def test_multi_grep_patterns_delims():
     map_word_expected = {
         "!222aaa111zzb" : {
@@ -70,3 +96,54 @@ def test_multi_grep_patterns_delims():
         )
         indices = functor.indices()
         assert indices == expected
+
+def test_multi_grep_matcher():
+    # Callback sequences (including their order) reported by the original
+    # set-based multi_grep implementation.
+    map_w_expected = {
+        W: [
+            ("int", 0, 1), ("float", 0, 1), ("int", 2, 3), ("float", 0, 3),
+            ("float", 2, 3), ("int", 4, 5), ("float", 2, 5), ("float", 4, 5),
+            ("int", 6, 7), ("float", 4, 7), ("float", 6, 7), ("ipv4", 0, 7),
+            ("int", 8, 9), ("float", 8, 9), ("int", 10, 11), ("float", 8, 11),
+            ("float", 10, 11), ("int", 12, 13), ("float", 10, 13), ("float", 12, 13),
+            ("int", 14, 15), ("float", 12, 15), ("float", 14, 15), ("ipv4", 8, 15),
+        ],
+        "": [],
+        "x": [],
+        "é 12 €3.4 1.2.3.4": [
+            ("int", 2, 3), ("float", 2, 3), ("int", 2, 4), ("int", 3, 4),
+            ("float", 2, 4), ("float", 3, 4), ("int", 6, 7), ("float", 6, 7),
+            ("int", 8, 9), ("float", 6, 9), ("float", 8, 9), ("int", 10, 11),
+            ("float", 10, 11), ("int", 12, 13), ("float", 10, 13), ("float", 12, 13),
+            ("int", 14, 15), ("float", 12, 15), ("float", 14, 15), ("int", 16, 17),
+            ("float", 14, 17), ("float", 16, 17), ("ipv4", 10, 17),
+        ],
+    }
+    matcher = MultiGrepMatcher(MAP_NAME_DFA)
+    for (w, expected) in map_w_expected.items():
+        for map_name_dfa in [MAP_NAME_DFA, matcher]:
+            obtained = list()
+            multi_grep(w, map_name_dfa, lambda name, j, k, w: obtained.append((name, j, k)))
+            assert obtained == expected, f"{w!r}"
+        obtained = list()
+        matcher(w, lambda name, j, k, w: obtained.append((name, j, k)))
+        assert obtained == expected, f"{w!r}"
+    obtained = MultiGrepFunctorLargest()
+    matcher("é 12 €3.4 1.2.3.4", obtained)
+    assert multi_grep_fonctor_to_dict("é 12 €3.4 1.2.3.4", obtained) == {
+        "int"  : ["12", "3", "4", "1", "2", "3", "4"],
+        "float": ["12", "3.4", "1.2", "2.3", "3.4"],
+        "ipv4" : ["1.2.3.4"],
+    }
+
+def test_multi_grep_batch():
+    names = ["word", "ipv4", "int", "float", "spaces"]
+    map_name_dfa = make_map_name_dfa(MAP_NAME_RE, names)
+    lines = [W, "", "toto: 3333", "  111  zzz 22yy  ", "é 12 €3.4 1.2.3.4", "a" * 50]
+    obtained = multi_grep_batch(lines, map_name_dfa)
+    assert len(obtained) == len(lines)
+    for (w, indices) in zip(lines, obtained):
+        functor = MultiGrepFunctorLargest()
+        multi_grep(w, map_name_dfa, functor)
+        assert indices == functor.indices()
@@ -42,6 +42,16 @@ def test_pattern_automaton_equals():
     assert g1 != g2
     assert g1 == g3
 
+def test_pattern_automaton_signature():
+    g1 = PatternAutomaton("11.22.33.44 55.66 789", MAP_NAME_DFA)
+    g2 = PatternAutomaton("55.66.77.88 9876 55.44", MAP_NAME_DFA)
+    g3 = PatternAutomaton("1.2.3.4 77.88 90", MAP_NAME_DFA)
+    assert pattern_automaton_signature(g1) != pattern_automaton_signature(g2)
+    assert pattern_automaton_signature(g1) == pattern_automaton_signature(g3)
+    assert hash(pattern_automaton_signature(g1)) == hash(pattern_automaton_signature(g3))
+    g = PatternAutomaton("", MAP_NAME_DFA)
+    assert pattern_automaton_signature(g) == (1, 0, ((True, ()),))
+
 def test_pattern_automaton_get_slice():
     NAMES = ["float", "int", "ipv4", "spaces", "uint"]
     MAP_NAME_DFA = make_map_name_dfa(MAP_NAME_RE, NAMES)
@@ -88,3 +98,10 @@ def test_pattern_automaton_get_slice():
         "1.2", "2.3", "3.4", "56.78",  # float
     }
     assert obtained == expected, f"get_infix: {pformat(locals())}"
+
+def test_pattern_automaton_indices():
+    lines = ["11.22.33.44 55.66 789", "", "abc 12"]
+    for (w, indices) in zip(lines, multi_grep_batch(lines, MAP_NAME_DFA)):
+        g1 = PatternAutomaton(w, MAP_NAME_DFA)
+        g2 = PatternAutomaton(w, None, indices=indices)
+        assert g1 == g2